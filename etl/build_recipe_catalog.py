@@ -1,92 +1,201 @@
+import argparse
 import json
 import os
+import re
+import sys
+import hashlib
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Shared catalog compiler lives in src/modules
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from modules.catalog import compile_catalog, save_compiled
+
+UNRESOLVED_PATTERN = re.compile(r"^Item_(.+)$")
+
+def file_sha256(path):
+    """Hashes the source in 1MB chunks (never holds the whole file)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _recipe(r):
+    """Compact recipe row: (name, [(item_id, qtt)]); names are resolved once the items are known."""
+    return r.get('name', 'Unknown Recipe'), [(ing.get('item_id'), ing.get('qtt', 1)) for ing in r.get('ingredients', [])]
+
+def read_source(source_path):
+    """
+    Items ({id: name}) and recipes ([(name, [(item_id, qtt)])]) in ONE pass over the source.
+    'items' may be a dict keyed by id or a list of objects; 'recipes' must be a list.
+    With ijson only one item/recipe object is materialized at a time.
+    """
+    if ijson is None:
+        with open(source_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        items = data.get('items', {})
+        recipes = data.get('recipes', [])
+        if not isinstance(recipes, list):
+            raise ValueError(f"'recipes' must be a list, got {type(recipes).__name__}")
+        pairs = items.items() if isinstance(items, dict) else ((item.get('id'), item) for item in items)
+        items_map = {str(iid): item.get('name', f"Unknown_{iid}") for iid, item in pairs if iid}
+        return items_map, [_recipe(r) for r in recipes]
+
+    items_map, recipes = {}, []
+    items_is_map, key = False, None
+    builder, kind, depth = None, None, 0
+    with open(source_path, 'rb') as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if event in ('start_map', 'start_array'):
+                    depth += 1
+                elif event in ('end_map', 'end_array'):
+                    depth -= 1
+                    if depth == 0:
+                        obj, builder = builder.value, None
+                        if kind == 'recipe':
+                            recipes.append(_recipe(obj))
+                        else:
+                            iid = key if kind == 'item' else obj.get('id')
+                            if iid:
+                                items_map[str(iid)] = obj.get('name', f"Unknown_{iid}")
+                continue
+
+            if prefix == 'recipes' and event not in ('start_array', 'end_array'):
+                raise ValueError(f"'recipes' must be a list (got '{event}')")
+            if prefix == 'items':
+                if event == 'start_map':
+                    items_is_map = True
+                elif event == 'map_key':
+                    key = value
+                continue
+            if event != 'start_map':
+                continue
+            if prefix == 'recipes.item':
+                kind = 'recipe'
+            elif items_is_map and prefix == f"items.{key}":
+                kind = 'item'
+            elif not items_is_map and prefix == 'items.item':
+                kind = 'listed_item'
+            else:
+                continue
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            depth = 1
+    return items_map, recipes
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def find_unresolved(catalog):
+    """Returns {item_id: [recipes using it]} for ingredients that fell back to Item_<id>."""
+    unresolved = {}
+    for product, ingredients in catalog.items():
+        for ing in ingredients:
+            match = UNRESOLVED_PATTERN.match(ing['insumo'])
+            if match:
+                unresolved.setdefault(match.group(1), []).append(product)
+    return unresolved
 
 def main():
+    parser = argparse.ArgumentParser(description="Builds catalogo_manufatura.json from pax_tools_data.json")
+    parser.add_argument("--force", "-f", action="store_true", help="Rebuild even if the source is unchanged")
+    args = parser.parse_args()
+
     # Relative Paths
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     temp_dir = os.path.join(base_dir, "temp")
     data_dir = os.path.join(base_dir, "data")
-    
+
     source_path = os.path.join(temp_dir, "pax_tools_data.json")
     output_path = os.path.join(data_dir, "catalogo_manufatura.json")
-    
+    compiled_path = os.path.join(data_dir, "catalogo_manufatura.npz")
+    manifest_path = os.path.join(data_dir, "catalogo_manufatura.manifest.json")
+
     if not os.path.exists(source_path):
         print(f"Source file missing: {source_path}")
         return
 
-    # Check timestamps to avoid unnecessary processing
-    if os.path.exists(output_path):
-        src_mtime = os.path.getmtime(source_path)
-        dst_mtime = os.path.getmtime(output_path)
-        
-        # If source is older than destination, we are up to date
-        if src_mtime < dst_mtime:
-            print(f"Catalog is up to date (Source: {os.path.basename(source_path)}). Skipping build.")
-            print("Run with --force to overwrite if needed (not implemented yet, just delete the json).")
-            return
-
-        
-    print("Loading raw data...")
-    with open(source_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        
-    items_map = data.get('items', {})
-    recipes_raw = data.get('recipes', {})
-    
-    print(f"Loaded {len(items_map)} items and {len(recipes_raw)} recipes.")
-    
-    # 1. Convert Items List to Dict
-    if isinstance(items_map, list):
-        print("Converting Items list to lookup dict...")
-        new_map = {}
-        for item in items_map:
-            iid = item.get('id')
-            if iid:
-                new_map[str(iid)] = item
-        items_map = new_map
-        
+    # mtime/size is the fast path; a changed stat falls back to the content hash
+    # (copies/downloads reset mtimes without changing the content)
+    stat = os.stat(source_path)
+    manifest = load_manifest(manifest_path)
+    outputs_exist = os.path.exists(output_path) and os.path.exists(compiled_path)
+    same_stat = manifest.get('source_size') == stat.st_size and manifest.get('source_mtime_ns') == stat.st_mtime_ns
+    source_hash = manifest.get('source_sha256') if same_stat else file_sha256(source_path)
+    up_to_date = outputs_exist and manifest.get('source_sha256') == source_hash
+
+    if up_to_date and not args.force:
+        if not same_stat:
+            manifest.update(source_size=stat.st_size, source_mtime_ns=stat.st_mtime_ns)
+            with open(manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+        print(f"Catalog is up to date (Source hash: {source_hash[:12]}). Skipping build.")
+        print("Run with --force to rebuild anyway.")
+        return
+
+    if ijson is None:
+        print("ijson not installed. Falling back to full json.load (pip install ijson for streaming).")
+        print("Loading raw data...")
+    else:
+        print("Streaming raw data...")
+    items_map, recipes = read_source(source_path)
+
     def resolve_name(iid):
         key = str(iid)
         if key in items_map:
-            return items_map[key].get('name', f"Unknown_{iid}")
+            return items_map[key]
         return f"Item_{iid}"
 
+    # The source changed as a whole: every recipe is rebuilt (cheap next to parsing the file)
     catalog = {}
-    count = 0
-    
-    # 2. Iterate Recipes
-    if isinstance(recipes_raw, list):
-        for r in recipes_raw:
-            target_name = r.get('name', 'Unknown Recipe')
-            
-            # Inputs
-            ing_list = r.get('ingredients', [])
-            ingredients = []
-            
-            for ing in ing_list:
-                iid = ing.get('item_id')
-                qty = ing.get('qtt', 1)
-                friendly_name = resolve_name(iid)
-                
-                ingredients.append({
-                    "insumo": friendly_name,
-                    "qtd": qty
-                })
-                
-            if ingredients:
-                catalog[target_name] = ingredients
-                count += 1
-    else:
-        print("Recipes is not a list?")
-        
-    # 3. Save
+    for target_name, ingredients in recipes:
+        if ingredients:
+            catalog[target_name] = [{"insumo": resolve_name(iid), "qtd": qtt} for iid, qtt in ingredients]
+
+    print(f"Loaded {len(items_map)} items and {len(recipes)} recipes.")
+
+    # Validation: ingredients whose id is missing from the items table
+    unresolved = find_unresolved(catalog)
+    if unresolved:
+        print(f"WARNING: {len(unresolved)} unresolved item ids referenced by recipes:")
+        for iid, products in sorted(unresolved.items(), key=lambda x: len(x[1]), reverse=True)[:20]:
+            print(f"  Item_{iid}: used by {len(products)} recipes (e.g. {products[0]})")
+
+    # Save
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(catalog, f, indent=4, ensure_ascii=False)
-        
-    print(f"Success! Converted {count} recipes to {output_path}")
+    payload = json.dumps(catalog, indent=4, ensure_ascii=False).encode('utf-8')
+    with open(output_path, 'wb') as f:
+        f.write(payload)
+
+    print(f"Success! Wrote {len(catalog)} recipes to {output_path}")
+
+    # Compiled catalog: integer item IDs + CSR ingredient arrays (loaded by CraftingAnalyzer)
+    compiled = compile_catalog(catalog, hashlib.sha256(payload).hexdigest())
+    save_compiled(compiled_path, compiled)
+    print(f"Compiled {compiled.n_recipes} recipes / {compiled.n_items} items to {compiled_path}")
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'source_sha256': source_hash,
+            'source_size': stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'unresolved_items': sorted(unresolved)
+        }, f, indent=2)
 
 if __name__ == "__main__":
     main()
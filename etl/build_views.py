@@ -0,0 +1,33 @@
+import argparse
+import os
+import sys
+
+# Views are built by the shared analyzers in src/modules
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from modules.views import ViewStore
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the materialized views (liquidity, crafting, arbitrage) for the newest snapshot")
+    parser.add_argument("--force", "-f", action="store_true", help="Rebuild even if the views for this version already exist")
+    args = parser.parse_args()
+
+    # Relative Paths
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data_dir = os.path.join(base_dir, "data")
+
+    store = ViewStore(data_dir)
+    version = store.current_version()
+    if version is None:
+        print("No snapshots in data/history. Run fetch_market_prices.py first.")
+        return
+
+    if store.is_built(version) and not args.force:
+        print(f"Views for {version} are up to date. Run with --force to rebuild.")
+        return
+
+    version = store.build(force=args.force)
+    print(f"Views written to {os.path.join(store.views_dir, version)}")
+
+if __name__ == "__main__":
+    main()
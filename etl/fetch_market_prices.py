@@ -14,10 +14,19 @@ try:
 except ImportError:
     load_dotenv = None
 
-def main():
+def main(progress=None):
+    """
+    Fetches every Selene zone and commits a snapshot to data/history.
+    progress: optional callback(stage, done, total) used by the API job runner.
+    Returns the snapshot path (None if nothing was saved).
+    """
     if load_dotenv:
         load_dotenv()
 
+    def report(stage, done=0, total=0):
+        if progress:
+            progress(stage, done, total)
+
     # Relative Paths
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     data_dir = os.path.join(base_dir, "data")
@@ -31,6 +40,7 @@ def main():
     
     # 1. Fetch Item Mapping
     print("Fetching Item Database...")
+    report("items")
     id_to_name = {}
     try:
         resp = requests.get(items_url, headers=headers)
@@ -53,6 +63,7 @@ def main():
     # Integrated Index Fetching (No local file needed)
     index_url = "https://data-cdn.gaming.tools/paxdei/market/index.json"
     print(f"Fetching Market Index from {index_url}...")
+    report("index")
     
     selene_urls = []
     try:
@@ -87,6 +98,7 @@ def main():
     
     for i, url in enumerate(selene_urls):
         print(f"[{i+1}/{len(selene_urls)}] Fetching {url}...")
+        report("zones", i, len(selene_urls))
         try:
             r = requests.get(url, headers=headers)
             if r.status_code == 200:
@@ -166,6 +178,7 @@ def main():
         latest_file = os.path.join(data_dir, "selene_latest.parquet")
         
         print(f"Saving snapshot to: {history_file}")
+        report("save")
         df_out.to_parquet(history_file, compression='snappy')
         
         print(f"Updating latest pointer: {latest_file}")
@@ -177,6 +190,7 @@ def main():
         hf_token = os.environ.get("HF_TOKEN")
         if hf_token and HfApi:
             print("Uploading to Hugging Face...")
+            report("upload")
             try:
                 api = HfApi(token=hf_token)
                 # Upload the specific snapshot
@@ -206,6 +220,7 @@ def main():
             print("huggingface_hub not installed. Skipping upload.")
         else:
             print("HF_TOKEN not set. Skipping upload.")
+        return history_file
     else:
         print("No prices collected.")
         exit(1) # Fail if empty!
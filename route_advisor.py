@@ -1,68 +1,61 @@
-
 import pandas as pd
 import os
+import sys
 import glob
+import argparse
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from modules.logistics import PaxLogistics, TripPlanner, TRAVEL_COST_PER_WEIGHT
+
 # Configuration
-ZONES_OF_INTEREST = ['ulaid', 'yarborne', 'ardbog', 'down', 'nene'] # Adjusted spelling approximations
-DATA_DIR = r"d:\PaxDei_Tool\data"
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
 LATEST_FILE = os.path.join(DATA_DIR, "selene_latest.parquet")
 HISTORY_DIR = os.path.join(DATA_DIR, "history")
 CLIENT_ORDERS_FILE = os.path.join(DATA_DIR, "client_orders.csv")
 
-def normalize_zone(zone_str):
-    if not isinstance(zone_str, str): return ""
-    return zone_str.lower()
-
-def is_zone_match(zone_full, interests):
-    norm = normalize_zone(zone_full)
-    return any(z in norm for z in interests)
-
-def get_client_items():
+def load_client_orders():
     if not os.path.exists(CLIENT_ORDERS_FILE):
         print("Client orders file not found.")
+        return pd.DataFrame()
+    return pd.read_csv(CLIENT_ORDERS_FILE)
+
+def get_client_items(df_orders):
+    if df_orders.empty:
         return []
-    df = pd.read_csv(CLIENT_ORDERS_FILE)
-    return df['Item'].dropna().unique().tolist()
+    return df_orders['Item'].dropna().unique().tolist()
 
-def analyze_current_market(client_items):
-    print("\n--- ANALYZING CURRENT LISTINGS IN ROUTE ZONES ---")
+def plan_buying_trip(df_orders, start_zone=None, default_qty=10, cost_per_weight=TRAVEL_COST_PER_WEIGHT, prefer_safe=True):
+    print("\n--- BUYING TRIP PLAN (CLIENT ORDERS) ---")
     if not os.path.exists(LATEST_FILE):
         print("Latest market data not found.")
         return
 
     df = pd.read_parquet(LATEST_FILE)
-    
-    # Filter for client items
-    mask_items = df['Item'].isin(client_items)
-    df_items = df[mask_items].copy()
-    
-    if df_items.empty:
-        print("No matches for client items in current market.")
+    logistics = PaxLogistics(cache_dir=os.path.join(DATA_DIR, "cache"))
+    planner = TripPlanner(logistics, df, cost_per_weight=cost_per_weight)
+
+    demand = planner.parse_orders(df_orders, default_qty=default_qty)
+    max_price = planner.parse_price_caps(df_orders)
+    if max_price:
+        print(f"Client price caps: {', '.join(f'{item} <= {cap:.2f}g' for item, cap in sorted(max_price.items()))}")
+    buys, summary = planner.plan(demand, start_zone=start_zone, prefer_safe=prefer_safe, max_price=max_price)
+
+    if buys.empty:
+        print("No discounted listings worth the trip for the client items.")
         return
 
-    # Calculate Median Price per Item (Server-wide)
-    medians = df_items.groupby('Item')['Price'].median().reset_index().rename(columns={'Price': 'Median_Price'})
-    
-    # Merge median back
-    df_items = df_items.merge(medians, on='Item')
-    
-    # Filter for Target Zones
-    # "Ulaid, Yarborn, Ardbog, Down, Nene"
-    # Matches: merrie-ulaid, merrie-ardbog, etc.
-    df_items['In_Route'] = df_items['Zone'].apply(lambda x: is_zone_match(x, ZONES_OF_INTEREST))
-    df_route = df_items[df_items['In_Route']].copy()
-    
-    # Filter for Discount (Price < Median)
-    df_opportunities = df_route[df_route['Price'] < df_route['Median_Price']].copy()
-    
-    if df_opportunities.empty:
-        print("No discounted items found in the target route zones.")
-    else:
-        df_opportunities['Discount_%'] = ((df_opportunities['Median_Price'] - df_opportunities['Price']) / df_opportunities['Median_Price']) * 100
-        cols = ['Item', 'Price', 'Median_Price', 'Discount_%', 'Amount', 'Zone', 'SellerHash']
-        print(df_opportunities.sort_values('Discount_%', ascending=False).head(20)[cols].to_string(index=False, float_format="%.2f"))
+    print(f"Route ({summary['route']}): {' -> '.join(summary['stops'])}")
+    print(f"Travel weight: safe={summary['safe_weight']:.0f} | pvp={summary['pvp_weight']:.0f}")
+    print(f"Purchase cost: {summary['purchase_cost']:.1f}g | Travel cost: {summary['travel_cost']:.1f}g\n")
+    print(buys[['Stop', 'Zone', 'Item', 'Qty', 'Unit_Price', 'Cost']].to_string(index=False, float_format="%.2f"))
+
+    missing = {item: (got, want) for item, (got, want) in summary['fill'].items() if got < want}
+    if missing:
+        print("\nPartially filled / not found below market:")
+        for item, (got, want) in sorted(missing.items()):
+            print(f"  {item}: {got}/{want}")
 
 def analyze_historical_producers(client_items):
     print("\n--- ANALYZING HISTORICAL PRODUCERS FOR CLIENT ITEMS ---")
@@ -125,8 +118,19 @@ def analyze_historical_producers(client_items):
             print(f"{row['Item']:<25} | {row['SellerHash']:<16} | {row['Total_Historical_Volume']:<8.0f} | {row['Frequency']:<5} | {zones}")
 
 if __name__ == "__main__":
-    client_items = get_client_items()
+    parser = argparse.ArgumentParser(description="Plans a multi-stop buying trip for client orders")
+    parser.add_argument("--start", type=str, help="Starting market zone (e.g. kerys-aven)")
+    parser.add_argument("--default-qty", type=int, default=10, help="Units for orders without a numeric Quantity")
+    parser.add_argument("--cost-per-weight", type=float, default=TRAVEL_COST_PER_WEIGHT,
+                        help=f"Gold per unit of route weight per unit carried (default: {TRAVEL_COST_PER_WEIGHT})")
+    parser.add_argument("--pvp", action="store_true", help="Allow PvP gates (default: safe routes)")
+    parser.add_argument("--producers", action="store_true", help="Also list historical producers for client items")
+    args = parser.parse_args()
+
+    df_orders = load_client_orders()
+    client_items = get_client_items(df_orders)
     print(f"Loaded {len(client_items)} items from client orders.")
     
-    analyze_current_market(client_items)
-    analyze_historical_producers(client_items)
+    plan_buying_trip(df_orders, args.start, args.default_qty, args.cost_per_weight, prefer_safe=not args.pvp)
+    if args.producers:
+        analyze_historical_producers(client_items)
@@ -9,7 +9,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from modules.market import MarketAnalyzer
 from modules.crafting import CraftingAnalyzer
-from modules.logistics import PaxLogistics, ArbitrageFinder
+from modules.logistics import PaxLogistics, ArbitrageFinder, TRAVEL_COST_PER_WEIGHT
+from modules.watch import SnapshotWatcher
 
 def get_data_dir():
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -54,12 +55,46 @@ def handle_market(args):
         else:
             print(f"No history found for {args.history}")
 
+def load_demand_caps(data_dir):
+    """Expected units sold per item (churn), live or from the last liquidity report."""
+    df = MarketAnalyzer(data_dir).check_liquidity()
+    if df is None or df.empty:
+        csv_path = os.path.join(data_dir, "liquidez_diaria.csv")
+        if not os.path.exists(csv_path):
+            return {}
+        df = pd.read_csv(csv_path)
+    return dict(zip(df['Item'], df['Units_Sold']))
+
 def handle_crafting(args):
     data_dir = get_data_dir()
     analyzer = CraftingAnalyzer(data_dir)
     
+    if args.budget:
+        print(f"Optimizing Crafting Portfolio (Budget: {args.budget:.0f}g)...")
+        demand_caps = load_demand_caps(data_dir)
+        df = analyzer.optimize_portfolio(args.budget, demand_caps, default_cap=args.default_cap)
+        if df is not None and not df.empty:
+            print("\n--- CRAFTING PORTFOLIO ---")
+            cols = ['Produto', 'Quantidade', 'Custo_Total', 'Lucro_Esperado', 'Margem_Perc']
+            print(df[cols].to_string(index=False))
+            print(f"\nCapital Used: {df['Custo_Total'].sum():.1f}g | Expected Profit: {df['Lucro_Esperado'].sum():.1f}g")
+        else:
+            print("No profitable allocation found within budget.")
+        return
+
+    if args.risk:
+        print(f"Running Monte Carlo Risk ({args.scenarios} scenarios)...")
+        df = analyzer.analyze_risk(n_scenarios=args.scenarios)
+        if df is not None and not df.empty:
+            print("\n--- RISK-ADJUSTED RECIPES ---")
+            cols = ['Produto', 'Margem_Esperada', 'Margem_P5', 'Margem_P95', 'Prob_Prejuizo']
+            print(df.head(args.top)[cols].to_string(index=False))
+        else:
+            print("No recipes could be simulated.")
+        return
+
     print("Analyzing Crafting Profitability...")
-    df = analyzer.analyze_profitability()
+    df = analyzer.analyze_profitability(travel_rate=args.travel_rate)
     
     if df is not None and not df.empty:
         print("\n--- TOP PROFITABLE RECIPES ---")
@@ -79,7 +114,7 @@ def handle_logistics(args):
         # Expected format: start,end (comma separated) or just two args? 
         # Argparse 'nargs' can capture multiple. let's use nargs=2
         start, end = args.route
-        logistics = PaxLogistics()
+        logistics = PaxLogistics(cache_dir=os.path.join(data_dir, "cache"))
         print(f"Calculating route: {start} -> {end}")
         res = logistics.compare_routes(start, end)
         if res:
@@ -94,16 +129,54 @@ def handle_logistics(args):
     if args.arbitrage:
         finder = ArbitrageFinder(data_dir)
         print("Scanning for Arbitrage Opportunities...")
-        df = finder.find_opportunities()
+        df = finder.find_opportunities(travel_rate=args.travel_rate)
         if not df.empty:
             print("\n--- TOP ARBITRAGE DEALS ---")
             # De-duplicate items
             df_dedup = df.drop_duplicates(subset=['Item']).head(10)
-            cols = ['Item', 'Buy_Price', 'Avg_Sale_Price', 'Profit', 'Margin', 'Top_Zone']
+            cols = ['Item', 'Buy_Price', 'Buy_Zone', 'Avg_Sale_Price', 'Travel_Cost', 'Unit_Profit', 'Margin', 'Top_Zone']
             print(df_dedup[cols].to_string(index=False, float_format="%.1f"))
         else:
             print("No arbitrage opportunities found.")
 
+    if args.allocate:
+        finder = ArbitrageFinder(data_dir)
+        print(f"Allocating Arbitrage Budget ({args.allocate:.0f}g)...")
+        df = finder.allocate_budget(budget=args.allocate, travel_rate=args.travel_rate)
+        if not df.empty:
+            print("\n--- BUY LIST (best profit per gold first) ---")
+            cols = ['Item', 'Buy_Zone', 'Buy_Price', 'Units', 'Cost', 'Sell_Zone', 'Unit_Profit', 'Profit']
+            print(df.head(30)[cols].to_string(index=False, float_format="%.1f"))
+            print(f"\n{len(df)} listings | Total Cost: {df['Cost'].sum():.0f}g | Expected Profit: {df['Profit'].sum():.0f}g")
+        else:
+            print("No arbitrage opportunities found.")
+
+    if args.spreads:
+        finder = ArbitrageFinder(data_dir)
+        print("Building Cross-Zone Spread Matrix...")
+        df = finder.find_zone_spreads(top_k=args.top_k, travel_rate=args.travel_rate)
+        if not df.empty:
+            print("\n--- TOP CROSS-ZONE SPREADS (Buy A -> Sell B) ---")
+            cols = ['Item', 'Buy_Zone', 'Sell_Zone', 'Buy_Price', 'Sell_Price', 'Travel_Cost', 'Unit_Profit', 'Qty', 'Score']
+            print(df[cols].to_string(index=False, float_format="%.1f"))
+        else:
+            print("No profitable zone pairs found.")
+
+def handle_watch(args):
+    data_dir = get_data_dir()
+    zones = [z.strip() for z in args.zones.split(",")] if args.zones else None
+    watcher = SnapshotWatcher(
+        data_dir,
+        interval=args.interval,
+        min_margin=args.min_margin,
+        discount=args.discount,
+        zones=zones,
+        webhook=args.webhook,
+        travel_rate=args.travel_rate
+    )
+    print(f"Watching {watcher.history_dir} (every {args.interval}s)...", file=sys.stderr)
+    watcher.run(once=args.once)
+
 def main():
     parser = argparse.ArgumentParser(description="Pax Dei Advisor - Unified Intelligence Tool")
     subparsers = parser.add_subparsers(dest="command", help="Available subcommands")
@@ -117,11 +190,33 @@ def main():
     # Crafting
     crafting_parser = subparsers.add_parser("crafting", help="Crafting Analysis")
     crafting_parser.add_argument("--top", "-n", type=int, default=5, help="Number of top recipes to show")
+    crafting_parser.add_argument("--budget", "-b", type=float, help="Optimize recipes/quantities for a fixed capital (e.g. 3000)")
+    crafting_parser.add_argument("--risk", "-r", action="store_true", help="Monte Carlo risk mode (expected margin, P5/P95, prob. of loss)")
+    crafting_parser.add_argument("--scenarios", type=int, default=2000, help="Number of Monte Carlo scenarios (with --risk)")
+    crafting_parser.add_argument("--travel-rate", type=float, default=TRAVEL_COST_PER_WEIGHT,
+                                 help=f"Freight in gold per item unit per route weight (default: {TRAVEL_COST_PER_WEIGHT}; a move weighs 40 / 60 / 120 within a province / to a neighbour / two provinces away)")
+    crafting_parser.add_argument("--default-cap", type=int, default=0, help="Units allowed for products without observed sales (with --budget)")
     
     # Logistics
     logistics_parser = subparsers.add_parser("logistics", help="Logistics & Arbitrage")
     logistics_parser.add_argument("--route", nargs=2, metavar=('START', 'END'), help="Calculate route between two locations")
     logistics_parser.add_argument("--arbitrage", "-a", action="store_true", help="Find buy/sell arbitrage opportunities")
+    logistics_parser.add_argument("--allocate", type=float, metavar='BUDGET', help="Spread a total budget over arbitrage listings (capped by daily demand)")
+    logistics_parser.add_argument("--spreads", action="store_true", help="Cross-zone spread matrix (buy in zone A, sell in zone B)")
+    logistics_parser.add_argument("--travel-rate", type=float, default=TRAVEL_COST_PER_WEIGHT,
+                                  help=f"Freight in gold per item unit per route weight (default: {TRAVEL_COST_PER_WEIGHT}; a move weighs 40 / 60 / 120 within a province / to a neighbour / two provinces away)")
+    logistics_parser.add_argument("--top-k", type=int, default=20, help="Number of zone pairs to return (with --spreads)")
+    
+    # Watch
+    watch_parser = subparsers.add_parser("watch", help="Stream new/vanished opportunities as snapshots arrive (NDJSON)")
+    watch_parser.add_argument("--interval", type=int, default=60, help="Polling interval in seconds")
+    watch_parser.add_argument("--once", action="store_true", help="Process the current snapshot and exit")
+    watch_parser.add_argument("--webhook", type=str, help="POST each batch of events to this URL (e.g. http://localhost:9000/hook)")
+    watch_parser.add_argument("--min-margin", type=float, default=15.0, help="Minimum arbitrage margin (%%)")
+    watch_parser.add_argument("--discount", type=float, default=30.0, help="Bargain threshold: %% below the server median")
+    watch_parser.add_argument("--travel-rate", type=float, default=TRAVEL_COST_PER_WEIGHT,
+                              help="Freight in gold per item unit per route weight (see logistics --travel-rate)")
+    watch_parser.add_argument("--zones", type=str, help="Only report bargains in these zones (comma separated)")
     
     args = parser.parse_args()
     
@@ -131,6 +226,8 @@ def main():
         handle_crafting(args)
     elif args.command == "logistics":
         handle_logistics(args)
+    elif args.command == "watch":
+        handle_watch(args)
     else:
         parser.print_help()
 
@@ -0,0 +1,325 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from modules.market import MarketAnalyzer
+from modules.zones import ZONE_TABLE
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_FILE = os.path.join(BASE_DIR, "src", "server.py")
+DEFAULT_OUT = os.path.join(BASE_DIR, "data", "loadtest")
+
+# (name, weight, path) - roughly what the dashboard does on a page load + item drill-down
+SCENARIOS = [
+    ("liquidity", 3, "/api/market/liquidity?limit=50"),
+    ("crafting", 3, "/api/crafting/opportunities?top=50"),
+    ("arbitrage", 3, "/api/logistics/arbitrage?limit=50"),
+    ("spreads", 1, "/api/logistics/spreads"),
+    ("allocate", 1, "/api/logistics/allocate?budget=5000"),
+    ("search", 2, "/api/market/search?query={query}"),
+    ("history", 2, "/api/market/history?item={item}&limit=200"),
+    ("item_history", 2, "/api/market/item/{item}/history"),
+    ("producers", 1, "/api/market/item/{item}/producers"),
+]
+
+# --- synthetic dataset ---
+
+def zone_names(n):
+    # Real market zones first, so the logistics graph resolves them
+    zones = ZONE_TABLE.index.tolist()
+    zones += [f"synthetic-zone{i:03d}" for i in range(max(0, n - len(zones)))]
+    return zones[:n]
+
+def _listings(rng, n, items, base_prices, zones, zone_factor, stamp, next_id):
+    item_idx = rng.integers(0, len(items), n)
+    zone_idx = rng.integers(0, len(zones), n)
+    amount = rng.choice([1, 1, 1, 5, 10, 20, 50, 100], n)
+    unit = base_prices[item_idx] * zone_factor[zone_idx] * rng.lognormal(0, 0.25, n)
+    unit = np.maximum(np.round(unit, 2), 0.01)
+    return pd.DataFrame({
+        'Item': np.asarray(items, dtype=object)[item_idx],
+        'Price': np.maximum(np.round(unit * amount), 1).astype('int64'),
+        'Amount': amount.astype('int64'),
+        'UnitPrice': unit,
+        'Zone': np.asarray(zones, dtype=object)[zone_idx],
+        'Server': 'Selene',
+        'Timestamp': stamp,
+        'ListingID': [f"lt-{i:010x}" for i in range(next_id, next_id + n)],
+        'Seller': None,
+        'Durability': np.where(rng.random(n) < 0.3, 1.0, np.nan),
+    })
+
+def generate_dataset(out_dir, zones=40, items=1000, snapshots=3, listings=100000,
+                     churn=0.15, interval_hours=6, seed=42):
+    """
+    Writes a data dir the server can run against: history partitions, selene_latest.parquet,
+    a recipe catalog, liquidez_diaria.csv and empty suppliers/orders files.
+    Each snapshot sells (removes) `churn` of the listings and adds as many new ones.
+    """
+    rng = np.random.default_rng(seed)
+    zones = zone_names(zones)
+    names = [f"Synthetic Item {i:05d}" for i in range(items)]
+    base_prices = rng.lognormal(2.5, 1.2, items)
+    zone_factor = rng.uniform(0.8, 1.25, len(zones))
+
+    # ~1/4 of the items are crafted from 1-3 of the others
+    catalog = {}
+    for i in range(items // 4):
+        inputs = rng.choice(np.arange(items // 4, items), size=int(rng.integers(1, 4)), replace=False)
+        catalog[names[i]] = [{"insumo": names[j], "qtd": int(rng.integers(1, 11))} for j in inputs]
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "catalogo_manufatura.json"), 'w', encoding='utf-8') as f:
+        json.dump(catalog, f)
+    with open(os.path.join(out_dir, "suppliers.csv"), 'w', encoding='utf-8') as f:
+        f.write("Supplier,Item,Unit_Price,Stack_Price,Box_Price,Location,Notes\n")
+    with open(os.path.join(out_dir, "client_orders.csv"), 'w', encoding='utf-8') as f:
+        f.write("Client,Item,Quantity,Target_Price,Order_Type,Notes\n")
+
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(hours=interval_hours * (snapshots - 1))
+    next_id = 0
+    df = None
+    for s in range(snapshots):
+        stamp = start + timedelta(hours=interval_hours * s)
+        if df is None:
+            df = _listings(rng, listings, names, base_prices, zones, zone_factor, stamp, next_id)
+            next_id += listings
+        else:
+            keep = rng.random(len(df)) >= churn
+            fresh = _listings(rng, int((~keep).sum()), names, base_prices, zones, zone_factor, stamp, next_id)
+            next_id += len(fresh)
+            df = pd.concat([df[keep], fresh], ignore_index=True)
+
+        history_dir = os.path.join(out_dir, "history", f"year={stamp:%Y}", f"month={stamp:%m}")
+        os.makedirs(history_dir, exist_ok=True)
+        df.to_parquet(os.path.join(history_dir, f"market_{stamp:%Y-%m-%d_%H-%M}.parquet"), compression='snappy')
+    df.to_parquet(os.path.join(out_dir, "selene_latest.parquet"), compression='snappy')
+
+    liquidity = MarketAnalyzer(out_dir).check_liquidity()
+    if liquidity is not None:
+        liquidity.to_csv(os.path.join(out_dir, "liquidez_diaria.csv"), index=False)
+
+    manifest = {'zones': len(zones), 'items': items, 'snapshots': snapshots, 'listings': listings,
+                'churn': churn, 'seed': seed}
+    with open(os.path.join(out_dir, "loadtest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+# --- server ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(data_dir, port, workers, log_path, timeout=180):
+    """Runs server.py against data_dir and waits until it answers."""
+    env = dict(os.environ, PAXDEI_DATA_DIR=os.path.abspath(data_dir))
+    log = open(log_path, 'w', encoding='utf-8')
+    proc = subprocess.Popen([sys.executable, SERVER_FILE, "--port", str(port), "--workers", str(workers)],
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}, see {log_path}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/api/admin/cache")
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError(f"Server did not come up in {timeout}s, see {log_path}")
+
+# --- load ---
+
+class LoadRunner:
+    """Closed-loop clients: each thread keeps one keep-alive connection and fires weighted random scenarios."""
+    def __init__(self, host, port, item_names, concurrency=8, seed=0):
+        self.host = host
+        self.port = port
+        self.item_names = item_names
+        self.concurrency = concurrency
+        self.seed = seed
+        self.names = [s[0] for s in SCENARIOS]
+        self.weights = [s[1] for s in SCENARIOS]
+        self.paths = {s[0]: s[2] for s in SCENARIOS}
+
+    def _path(self, rng, name):
+        item = rng.choice(self.item_names)
+        return self.paths[name].format(item=quote(item), query=quote(item.split()[-1][:3]))
+
+    def _client(self, n, deadline, samples):
+        rng = random.Random(self.seed + n)
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        while time.monotonic() < deadline:
+            name = rng.choices(self.names, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                conn.request("GET", self._path(rng, name), headers={"Accept-Encoding": "gzip, br"})
+                response = conn.getresponse()
+                size = len(response.read())
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                size, status = 0, 0
+            samples.append((name, status, time.perf_counter() - start, size))
+        conn.close()
+
+    def run(self, duration):
+        """[(scenario, status, seconds, bytes)] and the wall time."""
+        samples = []
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=self._client, args=(n, deadline, samples), daemon=True)
+                   for n in range(self.concurrency)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return samples, time.perf_counter() - start
+
+def _stats(rows, wall):
+    latencies = np.array([r[2] for r in rows]) * 1000
+    errors = sum(1 for r in rows if not (200 <= r[1] < 400))
+    if len(latencies) == 0:
+        return {'requests': 0, 'errors': 0}
+    return {
+        'requests': len(rows),
+        'errors': errors,
+        'rps': round(len(rows) / wall, 2),
+        'mean_ms': round(float(latencies.mean()), 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+        'max_ms': round(float(latencies.max()), 2),
+        'avg_bytes': int(np.mean([r[3] for r in rows]))
+    }
+
+def summarize(samples, wall):
+    routes = {}
+    for name in sorted({s[0] for s in samples}):
+        routes[name] = _stats([s for s in samples if s[0] == name], wall)
+    return {'total': _stats(samples, wall), 'routes': routes}
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def compare(old, new):
+    """Prints rps / p95 deltas of a new run against a saved baseline."""
+    print(f"\n{'Route':<14}{'rps old':>11}{'rps new':>11}{'delta':>10}{'p95 old':>11}{'p95 new':>11}{'delta':>10}")
+    routes = [('total', old.get('total', {}), new['total'])] + [
+        (name, old.get('routes', {}).get(name, {}), stats) for name, stats in new['routes'].items()]
+    for name, a, b in routes:
+        def delta(key):
+            if not a.get(key) or not b.get(key):
+                return "-"
+            return f"{(b[key] / a[key] - 1) * 100:+.1f}%"
+        print(f"{name:<14}{a.get('rps', '-'):>11}{b.get('rps', '-'):>11}{delta('rps'):>10}"
+              f"{a.get('p95_ms', '-'):>11}{b.get('p95_ms', '-'):>11}{delta('p95_ms'):>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the API against a synthetic market dataset")
+    parser.add_argument("--zones", type=int, default=40)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--snapshots", type=int, default=3)
+    parser.add_argument("--listings", type=int, default=100000, help="Listings per snapshot")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", help="Dataset dir (default: data/loadtest/<size>)")
+    parser.add_argument("--regenerate", action="store_true", help="Rebuild the dataset even if it exists")
+    parser.add_argument("--url", help="Test an already running server (host:port) instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before the run")
+    parser.add_argument("--out", help="Result JSON (default: data/loadtest/result_<timestamp>.json)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    args = parser.parse_args()
+
+    size = f"{args.zones}z_{args.items}i_{args.snapshots}s_{args.listings}l_seed{args.seed}"
+    data_dir = args.data_dir or os.path.join(DEFAULT_OUT, size)
+    if args.regenerate or not os.path.exists(os.path.join(data_dir, "loadtest.json")):
+        print(f"Generating dataset in {data_dir} ...")
+        start = time.perf_counter()
+        generate_dataset(data_dir, args.zones, args.items, args.snapshots, args.listings, seed=args.seed)
+        print(f"Dataset ready in {time.perf_counter() - start:.1f}s")
+    with open(os.path.join(data_dir, "loadtest.json"), 'r', encoding='utf-8') as f:
+        dataset = json.load(f)
+    item_names = pd.read_parquet(os.path.join(data_dir, "selene_latest.parquet"), columns=['Item'])['Item'].unique().tolist()
+
+    proc = None
+    if args.url:
+        host, _, port = args.url.replace("http://", "").rstrip("/").partition(":")
+        port = int(port or 80)
+    else:
+        host, port = "127.0.0.1", free_port()
+        print(f"Starting server on port {port} with {args.workers} worker(s) ...")
+        proc = start_server(data_dir, port, args.workers, os.path.join(data_dir, "server.log"))
+
+    try:
+        runner = LoadRunner(host, port, item_names, args.concurrency, args.seed)
+        if args.warmup > 0:
+            print(f"Warm-up {args.warmup:.0f}s ...")
+            runner.run(args.warmup)
+        print(f"Measuring {args.duration:.0f}s with {args.concurrency} clients ...")
+        samples, wall = runner.run(args.duration)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    result = {
+        'meta': {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': sys.version.split()[0],
+            'dataset': dataset,
+            'workers': args.workers if proc is not None else None,
+            'concurrency': args.concurrency,
+            'duration': round(wall, 2)
+        },
+        **summarize(samples, wall)
+    }
+
+    out = args.out or os.path.join(DEFAULT_OUT, f"result_{datetime.now():%Y-%m-%d_%H-%M-%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+    total = result['total']
+    print(f"\n{total.get('requests', 0)} requests, {total.get('errors', 0)} errors, {total.get('rps', 0)} req/s, "
+          f"p50 {total.get('p50_ms', '-')} ms, p95 {total.get('p95_ms', '-')} ms, p99 {total.get('p99_ms', '-')} ms")
+    for name, stats in result['routes'].items():
+        print(f"  {name:<14}{stats['requests']:>7} req  p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  "
+              f"p99 {stats['p99_ms']:>8} ms  errors {stats['errors']}")
+    print(f"Result saved to {out}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), result)
+
+if __name__ == "__main__":
+    main()
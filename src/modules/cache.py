@@ -0,0 +1,115 @@
+import glob
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class SnapshotCache:
+    """
+    In-process LRU cache for loaded data and computed results, keyed by snapshot version.
+    The version is the newest history file plus the mtimes of the files the analyzers read;
+    when the fetcher commits a new snapshot the version changes and everything is dropped.
+    """
+    WATCHED_FILES = ["selene_latest.parquet", "liquidez_diaria.csv", "catalogo_manufatura.json",
+                     "client_orders.csv", "suppliers.csv"]
+
+    def __init__(self, data_dir, max_entries=64, check_interval=2.0):
+        self.data_dir = data_dir
+        self.history_dir = os.path.join(data_dir, "history")
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # key name -> [loads, seconds] (time spent in loaders on misses)
+        self.load_times = {}
+
+    def current_version(self):
+        """(latest snapshot name, mtime_ns of it and of every watched file)."""
+        files = glob.glob(os.path.join(self.history_dir, "**", "*.parquet"), recursive=True)
+        latest = max(files, key=os.path.basename) if files else None
+        parts = [os.path.basename(latest) if latest else None]
+        for path in ([latest] if latest else []) + [os.path.join(self.data_dir, f) for f in self.WATCHED_FILES]:
+            try:
+                parts.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                parts.append(None)
+        return tuple(parts)
+
+    @property
+    def version(self):
+        # stat() the data dir at most every check_interval seconds
+        now = time.monotonic()
+        if self._version is None or now - self._checked_at >= self.check_interval:
+            version = self.current_version()
+            with self.lock:
+                self._checked_at = now
+                if version != self._version:
+                    if self._version is not None:
+                        self.invalidations += 1
+                    self.entries.clear()
+                    self._version = version
+        return self._version
+
+    @property
+    def snapshot(self):
+        """Name of the snapshot the cached entries belong to."""
+        return self.version[0]
+
+    def get(self, key, loader):
+        """Returns the cached value for key, computing it with loader() on a miss."""
+        version = self.version
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        # Computed outside the lock; two concurrent misses may both compute, last one wins
+        start = time.perf_counter()
+        value = loader()
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            name = key[0] if isinstance(key, tuple) else key
+            stats = self.load_times.setdefault(name, [0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            if version == self._version:
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self._version = None
+
+    def warm(self, loaders):
+        """loaders: {key: callable}. Fills the cache for the current version."""
+        start = time.perf_counter()
+        for key, loader in loaders.items():
+            try:
+                self.get(key, loader)
+            except Exception as e:
+                print(f"Cache warm-up failed for {key}: {e}")
+        print(f"Cache warmed ({len(loaders)} entries) in {time.perf_counter() - start:.1f}s for snapshot {self.snapshot}")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'snapshot': self.snapshot,
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'invalidations': self.invalidations
+        }
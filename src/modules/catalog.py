@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+class CompiledCatalog:
+    """
+    Recipe catalog keyed by integer item IDs.
+    item_names[id] -> name. Recipe r produces products[r] from
+    ingredients[indptr[r]:indptr[r+1]] with matching quantities (CSR layout).
+    """
+    def __init__(self, item_names, products, indptr, ingredients, quantities, source_hash=""):
+        self.item_names = item_names
+        self.products = products
+        self.indptr = indptr
+        self.ingredients = ingredients
+        self.quantities = quantities
+        self.source_hash = source_hash
+        self.item_ids = {name: i for i, name in enumerate(item_names)}
+
+    @property
+    def n_items(self):
+        return len(self.item_names)
+
+    @property
+    def n_recipes(self):
+        return len(self.products)
+
+    def encode(self, names):
+        """Maps item names (Series/array) to integer IDs; -1 for items outside the catalog."""
+        return pd.Categorical(names, categories=self.item_names).codes.astype(np.int32)
+
+    def recipe(self, r):
+        start, end = self.indptr[r], self.indptr[r + 1]
+        return self.ingredients[start:end], self.quantities[start:end]
+
+    def to_dict(self):
+        catalog = {}
+        for r, pid in enumerate(self.products):
+            ings, qtys = self.recipe(r)
+            catalog[str(self.item_names[pid])] = [
+                {"insumo": str(self.item_names[i]), "qtd": float(q)} for i, q in zip(ings, qtys)
+            ]
+        return catalog
+
+def compile_catalog(catalog, source_hash=""):
+    """Builds the CSR arrays from the name-keyed JSON catalog {product: [{insumo, qtd}]}."""
+    names = set(catalog.keys())
+    for ingredients in catalog.values():
+        names.update(ing['insumo'] for ing in ingredients)
+    item_names = np.array(sorted(names), dtype=str)
+    item_ids = {name: i for i, name in enumerate(item_names)}
+
+    products = np.empty(len(catalog), dtype=np.int32)
+    indptr = np.zeros(len(catalog) + 1, dtype=np.int32)
+    ingredients = []
+    quantities = []
+
+    for r, (product, ings) in enumerate(catalog.items()):
+        products[r] = item_ids[product]
+        for ing in ings:
+            ingredients.append(item_ids[ing['insumo']])
+            quantities.append(ing['qtd'])
+        indptr[r + 1] = len(ingredients)
+
+    return CompiledCatalog(
+        item_names,
+        products,
+        indptr,
+        np.array(ingredients, dtype=np.int32),
+        np.array(quantities, dtype=np.float32),
+        source_hash
+    )
+
+def save_compiled(path, compiled):
+    np.savez_compressed(
+        path,
+        item_names=compiled.item_names,
+        products=compiled.products,
+        indptr=compiled.indptr,
+        ingredients=compiled.ingredients,
+        quantities=compiled.quantities,
+        source_hash=np.array(compiled.source_hash)
+    )
+
+def load_compiled(path):
+    with np.load(path, allow_pickle=False) as data:
+        return CompiledCatalog(
+            data['item_names'],
+            data['products'],
+            data['indptr'],
+            data['ingredients'],
+            data['quantities'],
+            str(data['source_hash'])
+        )
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_catalog(json_path, compiled_path):
+    """
+    Loads the compiled catalog, recompiling from JSON when the binary is missing or
+    was built from a different JSON (hash check instead of mtimes).
+    """
+    if not os.path.exists(json_path):
+        return None
+
+    source_hash = file_hash(json_path)
+    if os.path.exists(compiled_path):
+        try:
+            compiled = load_compiled(compiled_path)
+            if compiled.source_hash == source_hash:
+                return compiled
+        except Exception as e:
+            print(f"Compiled catalog unreadable, rebuilding: {e}")
+
+    with open(json_path, 'r', encoding='utf-8') as f:
+        compiled = compile_catalog(json.load(f), source_hash)
+
+    try:
+        save_compiled(compiled_path, compiled)
+    except OSError as e:
+        print(f"Could not write compiled catalog: {e}")
+    return compiled
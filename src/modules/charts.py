@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Bump when render_chart changes, so every chart is redrawn once
+RENDERER_VERSION = 1
+MANIFEST_FILE = ".charts_manifest.json"
+
+def line_chart(title, series, figsize=(10, 5), xlabel=None, ylabel=None):
+    """
+    Chart spec (plain data, picklable): series = [{'x': [...], 'y': [...], 'label', 'color',
+    'marker', 'linestyle'}]. The spec is both what gets drawn and what gets hashed.
+    """
+    return {'kind': 'line', 'title': title, 'series': series, 'figsize': list(figsize),
+            'xlabel': xlabel, 'ylabel': ylabel}
+
+def spec_hash(spec):
+    payload = json.dumps({'v': RENDERER_VERSION, 'spec': spec}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def render_chart(spec, path):
+    """Draws one spec to a PNG. Runs in a pool worker, headless (Agg)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=spec['figsize'])
+    for s in spec['series']:
+        ax.plot(s['x'], s['y'], label=s.get('label'), color=s.get('color'),
+                marker=s.get('marker'), linestyle=s.get('linestyle', '-'))
+    ax.set_title(spec['title'])
+    if spec.get('xlabel'):
+        ax.set_xlabel(spec['xlabel'])
+    if spec.get('ylabel'):
+        ax.set_ylabel(spec['ylabel'])
+    if any(s.get('label') for s in spec['series']):
+        ax.legend()
+    ax.grid(True, linestyle='--', alpha=0.6)
+    fig.tight_layout()
+
+    tmp = f"{path}.tmp{os.getpid()}.png"
+    fig.savefig(tmp)
+    plt.close(fig)
+    os.replace(tmp, path)
+    return path
+
+class ChartRenderer:
+    """
+    Chart stage for the reports: collect specs with add(), then render() draws the ones whose
+    data changed on a process pool (matplotlib is not thread-safe and is CPU bound).
+    A manifest in charts_dir keeps the spec hash of every PNG; unchanged charts are skipped.
+    """
+    def __init__(self, charts_dir, max_workers=None):
+        self.charts_dir = charts_dir
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.manifest_path = os.path.join(charts_dir, MANIFEST_FILE)
+        self.pending = {}
+
+    def add(self, filename, spec):
+        self.pending[filename] = spec
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        tmp = f"{self.manifest_path}.tmp{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def render(self):
+        """Draws the pending charts. Returns {filename: 'rendered' | 'unchanged' | 'failed'}."""
+        os.makedirs(self.charts_dir, exist_ok=True)
+        manifest = self._load_manifest()
+        status = {}
+        todo = {}
+        for filename, spec in self.pending.items():
+            digest = spec_hash(spec)
+            if manifest.get(filename) == digest and os.path.exists(os.path.join(self.charts_dir, filename)):
+                status[filename] = 'unchanged'
+            else:
+                todo[filename] = (spec, digest)
+
+        if len(todo) == 1 or self.max_workers == 1:
+            # Not worth starting a pool
+            for filename, (spec, digest) in todo.items():
+                try:
+                    render_chart(spec, os.path.join(self.charts_dir, filename))
+                    manifest[filename] = digest
+                    status[filename] = 'rendered'
+                except Exception as e:
+                    print(f"Chart {filename} failed: {e}")
+                    status[filename] = 'failed'
+        elif todo:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(todo))) as pool:
+                futures = {filename: pool.submit(render_chart, spec, os.path.join(self.charts_dir, filename))
+                           for filename, (spec, _) in todo.items()}
+                for filename, future in futures.items():
+                    try:
+                        future.result()
+                        manifest[filename] = todo[filename][1]
+                        status[filename] = 'rendered'
+                    except Exception as e:
+                        print(f"Chart {filename} failed: {e}")
+                        status[filename] = 'failed'
+
+        if todo:
+            self._save_manifest(manifest)
+        self.pending = {}
+        counts = {k: sum(1 for s in status.values() if s == k) for k in ('rendered', 'unchanged', 'failed')}
+        print(f"Charts: {counts['rendered']} rendered, {counts['unchanged']} unchanged, {counts['failed']} failed")
+        return status
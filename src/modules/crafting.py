@@ -1,156 +1,199 @@
 
-import json
+import numpy as np
 import pandas as pd
 import os
+from modules.catalog import load_catalog
+from modules.market import MarketAnalyzer
+from modules.logistics import PaxLogistics, TRAVEL_COST_PER_WEIGHT
+from modules.portfolio import PortfolioOptimizer
+from modules.risk import MarginRiskEngine
+from modules.zones import annotate_zones
 
 class CraftingAnalyzer:
     def __init__(self, data_dir):
         self.data_dir = data_dir
         self.bom_file = os.path.join(data_dir, "catalogo_manufatura.json")
+        self.compiled_file = os.path.join(data_dir, "catalogo_manufatura.npz")
         self.prices_file = os.path.join(data_dir, "selene_latest.parquet")
+        self._logistics = None
 
-    def _build_price_lookup(self, df_prices):
-        """Standardizes listing data for easier access."""
-        # Clean col names
+    @property
+    def logistics(self):
+        if self._logistics is None:
+            self._logistics = PaxLogistics(cache_dir=os.path.join(self.data_dir, "cache"))
+        return self._logistics
+
+    def _load_inputs(self):
+        """Compiled catalog + current listings tagged with integer ItemIDs."""
+        if not os.path.exists(self.prices_file):
+            return None, None
+
+        catalog = load_catalog(self.bom_file, self.compiled_file)
+        if catalog is None:
+            return None, None
+
+        df_prices = pd.read_parquet(self.prices_file)
         if 'UnitPrice' in df_prices.columns:
-            df_prices = df_prices.rename(columns={'UnitPrice': 'Price'})
-        
-        # Group all listings
-        self.listings_map = {}
-        grouped = df_prices.groupby('Item')
-        for item, group in grouped:
-            self.listings_map[item] = group.sort_values('Price')
-
-    def calculate_material_cost(self, item_name, required_qty):
+            df_prices = df_prices.drop(columns=['Price'], errors='ignore').rename(columns={'UnitPrice': 'Price'})
+        df_prices['ItemID'] = catalog.encode(df_prices['Item'])
+        return catalog, df_prices
+
+    def calculate_sell_prices(self, days=3):
+        """
+        Base price (Parametros.md): median unit price over the last 3 days, per region and
+        per zone, for every item in one grouped pass.
+        Falls back to the current snapshot when there is no history.
+        """
+        cols = ['Item', 'Zone', 'UnitPrice']
+        df = MarketAnalyzer(self.data_dir).load_recent_history(days, columns=cols)
+        if df.empty:
+            if not os.path.exists(self.prices_file):
+                return pd.DataFrame(), pd.DataFrame()
+            df = pd.read_parquet(self.prices_file, columns=cols)
+
+        annotate_zones(df)
+
+        by_region = df.groupby(['Item', 'Region'], observed=True)['UnitPrice'].agg(
+            Median_Price='median', Listings='count').reset_index()
+        by_zone = df.groupby(['Item', 'Region', 'Zone'], observed=True)['UnitPrice'].agg(
+            Median_Price='median', Listings='count').reset_index()
+        return by_region, by_zone
+
+    def best_sell_markets(self, days=3):
         """
-        Smart Sourcing: Walking the order book.
-        - Fills required_qty from cheapest listings.
-        - Penalty: 5% cost increase per additional zone used.
+        Best region to sell each item (highest 3-day median) and the best zone INSIDE that
+        region, so freight is charged to a zone that actually belongs to the priced market.
         """
-        listings = self.listings_map.get(item_name)
-        if listings is None or listings.empty:
-            return None, []
-
-        collected_qty = 0
-        total_cost = 0
-        participating_zones = set()
-        details = []
-
-        for _, row in listings.iterrows():
-            if collected_qty >= required_qty:
-                break
-            
-            # Stock check (assume 1 if missing for safety, though parquet should have it)
-            # Depending on data source, quantity column might be 'Amount' or implicit 1 per row?
-            # Looking at previous context, listings seem to be individual? 
-            # Actually, standard Pax Dei data usually has one row per listing.
-            # Let's assume unlimited stock per listing is WRONG. 
-            # If the parquet doesn't have 'Quantity' per listing, we might assume 1 or a default stack?
-            # Let's check columns. If no Quantity col, assume 10 (common stack)? 
-            # Safer: Assume infinite for MVP if no column, OR just take price.
-            # REVISION based on plan: Walk order book. 
-            # If we don't know the Listing Quantity, we can't walk it properly.
-            # Let's assume we can buy at that price.
-            
-            # Simplified Walk for MVP if Quantity is missing in Listing:
-            # Just take the min price from diverse zones?
-            # No, let's assume 'One-Time' or 'Constant' orders availability.
-            # Let's stick to the Plan: Just use cheapest available, but track zones.
-            
-            available = 9999 # Fallback if no quantity logic in listings
-            take = min(required_qty - collected_qty, available)
-            
-            cost = take * row['Price']
-            total_cost += cost
-            collected_qty += take
-            participating_zones.add(row['Zone'])
-            
-        # Penalty Logic
-        zone_penalty = max(0, len(participating_zones) - 1) * 0.05
-        final_cost = total_cost * (1 + zone_penalty)
-        
-        detail_str = f"{item_name}: {len(participating_zones)} Zones (+{zone_penalty*100:.0f}%)"
-        return final_cost, [detail_str]
-
-    def calculate_sell_price(self, item_name):
+        by_region, by_zone = self.calculate_sell_prices(days)
+        if by_region.empty:
+            return pd.DataFrame(columns=['Item', 'Region', 'Median_Price', 'Zone', 'Zone_Median_Price'])
+
+        best_region = by_region.sort_values('Median_Price', ascending=False).drop_duplicates('Item')
+        best_region = best_region[['Item', 'Region', 'Median_Price']]
+        in_region = by_zone.merge(best_region[['Item', 'Region']], on=['Item', 'Region'])
+        best_zone = in_region.sort_values('Median_Price', ascending=False).drop_duplicates('Item')
+        best_zone = best_zone[['Item', 'Zone', 'Median_Price']].rename(columns={'Median_Price': 'Zone_Median_Price'})
+        return best_region.merge(best_zone, on='Item', how='left')
+
+    def _sell_arrays(self, catalog, days=3):
+        """Per item ID: best-region 3-day median, that region and the best zone."""
+        best = self.best_sell_markets(days)
+        best = best[catalog.encode(best['Item']) >= 0]
+        ids = catalog.encode(best['Item'])
+
+        sell_price = np.full(catalog.n_items, np.nan)
+        sell_region = np.full(catalog.n_items, "", dtype=object)
+        sell_zone = np.full(catalog.n_items, "", dtype=object)
+        sell_price[ids] = best['Median_Price'].to_numpy()
+        sell_region[ids] = best['Region'].to_numpy()
+        sell_zone[ids] = best['Zone'].to_numpy()
+        return sell_price, sell_region, sell_zone
+
+    def _price_arrays(self, catalog, df_prices):
+        """Per item ID: cheapest ask and the zone of that ask (NaN if unlisted)."""
+        known = df_prices[df_prices['ItemID'] >= 0]
+
+        best_ask = np.full(catalog.n_items, np.nan)
+        best_zone = np.full(catalog.n_items, "", dtype=object)
+        cheapest = known.loc[known.groupby('ItemID')['Price'].idxmin()]
+        best_ask[cheapest['ItemID'].to_numpy()] = cheapest['Price'].to_numpy()
+        best_zone[cheapest['ItemID'].to_numpy()] = cheapest['Zone'].to_numpy()
+        return best_ask, best_zone
+
+    def _recipe_costs(self, catalog, unit_prices):
+        """Sums qty * price per recipe over the CSR arrays (NaN if any ingredient is unpriced)."""
+        line_costs = catalog.quantities * unit_prices[catalog.ingredients]
+        lengths = np.diff(catalog.indptr)
+        rows = np.repeat(np.arange(catalog.n_recipes), lengths)
+        costs = np.bincount(rows, weights=line_costs, minlength=catalog.n_recipes)
+        costs[lengths == 0] = np.nan
+        return costs
+
+    def _freight_costs(self, catalog, ask_zones, sell_zones, travel_rate):
+        """Carrying every ingredient from its cheapest zone to the product's sell zone (per recipe)."""
+        lengths = np.diff(catalog.indptr)
+        rows = np.repeat(np.arange(catalog.n_recipes), lengths)
+        per_unit = self.logistics.travel_costs(
+            ask_zones[catalog.ingredients], sell_zones[catalog.products[rows]], rate=travel_rate)
+        return np.bincount(rows, weights=catalog.quantities * per_unit, minlength=catalog.n_recipes)
+
+    def analyze_profitability(self, travel_rate=TRAVEL_COST_PER_WEIGHT):
         """
-        Stock-Weighted Median: Price where 50% of market stock is found.
-        Reflects 'True' market price better than average.
+        Calculates spread for all recipes using Smart Sourcing (cheapest ask per ingredient)
+        against the 3-day median of the best region to sell, net of freight between zones.
         """
-        listings = self.listings_map.get(item_name)
-        if listings is None or listings.empty:
-            return 0, "No Data"
-
-        # If data doesn't have explicit quantity col, we count rows as volume proxy
-        # Or better, just standard median if no volume data.
-        # But 'market.py' agg implies we have ListingID count.
-        
-        # Weighted Median calculation
-        # Sort by Price is already done in _build_price_lookup
-        
-        # Since we don't have accurate 'Stock' per listing in the parquet (it's 1 row per listing usually),
-        # Equal weighting per listing (Standard Median) is actually the Stock Weighted Median in this context.
-        # BUT, if we consider 'Liquidity' as weight? No, request was Stock.
-        
-        # So we stick to standard Median of the listings for now, 
-        # unless we find a 'Quantity' column in listings parquet.
-        
-        metric = listings['Price'].median()
-        return metric, "Median"
-
-    def analyze_profitability(self):
-        """Calculates spread for all recipes using Smart Sourcing."""
-        if not os.path.exists(self.bom_file) or not os.path.exists(self.prices_file):
+        catalog, df_prices = self._load_inputs()
+        if catalog is None:
             return None
 
-        with open(self.bom_file, 'r', encoding='utf-8') as f:
-            bom_catalog = json.load(f)
-            
-        df_prices = pd.read_parquet(self.prices_file)
-        self._build_price_lookup(df_prices)
-        
-        results = []
-        
-        for product, ingredients in bom_catalog.items():
-            # Sell Price (Weighted Median)
-            sell_price, _ = self.calculate_sell_price(product)
-            if sell_price <= 0:
-                continue
-            
-            total_cost = 0
-            sourcing_notes = []
-            possible = True
-            
-            for ing in ingredients:
-                ing_name = ing['insumo']
-                qty = ing['qtd']
-                
-                # Smart Sourcing
-                cost, details = self.calculate_material_cost(ing_name, qty)
-                
-                if cost is None:
-                    possible = False
-                    break
-                    
-                total_cost += cost
-                sourcing_notes.extend(details)
-                
-            if possible:
-                spread = sell_price - total_cost
-                margin = (spread / sell_price) * 100 if sell_price > 0 else 0
-                
-                results.append({
-                    'Produto': product,
-                    'Custo_Manufatura': round(total_cost, 2),
-                    'Preco_Venda': round(sell_price, 2),
-                    'Spread': round(spread, 2),
-                    'Margem_Perc': round(margin, 1),
-                    'Mercado_Venda': "Weighted Median", # Static for now
-                    'Sourcing_Insumos': "; ".join(sourcing_notes)
-                })
-                
-        if not results:
+        best_ask, best_zone = self._price_arrays(catalog, df_prices)
+        sell_by_item, sell_region, sell_zone = self._sell_arrays(catalog)
+        costs = self._recipe_costs(catalog, best_ask)
+        freight = self._freight_costs(catalog, best_zone, sell_zone, travel_rate)
+        sell_prices = sell_by_item[catalog.products]
+
+        valid = np.flatnonzero(~np.isnan(costs) & (sell_prices > 0))
+        if len(valid) == 0:
             return pd.DataFrame()
-            
-        df_results = pd.DataFrame(results)
+
+        spread = sell_prices[valid] - costs[valid] - freight[valid]
+        sourcing = []
+        for r in valid:
+            ings, _ = catalog.recipe(r)
+            sourcing.append("; ".join(f"{catalog.item_names[i]}@{best_zone[i]}" for i in ings))
+
+        df_results = pd.DataFrame({
+            'Produto': catalog.item_names[catalog.products[valid]],
+            'Custo_Manufatura': np.round(costs[valid], 2),
+            'Custo_Frete': np.round(freight[valid], 2),
+            'Preco_Venda': np.round(sell_prices[valid], 2),
+            'Spread': np.round(spread, 2),
+            'Margem_Perc': np.round(spread / sell_prices[valid] * 100, 1),
+            'Mercado_Venda': sell_region[catalog.products[valid]],
+            'Zona_Venda': sell_zone[catalog.products[valid]],
+            'Sourcing_Insumos': sourcing
+        })
         return df_results.sort_values(by='Spread', ascending=False)
+
+    def optimize_portfolio(self, budget, demand_caps, default_cap=0):
+        """
+        Chooses recipes and quantities that maximize expected profit under a budget.
+        demand_caps: {product: expected units sold} (churn), caps each product.
+        Ingredient order books are shared, so buying for one recipe raises the cost of the next.
+        """
+        catalog, df_prices = self._load_inputs()
+        if catalog is None:
+            return None
+
+        sell_prices, _, _ = self._sell_arrays(catalog)
+        caps = np.full(catalog.n_items, default_cap, dtype=np.int64)
+        for name, units in demand_caps.items():
+            item_id = catalog.item_ids.get(name)
+            if item_id is not None:
+                caps[item_id] = units
+
+        optimizer = PortfolioOptimizer(catalog, df_prices, sell_prices, caps)
+        return optimizer.optimize(budget)
+
+    def analyze_risk(self, n_scenarios=2000, history_days=14, seed=None):
+        """
+        Risk mode: Monte Carlo over historical daily returns of every input and output.
+        Reports expected margin, P5/P95 and probability of loss per recipe.
+        """
+        catalog, df_prices = self._load_inputs()
+        if catalog is None:
+            return None
+
+        best_ask, _ = self._price_arrays(catalog, df_prices)
+        sell_prices, sell_region, _ = self._sell_arrays(catalog)
+
+        history = MarketAnalyzer(self.data_dir).load_recent_history(
+            history_days, columns=['Item', 'UnitPrice'])
+        engine = MarginRiskEngine(catalog, n_scenarios=n_scenarios, seed=seed).fit(history)
+        valid, margins = engine.simulate(best_ask, sell_prices)
+        if len(valid) == 0:
+            return pd.DataFrame()
+
+        df_risk = engine.summarize(valid, margins)
+        df_risk['Mercado_Venda'] = sell_region[catalog.products[valid]]
+        return df_risk.sort_values(by='Margem_Esperada', ascending=False)
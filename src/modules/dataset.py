@@ -0,0 +1,199 @@
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from modules.history import snapshot_time
+
+class SharedDataset:
+    """
+    Market history shared by every server worker through memory-mapped Arrow IPC files.
+
+    publish() writes data/shared/<version>/{history,latest}.arrow (uncompressed, so they can be
+    mapped zero-copy) and then swaps data/shared/CURRENT with os.replace, which is atomic: a
+    worker sees either the old or the new version, never a half-written one. Workers map the
+    files read-only, so the pages live once in the OS page cache no matter how many workers
+    attach; only the filtered slices a request needs are converted to pandas.
+    """
+    LOCK_STALE_SECONDS = 600
+
+    def __init__(self, data_dir, keep=2, check_interval=2.0):
+        self.data_dir = data_dir
+        self.history_dir = os.path.join(data_dir, "history")
+        self.shared_dir = os.path.join(data_dir, "shared")
+        self.pointer_file = os.path.join(self.shared_dir, "CURRENT")
+        self.lock_file = os.path.join(self.shared_dir, ".publish.lock")
+        self.keep = keep
+        self.check_interval = check_interval
+
+        self.lock = threading.Lock()
+        self._checked_at = 0.0
+        self._pointer_mtime = None
+        self.version = None
+        self.history = None
+        self.latest = None
+
+    # --- publishing (any process; one at a time through a lock file) ---
+
+    def _snapshot_files(self):
+        return sorted(glob.glob(os.path.join(self.history_dir, "**", "*.parquet"), recursive=True),
+                      key=os.path.basename)
+
+    def source_version(self):
+        """Version of the history on disk: newest snapshot + number of snapshots."""
+        files = self._snapshot_files()
+        if not files:
+            return None
+        return f"{os.path.splitext(os.path.basename(files[-1]))[0]}_{len(files)}"
+
+    def published_version(self):
+        try:
+            with open(self.pointer_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('version')
+        except (OSError, ValueError):
+            return None
+
+    def _acquire(self):
+        os.makedirs(self.shared_dir, exist_ok=True)
+        try:
+            if time.time() - os.path.getmtime(self.lock_file) > self.LOCK_STALE_SECONDS:
+                os.remove(self.lock_file)
+        except OSError:
+            pass
+        try:
+            fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return True
+        except FileExistsError:
+            return False
+
+    def _read_history(self, files):
+        tables = []
+        for f in files:
+            try:
+                table = pq.read_table(f)
+            except Exception as e:
+                print(f"Skipping {f}: {e}")
+                continue
+            stamp = pa.scalar(snapshot_time(f), type=pa.timestamp('us'))
+            tables.append(table.append_column('SnapshotDate', pa.repeat(stamp, len(table))))
+        if not tables:
+            return None
+        return pa.concat_tables(tables, promote_options="permissive")
+
+    @staticmethod
+    def _write_ipc(table, path):
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    def publish(self, force=False):
+        """Publishes the current history if it is newer than CURRENT. Returns the published version."""
+        version = self.source_version()
+        if version is None or (version == self.published_version() and not force):
+            return self.published_version()
+        if not self._acquire():
+            # Another worker/process is publishing; keep serving the old version
+            return self.published_version()
+
+        try:
+            files = self._snapshot_files()
+            history = self._read_history(files)
+            if history is None:
+                return self.published_version()
+            latest = pq.read_table(files[-1])
+
+            target = os.path.join(self.shared_dir, version)
+            tmp = f"{target}.tmp{os.getpid()}"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            self._write_ipc(history, os.path.join(tmp, "history.arrow"))
+            self._write_ipc(latest, os.path.join(tmp, "latest.arrow"))
+            if os.path.exists(target):
+                shutil.rmtree(target, ignore_errors=True)
+            os.replace(tmp, target)
+
+            pointer_tmp = f"{self.pointer_file}.tmp{os.getpid()}"
+            with open(pointer_tmp, 'w', encoding='utf-8') as f:
+                json.dump({'version': version, 'rows': history.num_rows, 'snapshots': len(files)}, f)
+            os.replace(pointer_tmp, self.pointer_file)
+            self._prune(version)
+            print(f"Shared dataset published: {version} ({history.num_rows} rows)")
+            return version
+        finally:
+            try:
+                os.remove(self.lock_file)
+            except OSError:
+                pass
+
+    def _prune(self, current):
+        versions = sorted(d for d in os.listdir(self.shared_dir)
+                          if os.path.isdir(os.path.join(self.shared_dir, d)) and ".tmp" not in d)
+        for old in versions[:max(0, len(versions) - self.keep)]:
+            if old != current:
+                # Still mapped by a worker on Windows -> fails; retried on the next publish
+                shutil.rmtree(os.path.join(self.shared_dir, old), ignore_errors=True)
+
+    # --- attaching (every worker) ---
+
+    @staticmethod
+    def _map(path):
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+    def refresh(self):
+        """Re-attaches when CURRENT changed (checked at most every check_interval seconds)."""
+        now = time.monotonic()
+        if self.history is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.pointer_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._pointer_mtime:
+            return
+
+        version = self.published_version()
+        folder = os.path.join(self.shared_dir, version) if version else None
+        if not folder or not os.path.isdir(folder):
+            return
+        history = self._map(os.path.join(folder, "history.arrow"))
+        latest = self._map(os.path.join(folder, "latest.arrow"))
+        with self.lock:
+            # Old tables are released once in-flight requests drop their references
+            self.version, self.history, self.latest = version, history, latest
+            self._pointer_mtime = mtime
+
+    def attach(self):
+        """Publishes if needed (first worker wins) and maps the current version."""
+        self.publish()
+        self.refresh()
+        return self.version
+
+    def tables(self):
+        self.refresh()
+        with self.lock:
+            return self.history, self.latest
+
+    def history_table(self, item=None):
+        """
+        History as the mapped Arrow table, optionally only rows whose Item contains `item`.
+        Unfiltered it is the shared mapping itself (no per-worker copy); callers slice before converting.
+        """
+        history, _ = self.tables()
+        if history is None or not item:
+            return history
+        mask = pc.match_substring(history['Item'], item, ignore_case=True)
+        return history.filter(pc.fill_null(mask, False))
+
+    def item_names(self):
+        _, latest = self.tables()
+        if latest is None:
+            return None
+        return pc.unique(pc.drop_null(latest['Item'])).to_pylist()
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+
+from modules.watch import SnapshotWatcher, diff_snapshots
+from modules.views import VIEWS, PAGES
+
+class SnapshotBroadcaster:
+    """
+    Announces each new snapshot to SSE subscribers with compact diffs:
+    liquidity (units sold since the previous snapshot), price moves (median change of the
+    changed items) and opportunities that appeared/vanished (SnapshotWatcher, incremental).
+    With a ViewStore, each event also carries the row deltas (added / changed / removed) of the
+    default page of every view between the previous and the new view version, so clients patch
+    their tables and only reload on a version gap.
+
+    With several server workers only one of them (the holder of data/shared/.broadcaster.lock,
+    refreshed every poll and taken over when stale) runs the SnapshotWatcher and keeps a pandas
+    copy of the snapshot. It writes each event to data/shared/broadcast.json and the other
+    workers relay that file to their own SSE subscribers.
+    Runs its own polling thread; poll() can also be triggered right after a fetch job.
+    """
+    def __init__(self, data_dir, views=None, interval=30, follow_interval=2, top=20, min_move=10.0):
+        self.interval = interval
+        self.follow_interval = follow_interval
+        self.top = top
+        self.min_move = min_move
+        self.watcher = SnapshotWatcher(data_dir, out=open(os.devnull, "w"))
+        self.shared_dir = os.path.join(data_dir, "shared")
+        self.leader_file = os.path.join(self.shared_dir, ".broadcaster.lock")
+        self.state_file = os.path.join(self.shared_dir, "broadcast.json")
+        self.stale_after = 3 * interval
+        self.leader = False
+        self._state_mtime = None
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.poll_lock = threading.Lock()
+        self.views = views
+        self.snapshot = None
+        self.version = None
+        self.last_event = None
+        self._thread = None
+
+    # --- subscribers (one asyncio.Queue per SSE connection) ---
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=100)
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            self.subscribers.add((loop, queue))
+        return loop, queue
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, kind, data):
+        message = {'event': kind, 'data': data}
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, message)
+
+    @staticmethod
+    def _offer(queue, message):
+        # Slow clients drop messages instead of growing the queue forever
+        if not queue.full():
+            queue.put_nowait(message)
+
+    # --- diffs ---
+
+    def _price_moves(self, df_old, df_new, items):
+        old = df_old[df_old['Item'].isin(items)].groupby('Item')['UnitPrice'].median()
+        new = df_new[df_new['Item'].isin(items)].groupby('Item')['UnitPrice'].median()
+        both = pd.DataFrame({'Old': old, 'New': new}).dropna()
+        both = both[both['Old'] > 0]
+        both['Change_Pct'] = (both['New'] / both['Old'] - 1) * 100
+        both = both[both['Change_Pct'].abs() >= self.min_move]
+        both = both.reindex(both['Change_Pct'].abs().sort_values(ascending=False).index).head(self.top)
+        return [
+            {'Item': item, 'Old': round(row.Old, 2), 'New': round(row.New, 2), 'Change_Pct': round(row.Change_Pct, 1)}
+            for item, row in both.iterrows()
+        ]
+
+    def _liquidity(self, removed):
+        if removed.empty:
+            return []
+        units = 'Amount' if 'Amount' in removed.columns else 'ListingID'
+        sold = removed.groupby('Item')[units].agg('sum' if units == 'Amount' else 'count')
+        sold = sold.sort_values(ascending=False).head(self.top)
+        return [{'Item': item, 'Units_Sold': int(qty)} for item, qty in sold.items()]
+
+    def _opportunities(self, events):
+        appeared = [e for e in events if e['event'] == 'new']
+        vanished = [e for e in events if e['event'] == 'vanished']
+        best = sorted((e for e in appeared if e['type'] == 'arbitrage'), key=lambda e: e.get('Score', 0), reverse=True)
+        return {
+            'new': len(appeared),
+            'vanished': len(vanished),
+            'top_new': [{k: e.get(k) for k in ('Item', 'Buy_Zone', 'Buy_Price', 'Top_Zone', 'Unit_Profit', 'Score')}
+                        for e in best[:self.top]]
+        }
+
+    def _table_deltas(self, old_version, new_version):
+        """{view: {key, sort, desc, limit, added, changed, removed}} between two versions (None if one is gone)."""
+        if self.views is None or old_version is None or new_version is None:
+            return None
+        tables = {}
+        for name, (key, limit, _) in PAGES.items():
+            old_page, new_page = self.views.page(name, old_version), self.views.page(name, new_version)
+            if old_page is None or new_page is None:
+                return None
+            old_rows = {r[key]: r for r in old_page.to_dict(orient="records")} if key in old_page.columns else {}
+            new_rows = {r[key]: r for r in new_page.to_dict(orient="records")} if key in new_page.columns else {}
+            sort_col, descending = VIEWS[name]
+            tables[name] = {
+                'key': key, 'sort': sort_col, 'desc': descending, 'limit': limit,
+                'added': [r for k, r in new_rows.items() if k not in old_rows],
+                'changed': [r for k, r in new_rows.items() if k in old_rows and r != old_rows[k]],
+                'removed': [k for k in old_rows if k not in new_rows]
+            }
+        return tables
+
+    # --- one watcher per data dir (leader), the other workers follow ---
+
+    def _lead(self):
+        """True if this process runs the watcher: refreshes our lock or takes over a stale/missing one."""
+        pid = str(os.getpid())
+        if self.leader:
+            try:
+                with open(self.leader_file, 'r', encoding='utf-8') as f:
+                    if f.read().strip() == pid:
+                        os.utime(self.leader_file)
+                        return True
+            except OSError:
+                pass
+            # Lock lost (deleted or taken over after we stalled)
+            self.leader = False
+
+        os.makedirs(self.shared_dir, exist_ok=True)
+        try:
+            if time.time() - os.path.getmtime(self.leader_file) > self.stale_after:
+                os.remove(self.leader_file)
+        except OSError:
+            pass
+        try:
+            fd = os.open(self.leader_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, pid.encode())
+            os.close(fd)
+            self.leader = True
+        except FileExistsError:
+            pass
+        return self.leader
+
+    def _write_state(self):
+        tmp = f"{self.state_file}.tmp{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'snapshot': self.snapshot, 'version': self.version, 'event': self.last_event}, f, default=str)
+        os.replace(tmp, self.state_file)
+
+    def _follow(self):
+        """Relays the leader's newest event to our subscribers. Returns it (or None)."""
+        try:
+            mtime = os.stat(self.state_file).st_mtime_ns
+            if mtime == self._state_mtime:
+                return None
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._state_mtime = mtime
+        self.snapshot, self.version = state.get('snapshot'), state.get('version')
+        event = state.get('event')
+        if not event or event == self.last_event:
+            return None
+        self.last_event = event
+        self.publish('snapshot', event)
+        return event
+
+    def refresh(self):
+        """Followers: pick up the leader's state right away (e.g. before greeting a new subscriber)."""
+        if not self.leader and self.poll_lock.acquire(blocking=False):
+            try:
+                self._follow()
+            finally:
+                self.poll_lock.release()
+
+    def release(self):
+        """Drops the leader lock on shutdown so another worker takes over without waiting for it to go stale."""
+        if not self.leader:
+            return
+        try:
+            with open(self.leader_file, 'r', encoding='utf-8') as f:
+                if f.read().strip() == str(os.getpid()):
+                    os.remove(self.leader_file)
+        except OSError:
+            pass
+        self.leader = False
+
+    def poll(self):
+        """
+        Leader: checks for a new snapshot and publishes its diff. Follower: relays the leader's event.
+        Returns the published payload (or None).
+        """
+        with self.poll_lock:
+            if not self._lead():
+                return self._follow()
+            return self._watch()
+
+    def _watch(self):
+        previous_file = self.watcher.snapshot_file
+        df_old = self.watcher.df_snapshot
+        events = self.watcher.poll()
+        if self.watcher.snapshot_file == previous_file:
+            return None
+        previous_version = self.version
+        self.version = self.views.build() if self.views is not None else None
+        self.snapshot = os.path.basename(self.watcher.snapshot_file)
+        if df_old is None:
+            # First load is the baseline, nothing to announce
+            self._write_state()
+            return None
+
+        df_new = self.watcher.df_snapshot
+        diff = self.watcher.last_diff or diff_snapshots(df_old, df_new)
+        payload = {
+            'snapshot': os.path.basename(self.watcher.snapshot_file),
+            'previous': os.path.basename(previous_file),
+            'version': self.version,
+            'previous_version': previous_version,
+            'time': datetime.now().isoformat(),
+            'listings': len(df_new),
+            'added': len(diff['added']),
+            'removed': len(diff['removed']),
+            'changed_items': len(diff['changed_items']),
+            'liquidity': self._liquidity(diff['removed']),
+            'price_moves': self._price_moves(df_old, df_new, diff['changed_items']),
+            'opportunities': self._opportunities(events),
+            # None tells clients to reload (previous version pruned or no views)
+            'tables': self._table_deltas(previous_version, self.version)
+        }
+        self.last_event = payload
+        self._write_state()
+        self.publish('snapshot', payload)
+        return payload
+
+    def _loop(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[events] poll failed: {e}")
+            time.sleep(self.interval if self.leader else self.follow_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+def sse_message(kind, data, event_id=None):
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {kind}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,206 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pandas as pd
+import pyarrow.parquet as pq
+
+from modules.zones import annotate_zones
+
+PARTITION = re.compile(r"^(year|month)=(\d+)$")
+
+def snapshot_time(path):
+    """Snapshot timestamp from market_YYYY-MM-DD_HH-MM.parquet (file mtime as a last resort)."""
+    stamp = os.path.basename(path).replace("market_", "").replace(".parquet", "")
+    try:
+        return datetime.strptime(stamp, "%Y-%m-%d_%H-%M")
+    except ValueError:
+        return datetime.fromtimestamp(os.path.getmtime(path))
+
+class HistoryLoader:
+    """
+    One reader for data/history shared by the reports and MarketAnalyzer.
+    Prunes by the year=/month= partition directories first and by the snapshot timestamp
+    in the file name second (never by mtime, which lies for downloaded/copied files),
+    reads only the requested columns, several files at a time, and keeps the last results
+    in memory keyed by (files, mtimes, columns, tag).
+    """
+    def __init__(self, data_dir, max_workers=None, cache_size=4):
+        self.history_dir = os.path.join(data_dir, "history")
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    # --- file selection ---
+
+    @staticmethod
+    def _partition_range(parts):
+        """(first, last) datetime covered by a year=/month= path, or None if not partitioned."""
+        year = parts.get('year')
+        if year is None:
+            return None
+        month = parts.get('month')
+        if month is None:
+            return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+        start = datetime(year, month, 1)
+        return start, (datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1))
+
+    def snapshot_files(self, since=None, until=None):
+        """[(timestamp, path)] sorted by time, with since <= timestamp <= until."""
+        found = []
+        for root, dirs, files in os.walk(self.history_dir):
+            parts = {}
+            for piece in os.path.relpath(root, self.history_dir).split(os.sep):
+                m = PARTITION.match(piece)
+                if m:
+                    parts[m.group(1)] = int(m.group(2))
+
+            # Skip whole partitions outside the window without listing them
+            keep = []
+            for d in dirs:
+                m = PARTITION.match(d)
+                span = self._partition_range({**parts, m.group(1): int(m.group(2))}) if m else None
+                if span and ((since and span[1] <= since) or (until and span[0] > until)):
+                    continue
+                keep.append(d)
+            dirs[:] = keep
+
+            for f in files:
+                if not f.endswith(".parquet"):
+                    continue
+                path = os.path.join(root, f)
+                ts = snapshot_time(path)
+                if (since and ts < since) or (until and ts > until):
+                    continue
+                found.append((ts, path))
+        return sorted(found)
+
+    def latest_snapshot(self, path=None):
+        """Timestamp of the newest snapshot; partitions are visited newest first, older ones are not listed."""
+        path = path or self.history_dir
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return None
+        stamps = [snapshot_time(e.path) for e in entries if e.is_file() and e.name.endswith(".parquet")]
+
+        partitions, others = [], []
+        for e in entries:
+            if e.is_dir():
+                m = PARTITION.match(e.name)
+                (partitions if m else others).append((int(m.group(2)) if m else 0, e.path))
+        for _, sub in others:
+            stamps.append(self.latest_snapshot(sub))
+        for _, sub in sorted(partitions, reverse=True):
+            newest = self.latest_snapshot(sub)
+            if newest is not None:
+                stamps.append(newest)
+                break
+        stamps = [ts for ts in stamps if ts is not None]
+        return max(stamps) if stamps else None
+
+    def day_window(self, days, until=None):
+        """
+        (since, until) covering the last N calendar days up to `until` (default: newest snapshot):
+        since is midnight of the first day, so days=1 is the day of `until`, not the last 24h.
+        The one meaning of `days` everywhere (manifest, load, MarketAnalyzer.load_recent_history).
+        """
+        until = until or self.latest_snapshot()
+        if until is None:
+            return None, None
+        return datetime.combine(until.date() - timedelta(days=days - 1), datetime.min.time()), until
+
+    def manifest(self, days=None, since=None, until=None, daily=False):
+        """
+        Snapshot manifest: DataFrame(Timestamp, Date, Path) sorted by time.
+        days: the last N calendar days up to `until` or the newest snapshot (day_window; overrides since).
+        daily=True keeps the last snapshot of each day.
+        """
+        if days is not None:
+            since, until = self.day_window(days, until)
+            if until is None:
+                return pd.DataFrame(columns=['Timestamp', 'Date', 'Path'])
+        files = self.snapshot_files(since, until)
+        manifest = pd.DataFrame(files, columns=['Timestamp', 'Path'])
+        manifest.insert(1, 'Date', manifest['Timestamp'].dt.date if len(manifest) else [])
+        if daily:
+            manifest = manifest.drop_duplicates('Date', keep='last').reset_index(drop=True)
+        return manifest
+
+    # --- loading ---
+
+    def _read(self, path, columns):
+        if columns is not None:
+            available = set(pq.read_schema(path).names)
+            columns = [c for c in columns if c in available]
+        return pd.read_parquet(path, columns=columns)
+
+    def load(self, days=None, since=None, until=None, columns=None, tag=True, daily=False):
+        """
+        History as one frame with SnapshotDate (+ Date, categorical Region and PvP when tag=True).
+        days: the last N calendar days up to `until` or the newest snapshot (see day_window;
+        an old dataset still yields a window).
+        daily: only the last snapshot of each day (see manifest()).
+        Returns a shallow copy of the cached frame (copy-on-write: callers may add/modify columns freely).
+        """
+        manifest = self.manifest(days, since, until, daily)
+        if manifest.empty:
+            return pd.DataFrame()
+        files = list(zip(manifest['Timestamp'].dt.to_pydatetime(), manifest['Path']))
+
+        mtimes = []
+        for _, path in files:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        key = (tuple(p for _, p in files), tuple(mtimes), tuple(columns) if columns else None, tag)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key].copy(deep=False)
+
+        def read(item):
+            ts, path = item
+            try:
+                df = self._read(path, columns)
+            except Exception as e:
+                print(f"Skipping {path}: {e}")
+                return None
+            df['SnapshotDate'] = ts
+            return df
+
+        # pyarrow releases the GIL while decoding, so threads read files in parallel
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            dfs = [df for df in pool.map(read, files) if df is not None]
+        if not dfs:
+            return pd.DataFrame()
+        full_df = pd.concat(dfs, ignore_index=True)
+
+        if tag:
+            full_df['Date'] = full_df['SnapshotDate'].dt.date
+            if 'Zone' in full_df.columns:
+                annotate_zones(full_df)
+
+        with self.lock:
+            self.cache[key] = full_df
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return full_df.copy(deep=False)
+
+_loaders = {}
+_loaders_lock = threading.Lock()
+
+def get_loader(data_dir):
+    """Process-wide loader (and cache) per data dir."""
+    data_dir = os.path.abspath(data_dir)
+    with _loaders_lock:
+        if data_dir not in _loaders:
+            _loaders[data_dir] = HistoryLoader(data_dir)
+        return _loaders[data_dir]
+
+def load_history(data_dir, days=None, columns=None, tag=True, **kwargs):
+    return get_loader(data_dir).load(days=days, columns=columns, tag=tag, **kwargs)
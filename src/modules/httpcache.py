@@ -0,0 +1,28 @@
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+
+def validators(version):
+    """
+    (ETag, Last-Modified header, Last-Modified epoch seconds) for a SnapshotCache version.
+    Every endpoint body is a function of the snapshot version + URL, so one weak ETag per version
+    is enough (ETags are compared per URL by the browser).
+    """
+    etag = 'W/"' + hashlib.sha1(repr(version).encode("utf-8")).hexdigest()[:16] + '"'
+    mtimes = [v for v in version if isinstance(v, int)]
+    modified = int(max(mtimes) // 1_000_000_000) if mtimes else 0
+    return etag, formatdate(modified, usegmt=True), modified
+
+def not_modified(headers, etag, modified):
+    """Conditional GET: If-None-Match takes precedence over If-Modified-Since (RFC 9110)."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or etag.replace('W/', '') in tags
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and modified:
+        try:
+            return int(parsedate_to_datetime(if_modified_since).timestamp()) >= modified
+        except (TypeError, ValueError):
+            return False
+    return False
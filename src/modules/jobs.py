@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+
+class JobConflict(Exception):
+    """Raised when a job of the same kind is already queued or running (here or in another process)."""
+    def __init__(self, name, job_id, pid=None):
+        where = f" in another process (pid {pid})" if pid else ""
+        super().__init__(f"Job '{name}' already running ({job_id}){where}")
+        self.job_id = job_id
+        self.pid = pid
+
+class Job:
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.status = "queued"
+        self.stage = None
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def update(self, stage, done=0, total=0):
+        self.stage = stage
+        self.done = done
+        self.total = total
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'stage': self.stage,
+            'done': self.done,
+            'total': self.total,
+            'percent': round(self.done / self.total * 100, 1) if self.total else None,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class JobManager:
+    """
+    In-process background jobs (one thread each). Only one job per name may be active;
+    finished jobs are kept (last max_history) so clients can poll their status.
+    With lock_dir the rule holds across processes (server workers): an active job holds
+    <lock_dir>/.job-<name>.lock, touched every HEARTBEAT_SECONDS and taken over once stale.
+    """
+    HEARTBEAT_SECONDS = 10
+    LOCK_STALE_SECONDS = 60
+
+    def __init__(self, max_history=20, lock_dir=None):
+        self.jobs = {}
+        self.max_history = max_history
+        self.lock_dir = lock_dir
+        self.lock = threading.Lock()
+
+    def _lock_file(self, name):
+        return os.path.join(self.lock_dir, f".job-{name}.lock")
+
+    def _acquire(self, job):
+        """Creates the job's lock file; raises JobConflict if a live one belongs to another process."""
+        if not self.lock_dir:
+            return
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = self._lock_file(job.name)
+        try:
+            if time.time() - os.path.getmtime(path) > self.LOCK_STALE_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    owner = json.load(f)
+            except (OSError, ValueError):
+                owner = {}
+            raise JobConflict(job.name, owner.get('job_id'), owner.get('pid'))
+        os.write(fd, json.dumps({'job_id': job.id, 'pid': os.getpid()}).encode())
+        os.close(fd)
+
+    def _heartbeat(self, job):
+        path = self._lock_file(job.name)
+        while job.active:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            time.sleep(self.HEARTBEAT_SECONDS)
+
+    def _release(self, job):
+        if self.lock_dir:
+            try:
+                os.remove(self._lock_file(job.name))
+            except OSError:
+                pass
+
+    def submit(self, name, target, on_success=None):
+        """
+        Starts target(progress) in a background thread and returns the Job at once.
+        progress is a callback(stage, done, total). on_success(result) runs in the same
+        thread after target returns (e.g. cache refresh / precomputation).
+        """
+        with self.lock:
+            for job in self.jobs.values():
+                if job.name == name and job.active:
+                    raise JobConflict(job.name, job.id)
+            job = Job(name)
+            self._acquire(job)
+            self.jobs[job.id] = job
+            self._prune()
+
+        thread = threading.Thread(target=self._run, args=(job, target, on_success), daemon=True)
+        thread.start()
+        if self.lock_dir:
+            threading.Thread(target=self._heartbeat, args=(job,), daemon=True).start()
+        return job
+
+    def _run(self, job, target, on_success):
+        job.status = "running"
+        job.started_at = datetime.now()
+        try:
+            job.result = target(job.update)
+            if on_success:
+                job.update("refresh")
+                on_success(job.result)
+            job.status = "succeeded"
+        except SystemExit as e:
+            # ETL scripts call exit(1) on failure
+            job.status = "failed"
+            job.error = f"exit({e.code})"
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{e}\n{traceback.format_exc(limit=5)}"
+        finally:
+            job.finished_at = datetime.now()
+            self._release(job)
+
+    def _prune(self):
+        finished = [j for j in self.jobs.values() if not j.active]
+        finished.sort(key=lambda j: j.created_at)
+        for job in finished[:max(0, len(finished) - self.max_history)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            jobs = sorted(self.jobs.values(), key=lambda j: j.created_at, reverse=True)
+        return [job.to_dict() for job in jobs]
@@ -1,43 +1,54 @@
 
 import networkx as nx
+from modules.market import MarketAnalyzer
+from modules.zones import PROVINCES, HUB_NODE, ZONE_TABLE, zone_node
+import numpy as np
 import pandas as pd
+import hashlib
+import heapq
 import os
 
+# Route weights: every petra/market zone is one hop from each portal of its province, crossing a
+# frontier portal pair is one more hop, and a PvP gate is half a hop from the Lyonesse hub. A safe
+# zone -> zone move therefore weighs 40 inside a province, 60 into a neighbouring province and 120
+# two provinces away (PvP: at most 60, through the hub).
+HOP_WEIGHT = 20
+FRONTIER_WEIGHT = 20
+GATE_WEIGHT = 10
+
+# Freight in gold per item unit carried per unit of route weight. The ONE travel rate used by
+# arbitrage, crafting freight and the trip planner (travel_rate in the API, --travel-rate /
+# --cost-per-weight in the CLIs). Pax Dei charges nothing to travel, so this prices hauling time:
+# 0.025 makes a move cost 1 / 1.5 / 3 gold per unit (same province / neighbour / two away),
+# about a third of the median listing unit price (3 gold) for the shortest one. Cheap raw goods
+# only travel for wide spreads; crafted and end-game goods (tens to thousands of gold) barely notice.
+TRAVEL_COST_PER_WEIGHT = 0.025
+
 class PaxLogistics:
-    def __init__(self):
+    def __init__(self, cache_dir=None):
         self.full_graph = nx.DiGraph()
-        self.hub_node = "Lyonesse_Hub"
+        self.hub_node = HUB_NODE
+        self.cache_dir = cache_dir
         self._build_world()
+        self._build_routing_tables()
         
     def _build_world(self):
-        self.provinces = {
-            "Kerys": {
-                "petras": ["Aven", "Bronyr", "Dolavon", "Nerys", "Pladenn"],
-                "frontier_portals": ["Tremen", "Urmoth"],
-                "pvp_portals": ["Parzival Gate"]
-            },
-            "Inis Gallia": {
-                "petras": ["Goibniu", "Jura", "Kitz", "Levanth", "Nantes", "Paula", "Pontus", "Sanctum", "Tyria", "Verdon"],
-                "frontier_portals": ["Tyria", "Levanth"],
-                "pvp_portals": ["Vigdis Gate"]
-            },
-            "Merrie": {
-                "petras": ["Baden", "Demesne", "Downs", "Ham", "Lea", "Ostia", "Shire", "Tryst", "Wittan"],
-                "frontier_portals": ["Ham", "Agria"],
-                "pvp_portals": ["Cormac Gate"]
-            },
-            "Ancien": {
-                "petras": ["Durness", "Egeb", "Keria", "Luden", "Sinking", "Vinland"],
-                "frontier_portals": ["Tursan", "Byla"],
-                "pvp_portals": ["Kellen Gate"]
-            }
-        }
+        self.provinces = PROVINCES
         
         self.full_graph.add_node(self.hub_node, type="hub")
+        self.zone_nodes = {}
         
         # Build Intra-Province
         for prov_name, data in self.provinces.items():
-            for p in data["petras"]:
+            # Market zones (e.g. 'kerys-aven') reuse the petra of the same name, else get their own node
+            petras = list(data["petras"])
+            for z in data["market_zones"]:
+                name = z.title()
+                if name not in petras:
+                    petras.append(name)
+                self.zone_nodes[f"{data['market_prefix']}-{z}"] = zone_node(prov_name, z)
+
+            for p in petras:
                 node_id = f"{prov_name}_{p}"
                 self.full_graph.add_node(node_id, type="petra", province=prov_name, name=p)
             
@@ -46,12 +57,12 @@ class PaxLogistics:
                 node_id = f"{prov_name}_Portal_{gp}"
                 self.full_graph.add_node(node_id, type="portal", province=prov_name, name=gp)
                 
-            for p in data["petras"]:
+            for p in petras:
                 p_id = f"{prov_name}_{p}"
                 for gp in all_portals:
                     gp_id = f"{prov_name}_Portal_{gp}"
-                    self.full_graph.add_edge(p_id, gp_id, weight=20)
-                    self.full_graph.add_edge(gp_id, p_id, weight=20)
+                    self.full_graph.add_edge(p_id, gp_id, weight=HOP_WEIGHT)
+                    self.full_graph.add_edge(gp_id, p_id, weight=HOP_WEIGHT)
 
         # Build Inter-Province
         frontier_map = [
@@ -63,8 +74,8 @@ class PaxLogistics:
         
         for p1, p2 in frontier_map:
             if self.full_graph.has_node(p1) and self.full_graph.has_node(p2):
-                self.full_graph.add_edge(p1, p2, weight=0)
-                self.full_graph.add_edge(p2, p1, weight=0)
+                self.full_graph.add_edge(p1, p2, weight=FRONTIER_WEIGHT)
+                self.full_graph.add_edge(p2, p1, weight=FRONTIER_WEIGHT)
 
         # Build PvP
         pvp_map = [
@@ -76,14 +87,104 @@ class PaxLogistics:
         
         for p1, hub in pvp_map:
             if self.full_graph.has_node(p1):
-                self.full_graph.add_edge(p1, hub, weight=0)
-                self.full_graph.add_edge(hub, p1, weight=0)
+                self.full_graph.add_edge(p1, hub, weight=GATE_WEIGHT)
+                self.full_graph.add_edge(hub, p1, weight=GATE_WEIGHT)
+
+    def _unsafe_nodes(self):
+        unsafe_nodes = [self.hub_node]
+        for n, data in self.full_graph.nodes(data=True):
+            if data.get("type") == "portal" and "Gate" in data.get("name", ""): 
+                unsafe_nodes.append(n)
+        return unsafe_nodes
+
+    def _graph_signature(self, unsafe_nodes):
+        edges = sorted((u, v, d.get("weight", 1)) for u, v, d in self.full_graph.edges(data=True))
+        payload = repr((sorted(self.full_graph.nodes()), edges, sorted(unsafe_nodes)))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _all_pairs(self, weights):
+        """
+        Floyd-Warshall over a dense weight matrix (inf = no edge).
+        pred[i, j] = node before j on the shortest i -> j path (-1 if unreachable).
+        """
+        n = len(weights)
+        dist = weights.copy()
+        np.fill_diagonal(dist, 0)
+        pred = np.where(np.isfinite(weights), np.arange(n)[:, None], -1)
+        np.fill_diagonal(pred, -1)
+
+        for k in range(n):
+            via = dist[:, k:k + 1] + dist[k:k + 1, :]
+            better = via < dist
+            dist = np.where(better, via, dist)
+            pred = np.where(better, pred[k:k + 1, :], pred)
+        return dist, pred
+
+    def _build_routing_tables(self):
+        """All-pairs distances + predecessors for the full and safe graphs, cached to disk."""
+        self.nodes = sorted(self.full_graph.nodes())
+        self.node_index = {n: i for i, n in enumerate(self.nodes)}
+        self.petra_index = {
+            data.get("name"): node for node, data in self.full_graph.nodes(data=True)
+            if data.get("type") == "petra"
+        }
+        unsafe_nodes = self._unsafe_nodes()
+        signature = self._graph_signature(unsafe_nodes)
+
+        cache_file = os.path.join(self.cache_dir, "routing_tables.npz") if self.cache_dir else None
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with np.load(cache_file, allow_pickle=False) as data:
+                    if str(data["signature"]) == signature:
+                        self.tables = {
+                            "pvp": (data["pvp_dist"], data["pvp_pred"]),
+                            "safe": (data["safe_dist"], data["safe_pred"])
+                        }
+                        return
+            except Exception as e:
+                print(f"Routing cache unreadable, rebuilding: {e}")
+
+        weights = np.full((len(self.nodes), len(self.nodes)), np.inf)
+        for u, v, d in self.full_graph.edges(data=True):
+            weights[self.node_index[u], self.node_index[v]] = d.get("weight", 1)
+
+        safe_weights = weights.copy()
+        unsafe_idx = [self.node_index[n] for n in unsafe_nodes]
+        safe_weights[unsafe_idx, :] = np.inf
+        safe_weights[:, unsafe_idx] = np.inf
+
+        self.tables = {
+            "pvp": self._all_pairs(weights),
+            "safe": self._all_pairs(safe_weights)
+        }
+
+        if cache_file:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez(
+                cache_file,
+                signature=np.array(signature),
+                pvp_dist=self.tables["pvp"][0], pvp_pred=self.tables["pvp"][1],
+                safe_dist=self.tables["safe"][0], safe_pred=self.tables["safe"][1]
+            )
 
     def _resolve_node(self, partial_name):
-        for node, data in self.full_graph.nodes(data=True):
-            if data.get("type") == "petra" and data.get("name") == partial_name:
-                return node
-        return None
+        return self.petra_index.get(partial_name)
+
+    def _path(self, pred, i, j):
+        """Node names of the i -> j path, walked back through the predecessor matrix."""
+        path = [j]
+        while path[-1] != i:
+            path.append(pred[i, path[-1]])
+        return [self.nodes[n] for n in reversed(path)]
+
+    def _route(self, variant, start, end):
+        """(cost, path) from the precomputed tables in O(path length); (-1, []) if unreachable."""
+        dist, pred = self.tables[variant]
+        i, j = self.node_index[start], self.node_index[end]
+        if not np.isfinite(dist[i, j]):
+            return -1, []
+        cost = dist[i, j]
+        return (int(cost) if float(cost).is_integer() else float(cost)), self._path(pred, i, j)
 
     def compare_routes(self, origin, destination):
         start_node = self._resolve_node(origin)
@@ -92,29 +193,8 @@ class PaxLogistics:
         if not start_node or not end_node:
             return None
 
-        # PvP Route
-        try:
-            pvp_cost = nx.shortest_path_length(self.full_graph, start_node, end_node, weight="weight")
-            pvp_path = nx.shortest_path(self.full_graph, start_node, end_node, weight="weight")
-        except nx.NetworkXNoPath:
-            pvp_cost = -1
-            pvp_path = []
-
-        # Safe Route
-        unsafe_nodes = [self.hub_node]
-        for n, data in self.full_graph.nodes(data=True):
-            if data.get("type") == "portal" and "Gate" in data.get("name", ""): 
-                unsafe_nodes.append(n)
-        
-        safe_graph = self.full_graph.copy()
-        safe_graph.remove_nodes_from(unsafe_nodes)
-        
-        try:
-            safe_cost = nx.shortest_path_length(safe_graph, start_node, end_node, weight="weight")
-            safe_path = nx.shortest_path(safe_graph, start_node, end_node, weight="weight")
-        except nx.NetworkXNoPath:
-            safe_cost = -1
-            safe_path = []
+        pvp_cost, pvp_path = self._route("pvp", start_node, end_node)
+        safe_cost, safe_path = self._route("safe", start_node, end_node)
             
         return {
             "origin": origin,
@@ -123,18 +203,101 @@ class PaxLogistics:
             "pvp_route": {"cost": pvp_cost, "path": pvp_path}
         }
 
+    def route_many(self, pairs, safe=True):
+        """
+        Batch API: [(origin, destination), ...] -> DataFrame with cost and path per pair.
+        Costs are one fancy-indexing lookup (dist[src_idx, dst_idx]); paths are rebuilt from
+        the predecessor matrix. Unknown or unreachable pairs get Cost -1 and an empty path.
+        """
+        dist, pred = self.tables["safe" if safe else "pvp"]
+        pairs = list(pairs)
+        starts = [self._resolve_node(o) for o, _ in pairs]
+        ends = [self._resolve_node(d) for _, d in pairs]
+        known = np.array([bool(a and b) for a, b in zip(starts, ends)], dtype=bool)
+        src_idx = np.array([self.node_index[a] if k else 0 for a, k in zip(starts, known)], dtype=np.intp)
+        dst_idx = np.array([self.node_index[b] if k else 0 for b, k in zip(ends, known)], dtype=np.intp)
+
+        costs = dist[src_idx, dst_idx]
+        reachable = known & np.isfinite(costs)
+        costs = np.where(reachable, costs, -1)
+        if np.array_equal(costs, np.round(costs)):
+            costs = costs.astype(np.int64)
+
+        paths = [self._path(pred, i, j) if ok else [] for i, j, ok in zip(src_idx, dst_idx, reachable)]
+        return pd.DataFrame({
+            "Origin": [o for o, _ in pairs],
+            "Destination": [d for _, d in pairs],
+            "Cost": costs,
+            "Path": paths
+        }, columns=["Origin", "Destination", "Cost", "Path"])
+
+    def distance_matrix(self, safe=True):
+        """(node list, dist array) for the requested variant; inf = unreachable."""
+        dist, _ = self.tables["safe" if safe else "pvp"]
+        return self.nodes, dist
+
+    @property
+    def market_zones(self):
+        return sorted(self.zone_nodes)
+
+    def zone_codes(self, zones):
+        """Market zone strings (Series/array) -> index into zone_distance_matrix (-1 if unknown)."""
+        return pd.Categorical(zones, categories=self.market_zones).codes
+
+    def zone_distance_matrix(self, safe=True):
+        """
+        Zone x zone route weights (rows/cols follow market_zones), sliced from the node tables.
+        Coarse by construction: every province is a uniform star (each petra/zone is one hop from
+        each portal), so the safe matrix takes the values {0, 40, 60, 120} (same zone, same
+        province, neighbouring province, two provinces away) and the PvP one {0, 40, 60}.
+        Distances within a province are all equal.
+        """
+        variant = "safe" if safe else "pvp"
+        if not hasattr(self, "_zone_matrices"):
+            self._zone_matrices = {}
+        if variant not in self._zone_matrices:
+            idx = [self.node_index[self.zone_nodes[z]] for z in self.market_zones]
+            self._zone_matrices[variant] = self.tables[variant][0][np.ix_(idx, idx)]
+        return self._zone_matrices[variant]
+
+    def travel_costs(self, from_zones, to_zones, safe=True, rate=TRAVEL_COST_PER_WEIGHT):
+        """
+        Vectorized per-unit travel cost in gold for aligned arrays of origin/destination zones.
+        Unknown or unreachable zones get the worst known cost (pessimistic on purpose).
+        """
+        matrix = self.zone_distance_matrix(safe)
+        worst = matrix[np.isfinite(matrix)].max()
+        a = np.asarray(self.zone_codes(from_zones))
+        b = np.asarray(self.zone_codes(to_zones))
+        known = (a >= 0) & (b >= 0)
+
+        costs = np.full(len(a), worst, dtype=float)
+        costs[known] = matrix[a[known], b[known]]
+        costs[~np.isfinite(costs)] = worst
+        return costs * rate
+
 class ArbitrageFinder:
-    def __init__(self, data_dir):
+    def __init__(self, data_dir, logistics=None):
+        self.data_dir = data_dir
         self.listings_file = os.path.join(data_dir, "selene_latest.parquet")
         self.liquidity_file = os.path.join(data_dir, "liquidez_diaria.csv")
+        self._logistics = logistics
+
+    @property
+    def logistics(self):
+        if self._logistics is None:
+            self._logistics = PaxLogistics(cache_dir=os.path.join(self.data_dir, "cache"))
+        return self._logistics
 
-    def find_opportunities(self, budget=2000.0, min_margin=15.0):
+    def find_opportunities(self, budget=2000.0, min_margin=15.0, travel_rate=TRAVEL_COST_PER_WEIGHT, safe=True):
         if not os.path.exists(self.listings_file) or not os.path.exists(self.liquidity_file):
             return pd.DataFrame()
 
         df_listings = pd.read_parquet(self.listings_file)
         df_liquidity = pd.read_csv(self.liquidity_file)
-        
+        return self._score_listings(df_listings, df_liquidity, budget, min_margin, travel_rate, safe)
+
+    def _score_listings(self, df_listings, df_liquidity, budget, min_margin, travel_rate, safe):
         # Merge Liquidity Data
         # We need 'Units_Sold' (Daily Volume) to weight the opportunity
         active_liquidity = df_liquidity[df_liquidity['Units_Sold'] > 0].copy()
@@ -158,10 +321,15 @@ class ArbitrageFinder:
         # Budget Filter
         df_opps = df_merged[df_merged[price_col] <= budget].copy()
         df_opps['Buy_Price'] = df_opps[price_col]
+        df_opps['Buy_Zone'] = df_opps['Zone']
+        
+        # Travel from the listing's zone to where the item sells most (one vectorized lookup)
+        df_opps['Travel_Cost'] = self.logistics.travel_costs(
+            df_opps['Buy_Zone'], df_opps['Top_Zone'], safe=safe, rate=travel_rate)
         
         # Smart Profit Calculation
-        # Profit per unit
-        df_opps['Unit_Profit'] = df_opps['Avg_Sale_Price'] - df_opps['Buy_Price']
+        # Profit per unit (net of travel)
+        df_opps['Unit_Profit'] = df_opps['Avg_Sale_Price'] - df_opps['Buy_Price'] - df_opps['Travel_Cost']
         df_opps['Margin'] = (df_opps['Unit_Profit'] / df_opps['Buy_Price']) * 100
         
         # Smart Score: Unit Profit * min(Stock, Daily_Volume)
@@ -185,3 +353,373 @@ class ArbitrageFinder:
         
         # Sort by Score (Volume * Profit) instead of Margin
         return valid.sort_values(by='Score', ascending=False)
+
+    def allocate_budget(self, budget=2000.0, min_margin=15.0, travel_rate=TRAVEL_COST_PER_WEIGHT, safe=True, days_of_demand=1.0):
+        """
+        Executable buy list for a total budget (fractional knapsack over listing stacks).
+        1. Per item, listings are walked best profit/gold first and their Amount is clipped
+           so the item never exceeds its expected demand (Units_Sold x days_of_demand).
+        2. All surviving units are sorted by profit/gold and the budget is filled with one
+           cumsum + searchsorted; only the last listing is bought partially.
+        """
+        if not os.path.exists(self.listings_file) or not os.path.exists(self.liquidity_file):
+            return pd.DataFrame()
+
+        df_listings = pd.read_parquet(self.listings_file)
+        df_liquidity = pd.read_csv(self.liquidity_file)
+        valid = self._score_listings(df_listings, df_liquidity, budget, min_margin, travel_rate, safe)
+        if valid.empty:
+            return pd.DataFrame()
+
+        item_codes = pd.Categorical(valid['Item']).codes
+        price = valid['Buy_Price'].to_numpy(dtype=float)
+        amount = valid['Amount'].to_numpy(dtype=float) if 'Amount' in valid.columns else np.ones(len(valid))
+        profit = valid['Unit_Profit'].to_numpy(dtype=float)
+        cap = valid['Units_Sold'].to_numpy(dtype=float) * days_of_demand
+        ratio = profit / price
+
+        # 1. Demand cap: units already taken by better listings of the same item
+        order = np.lexsort((-ratio, item_codes))
+        codes, amt = item_codes[order], amount[order]
+        is_start = np.r_[True, codes[1:] != codes[:-1]]
+        before = np.cumsum(amt) - amt
+        before -= before[np.flatnonzero(is_start)][np.cumsum(is_start) - 1]
+        units = np.empty(len(valid))
+        units[order] = np.clip(cap[order] - before, 0, amt)
+
+        # 2. Fractional knapsack on profit per gold
+        order = np.argsort(-ratio, kind='stable')
+        order = order[units[order] > 0]
+        if len(order) == 0:
+            return pd.DataFrame()
+        cum_cost = np.cumsum(units[order] * price[order])
+        k = np.searchsorted(cum_cost, budget, side='right')
+
+        take = units[order].copy()
+        take[k:] = 0
+        if k < len(order):
+            spent = cum_cost[k - 1] if k > 0 else 0.0
+            take[k] = np.floor((budget - spent) / price[order[k]])
+
+        picked = order[take > 0]
+        take = take[take > 0]
+        if len(picked) == 0:
+            return pd.DataFrame()
+
+        plan = valid.iloc[picked]
+        cols = ['Item', 'Buy_Zone', 'Buy_Price', 'Top_Zone', 'Travel_Cost', 'Unit_Profit', 'Margin']
+        if 'ListingID' in plan.columns:
+            cols.append('ListingID')
+        plan = plan[cols].rename(columns={'Top_Zone': 'Sell_Zone'}).reset_index(drop=True)
+        plan.insert(3, 'Units', take.astype(int))
+        plan.insert(4, 'Cost', take * price[picked])
+        plan['Profit'] = take * profit[picked]
+        return plan
+
+    def build_zone_matrices(self, df_listings, df_sold=None):
+        """
+        Item x zone matrices from one grouped pivot of the current listings:
+        best ask, depth (units listed), zone median, regional median and churn (units sold).
+        Columns follow logistics.market_zones.
+        """
+        price_col = 'UnitPrice' if 'UnitPrice' in df_listings.columns else 'Price'
+        df = df_listings[['Item', 'Zone', price_col, 'Amount']].rename(columns={price_col: 'Unit_Price'})
+        df = df.assign(ZoneCode=self.logistics.zone_codes(df['Zone']))
+        df = df[df['ZoneCode'] >= 0]
+
+        items = pd.Categorical(df['Item'])
+        df = df.assign(ItemCode=items.codes)
+        n_items, n_zones = len(items.categories), len(self.logistics.market_zones)
+
+        cells = df.groupby(['ItemCode', 'ZoneCode']).agg(
+            Best_Ask=('Unit_Price', 'min'),
+            Depth=('Amount', 'sum'),
+            Median=('Unit_Price', 'median')
+        ).reset_index()
+        i, z = cells['ItemCode'].to_numpy(), cells['ZoneCode'].to_numpy()
+
+        best_ask = np.full((n_items, n_zones), np.inf)
+        depth = np.zeros((n_items, n_zones))
+        zone_median = np.full((n_items, n_zones), np.nan)
+        best_ask[i, z] = cells['Best_Ask'].to_numpy()
+        depth[i, z] = cells['Depth'].to_numpy()
+        zone_median[i, z] = cells['Median'].to_numpy()
+
+        # Regional median (item x region) broadcast back onto every zone of the region
+        regions, zone_region = np.unique(
+            ZONE_TABLE.loc[self.logistics.market_zones, 'Region'].to_numpy(), return_inverse=True)
+        df = df.assign(RegionCode=zone_region[df['ZoneCode'].to_numpy()])
+        regional = df.groupby(['ItemCode', 'RegionCode'])['Unit_Price'].median()
+        by_region = np.full((n_items, len(regions)), np.nan)
+        by_region[regional.index.get_level_values(0), regional.index.get_level_values(1)] = regional.to_numpy()
+        regional_median = by_region[:, zone_region]
+
+        churn = np.zeros((n_items, n_zones))
+        if df_sold is not None and not df_sold.empty:
+            sold = df_sold.assign(
+                ItemCode=pd.Categorical(df_sold['Item'], categories=items.categories).codes,
+                ZoneCode=self.logistics.zone_codes(df_sold['Zone']))
+            sold = sold[(sold['ItemCode'] >= 0) & (sold['ZoneCode'] >= 0)]
+            units = sold.groupby(['ItemCode', 'ZoneCode'])['Amount'].sum()
+            churn[units.index.get_level_values(0), units.index.get_level_values(1)] = units.to_numpy()
+
+        return {
+            'items': np.asarray(items.categories),
+            'best_ask': best_ask,
+            'depth': depth,
+            'zone_median': zone_median,
+            'regional_median': regional_median,
+            'churn': churn
+        }
+
+    def find_zone_spreads(self, top_k=50, min_margin=15.0, travel_rate=TRAVEL_COST_PER_WEIGHT, safe=True):
+        """
+        Buy in zone A at the best ask, sell in zone B at B's regional median, net of travel A->B.
+        Every (item, A, B) triple is evaluated with array ops; quantity is capped by the
+        depth in A and the churn in B. Top-K by score (profit x quantity) via heap selection.
+        """
+        if not os.path.exists(self.listings_file):
+            return pd.DataFrame()
+
+        df_listings = pd.read_parquet(self.listings_file)
+        df_sold = MarketAnalyzer(self.data_dir).sold_listings()
+        m = self.build_zone_matrices(df_listings, df_sold)
+
+        # Only items that trade somewhere and are listed somewhere
+        active = (m['churn'].sum(axis=1) > 0) & np.isfinite(m['best_ask']).any(axis=1)
+        rows = np.flatnonzero(active)
+        if len(rows) == 0:
+            return pd.DataFrame()
+
+        ask = m['best_ask'][rows][:, :, None]               # (I, A, 1)
+        sell = m['regional_median'][rows][:, None, :]       # (I, 1, B)
+        travel = self.logistics.zone_distance_matrix(safe) * travel_rate
+        travel = np.where(np.isfinite(travel), travel, np.inf)[None, :, :]
+
+        with np.errstate(invalid='ignore'):
+            unit_profit = sell - ask - travel                # (I, A, B)
+            margin = unit_profit / ask * 100
+            qty = np.minimum(m['depth'][rows][:, :, None], m['churn'][rows][:, None, :])
+            score = unit_profit * qty
+
+        n_zones = travel.shape[1]
+        off_diagonal = ~np.eye(n_zones, dtype=bool)[None, :, :]
+        ok = (unit_profit > 0) & (margin >= min_margin) & (qty > 0) & off_diagonal
+        cand = np.flatnonzero(ok)
+        if len(cand) == 0:
+            return pd.DataFrame()
+
+        flat_scores = score.ravel()[cand]
+        top = heapq.nlargest(top_k, zip(flat_scores, cand))
+        picks = np.array([c for _, c in top], dtype=np.int64)
+        i, a, b = np.unravel_index(picks, score.shape)
+
+        zones = np.asarray(self.logistics.market_zones)
+        return pd.DataFrame({
+            'Item': m['items'][rows[i]],
+            'Buy_Zone': zones[a],
+            'Sell_Zone': zones[b],
+            'Buy_Price': ask[i, a, 0],
+            'Sell_Price': sell[i, 0, b],
+            'Depth': m['depth'][rows[i], a],
+            'Churn': m['churn'][rows[i], b],
+            'Travel_Cost': travel[0, a, b],
+            'Unit_Profit': unit_profit[i, a, b],
+            'Margin': margin[i, a, b],
+            'Qty': qty[i, a, b],
+            'Score': score[i, a, b]
+        })
+
+class TripPlanner:
+    """
+    Multi-stop buying trip for client orders.
+    1. Greedy zone selection: add the zone whose discounted listings save the most
+       (vs. server median) net of the cheapest insertion detour, until nothing pays.
+    2. Re-allocate demand to the cheapest listings among the chosen zones and drop empty stops.
+    3. Order the stops with 2-opt, separately for the safe and the PvP graph.
+    cost_per_weight is gold per route weight per unit carried (TRAVEL_COST_PER_WEIGHT); during
+    selection every detour is charged for the whole order, the summary for the units bought.
+    """
+    def __init__(self, logistics, df_listings, cost_per_weight=TRAVEL_COST_PER_WEIGHT):
+        self.logistics = logistics
+        self.cost_per_weight = cost_per_weight
+        price_col = 'UnitPrice' if 'UnitPrice' in df_listings.columns else 'Price'
+        df = df_listings[['Item', 'Zone', price_col, 'Amount']].rename(columns={price_col: 'Unit_Price'})
+        self.listings = df[self.logistics.zone_codes(df['Zone']) >= 0]
+        self.zones = self.logistics.market_zones
+        self.zone_pos = {z: i for i, z in enumerate(self.zones)}
+
+    @staticmethod
+    def parse_orders(df_orders, default_qty=10):
+        """client_orders.csv -> {item: qty}. Non-numeric quantities ('Boxes', blank) use default_qty."""
+        qty = pd.to_numeric(df_orders['Quantity'], errors='coerce').fillna(default_qty)
+        demand = qty.groupby(df_orders['Item']).sum()
+        return {item: int(q) for item, q in demand.items() if q > 0}
+
+    def parse_price_caps(self, df_orders):
+        """
+        client_orders.csv Target_Price -> {item: unit price cap}. '14.00/Stack' is divided by the
+        item's stack size (largest listed Amount); plain numbers are per unit. 'Market', blanks and
+        unknown units ('/Box') leave the item at the server median. Several orders keep the lowest cap.
+        """
+        if 'Target_Price' not in df_orders.columns:
+            return {}
+        parts = df_orders['Target_Price'].astype(str).str.extract(r'^\s*([\d.,]+)\s*(?:/\s*(\w+))?\s*$')
+        price = pd.to_numeric(parts[0].str.replace(',', ''), errors='coerce')
+        unit = parts[1].str.lower().fillna('unit')
+        stack_size = df_orders['Item'].map(self.listings.groupby('Item')['Amount'].max())
+
+        per = pd.Series(np.nan, index=df_orders.index)
+        per[unit.isin(['unit', 'each'])] = 1.0
+        per[unit == 'stack'] = stack_size[unit == 'stack']
+        caps = (price / per).groupby(df_orders['Item']).min().dropna()
+        return {item: float(cap) for item, cap in caps.items() if cap > 0}
+
+    def _candidates(self, demand, max_price=None):
+        df = self.listings[self.listings['Item'].isin(list(demand))]
+        medians = df.groupby('Item')['Unit_Price'].median()
+        caps = medians if max_price is None else medians.clip(upper=pd.Series(max_price)).fillna(medians)
+        df = df.assign(Cap=df['Item'].map(caps))
+        df = df[df['Unit_Price'] <= df['Cap']].sort_values(['Item', 'Unit_Price'])
+        df['Saving'] = df['Cap'] - df['Unit_Price']
+
+        books = {}
+        for (zone, item), g in df.groupby(['Zone', 'Item'], sort=False):
+            books[(zone, item)] = g[['Unit_Price', 'Amount', 'Saving']].to_numpy()
+        return books
+
+    @staticmethod
+    def _walk(book, qty):
+        """Fills qty from a sorted (price, amount, saving) book -> [(price, take, saving)]."""
+        fills = []
+        for price, amount, saving in book:
+            if qty <= 0:
+                break
+            take = min(qty, int(amount))
+            fills.append((price, take, saving))
+            qty -= take
+        return fills
+
+    def _zone_value(self, zone, remaining, books):
+        value = 0.0
+        for item, qty in remaining.items():
+            book = books.get((zone, item))
+            if qty > 0 and book is not None:
+                value += sum(saving * take for _, take, saving in self._walk(book, qty))
+        return value
+
+    def _tour_weight(self, tour, dist):
+        return sum(dist[self.zone_pos[a], self.zone_pos[b]] for a, b in zip(tour, tour[1:]))
+
+    def _insertion(self, tour, zone, dist):
+        """Cheapest position and extra weight to insert zone into the (open) tour."""
+        if not tour:
+            return 0, 0.0
+        z = self.zone_pos[zone]
+        best_pos = len(tour)
+        best_cost = dist[self.zone_pos[tour[-1]], z]
+        for i in range(1, len(tour)):
+            a, b = self.zone_pos[tour[i - 1]], self.zone_pos[tour[i]]
+            extra = dist[a, z] + dist[z, b] - dist[a, b]
+            if extra < best_cost:
+                best_pos, best_cost = i, extra
+        return best_pos, best_cost
+
+    def _two_opt(self, tour, dist, fixed_start):
+        best = list(tour)
+        first = 1 if fixed_start else 0
+        improved = True
+        while improved:
+            improved = False
+            for i in range(first, len(best) - 1):
+                for j in range(i + 1, len(best)):
+                    candidate = best[:i] + best[i:j + 1][::-1] + best[j + 1:]
+                    if self._tour_weight(candidate, dist) < self._tour_weight(best, dist) - 1e-9:
+                        best = candidate
+                        improved = True
+        return best
+
+    def plan(self, demand, start_zone=None, prefer_safe=True, max_price=None):
+        """
+        demand: {item: qty}. max_price: optional {item: unit price cap} (defaults to server median).
+        Returns (buy list DataFrame, summary dict).
+        """
+        books = self._candidates(demand, max_price)
+        dist = self.logistics.zone_distance_matrix(safe=prefer_safe)
+        if start_zone is not None and start_zone not in self.zone_pos:
+            start_zone = None
+
+        tour = [start_zone] if start_zone else []
+        remaining = dict(demand)
+        load = sum(demand.values())
+        candidate_zones = {zone for zone, _ in books}
+
+        # 1. Greedy selection with cheapest insertion
+        while candidate_zones and any(q > 0 for q in remaining.values()):
+            best = None
+            for zone in candidate_zones:
+                value = self._zone_value(zone, remaining, books)
+                if value <= 0:
+                    continue
+                pos, extra = self._insertion(tour, zone, dist)
+                net = value - extra * self.cost_per_weight * load
+                if net > 0 and (best is None or net > best[0]):
+                    best = (net, zone, pos)
+            if best is None:
+                break
+            _, zone, pos = best
+            if zone not in tour:
+                tour.insert(pos, zone)
+            candidate_zones.discard(zone)
+            for item in remaining:
+                book = books.get((zone, item))
+                if book is not None:
+                    remaining[item] -= sum(take for _, take, _ in self._walk(book, remaining[item]))
+
+        # 2. Re-allocate each item to the cheapest listings among the chosen stops
+        # (start_zone included: the greedy loop may have counted its listings against `remaining`)
+        chosen = list(tour)
+        rows = []
+        for item, qty in demand.items():
+            offers = []
+            for zone in chosen:
+                book = books.get((zone, item))
+                if book is not None:
+                    offers.extend((price, int(amount), zone) for price, amount, _ in book)
+            offers.sort()
+            for price, amount, zone in offers:
+                if qty <= 0:
+                    break
+                take = min(qty, amount)
+                rows.append({'Zone': zone, 'Item': item, 'Qty': take, 'Unit_Price': price, 'Cost': take * price})
+                qty -= take
+
+        buys = pd.DataFrame(rows, columns=['Zone', 'Item', 'Qty', 'Unit_Price', 'Cost'])
+        used = set(buys['Zone'])
+        stops = [z for z in tour if z in used or z == start_zone]
+
+        # 3. Order stops on both graphs
+        routes = {}
+        for variant, safe in (("safe", True), ("pvp", False)):
+            d = self.logistics.zone_distance_matrix(safe=safe)
+            order = self._two_opt(stops, d, fixed_start=start_zone is not None)
+            routes[variant] = {'stops': order, 'weight': float(self._tour_weight(order, d))}
+
+        chosen_variant = "safe" if prefer_safe else "pvp"
+        stop_order = {z: i for i, z in enumerate(routes[chosen_variant]['stops'])}
+        if not buys.empty:
+            buys['Stop'] = buys['Zone'].map(stop_order)
+            buys = buys.sort_values(['Stop', 'Item', 'Unit_Price']).reset_index(drop=True)
+
+        filled = buys.groupby('Item')['Qty'].sum() if not buys.empty else pd.Series(dtype=float)
+        summary = {
+            'route': chosen_variant,
+            'stops': routes[chosen_variant]['stops'],
+            'safe_weight': routes['safe']['weight'],
+            'pvp_weight': routes['pvp']['weight'],
+            'pvp_stops': routes['pvp']['stops'],
+            'purchase_cost': float(buys['Cost'].sum()) if not buys.empty else 0.0,
+            'travel_cost': routes[chosen_variant]['weight'] * self.cost_per_weight * float(buys['Qty'].sum() if not buys.empty else 0),
+            'fill': {item: (int(filled.get(item, 0)), qty) for item, qty in demand.items()}
+        }
+        return buys, summary
@@ -1,8 +1,63 @@
 
+import numpy as np
 import pandas as pd
 import os
 import glob
-from datetime import datetime
+
+from modules.history import get_loader
+from modules.zones import annotate_zones
+
+def summarize_sold(sold_df):
+    """
+    Liquidity table from sold listings (gone between two snapshots): Units_Sold, Total_Volume
+    and the zone with most sales per item. Shared by check_liquidity(), the views and the watcher,
+    so every consumer scores arbitrage against the same live demand.
+    """
+    if sold_df.empty:
+        return pd.DataFrame()
+
+    if 'Amount' in sold_df.columns:
+        liquidity_stats = sold_df.groupby('Item').agg(
+            Units_Sold=('Amount', 'sum'),
+            Total_Volume=('Price', 'sum')
+        ).reset_index()
+    else:
+        liquidity_stats = sold_df.groupby('Item').agg(
+            Units_Sold=('ListingID', 'count'),
+            Total_Volume=('Price', 'sum')
+        ).reset_index()
+
+    # Top Zone
+    zone_stats = sold_df.groupby(['Item', 'Zone']).size().reset_index(name='Zone_Count')
+    zone_stats = zone_stats.sort_values(['Item', 'Zone_Count'], ascending=[True, False])
+    top_zones = zone_stats.drop_duplicates(subset=['Item'])[['Item', 'Zone', 'Zone_Count']]
+    top_zones.columns = ['Item', 'Top_Zone', 'Top_Zone_Sales']
+
+    liquidity_stats = liquidity_stats.merge(top_zones, on='Item', how='left')
+    return liquidity_stats.sort_values(by='Units_Sold', ascending=False)
+
+def find_bargains(df, discount=0.0, zones=None):
+    """
+    Bargain rule (check_trip_bargains / watch): listings more than `discount`% below the median
+    unit price of their item in Kerys OR on the whole server. Medians use every zone in df;
+    `zones` only restricts the listings returned. Adds Ref_Kerys (NaN if Kerys has no listing),
+    Ref_Server and Discount (against the higher of the two references).
+    """
+    if df.empty:
+        return df.assign(Ref_Kerys=pd.Series(dtype=float), Ref_Server=pd.Series(dtype=float),
+                         Discount=pd.Series(dtype=float))
+    price = df['UnitPrice']
+    in_kerys = annotate_zones(df[['Zone']].copy())['Region'] == 'Kerys'
+    ref_server = price.groupby(df['Item']).transform('median')
+    ref_kerys = price.where(in_kerys).groupby(df['Item']).transform('median')
+
+    factor = 1 - discount / 100.0
+    deal = (price < ref_kerys * factor) | (price < ref_server * factor)
+    if zones:
+        deal &= df['Zone'].isin(list(zones))
+    reference = np.fmax(ref_kerys[deal], ref_server[deal])
+    return df[deal].assign(Ref_Kerys=ref_kerys[deal], Ref_Server=ref_server[deal],
+                           Discount=(1 - price[deal] / reference) * 100)
 
 class MarketAnalyzer:
     def __init__(self, data_dir):
@@ -10,39 +65,25 @@ class MarketAnalyzer:
         self.history_dir = os.path.join(data_dir, "history")
         self.listings_file = os.path.join(data_dir, "selene_latest.parquet")
 
-    def load_all_history(self):
-        """Loads all parquet files from history into a single dataframe with a Date column."""
-        search_path = os.path.join(self.history_dir, "**", "*.parquet")
-        files = glob.glob(search_path, recursive=True)
-        
-        if not files:
-            return pd.DataFrame()
-            
-        dfs = []
-        for f in files:
-            try:
-                # Extract date from filename: market_YYYY-MM-DD_HH-MM.parquet
-                basename = os.path.basename(f)
-                timestamp_str = basename.replace("market_", "").replace(".parquet", "")
-                try:
-                    snapshot_date = datetime.strptime(timestamp_str, "%Y-%m-%d_%H-%M")
-                except ValueError:
-                    snapshot_date = datetime.fromtimestamp(os.path.getmtime(f))
-                
-                df = pd.read_parquet(f)
-                df['SnapshotDate'] = snapshot_date
-                dfs.append(df)
-            except Exception as e:
-                print(f"Skipping {f}: {e}")
-                
-        if not dfs:
+    def load_recent_history(self, days=3, columns=None):
+        """
+        Loads only the snapshots of the last N calendar days (HistoryLoader.day_window), anchored
+        on the newest snapshot (not on 'now', so an old dataset still yields a window).
+        """
+        loader = get_loader(self.data_dir)
+        since, until = loader.day_window(days)
+        if until is None:
             return pd.DataFrame()
-            
-        return pd.concat(dfs, ignore_index=True)
+        return loader.load(since=since, until=until, columns=columns, tag=False)
+
+    def load_all_history(self):
+        """Loads all parquet files from history into a single dataframe with a SnapshotDate column."""
+        return get_loader(self.data_dir).load(tag=False)
 
-    def get_item_history(self, item_name):
-        """Analyzes a specific item across snapshots."""
-        full_df = self.load_all_history()
+    def get_item_history(self, item_name, full_df=None):
+        """Analyzes a specific item across snapshots (full_df: preloaded load_all_history())."""
+        if full_df is None:
+            full_df = self.load_all_history()
         if full_df.empty:
             return None
 
@@ -94,8 +135,8 @@ class MarketAnalyzer:
             
         return stats
 
-    def check_liquidity(self):
-        """Compares the last two snapshots to find sold items (churn)."""
+    def sold_listings(self):
+        """Listings present in the previous snapshot and gone from the latest (None if < 2 snapshots)."""
         search_path = os.path.join(self.history_dir, "**", "*.parquet")
         files = glob.glob(search_path, recursive=True)
         files.sort()
@@ -116,37 +157,19 @@ class MarketAnalyzer:
         new_ids = set(df_new['ListingID'].dropna().unique())
         
         sold_ids = old_ids - new_ids
-        
-        if not sold_ids:
-            return pd.DataFrame()
-            
-        sold_df = df_old[df_old['ListingID'].isin(sold_ids)].copy()
-        
-        if 'Amount' in sold_df.columns:
-            liquidity_stats = sold_df.groupby('Item').agg(
-                Units_Sold=('Amount', 'sum'),
-                Total_Volume=('Price', 'sum')
-            ).reset_index()
-        else:
-            liquidity_stats = sold_df.groupby('Item').agg(
-                Units_Sold=('ListingID', 'count'),
-                Total_Volume=('Price', 'sum')
-            ).reset_index()
-
-        # Top Zone
-        zone_stats = sold_df.groupby(['Item', 'Zone']).size().reset_index(name='Zone_Count')
-        zone_stats = zone_stats.sort_values(['Item', 'Zone_Count'], ascending=[True, False])
-        top_zones = zone_stats.drop_duplicates(subset=['Item'])[['Item', 'Zone', 'Zone_Count']]
-        top_zones.columns = ['Item', 'Top_Zone', 'Top_Zone_Sales']
-        
-        liquidity_stats = liquidity_stats.merge(top_zones, on='Item', how='left')
-        liquidity_stats = liquidity_stats.sort_values(by='Units_Sold', ascending=False)
-        
-        return liquidity_stats
+        return df_old[df_old['ListingID'].isin(sold_ids)].copy()
 
-    def get_producer_stats(self, item_name):
+    def check_liquidity(self):
+        """Compares the last two snapshots to find sold items (churn)."""
+        sold_df = self.sold_listings()
+        if sold_df is None:
+            return None
+        return summarize_sold(sold_df)
+
+    def get_producer_stats(self, item_name, full_df=None):
         """Finds zones with the most unique sellers for an item."""
-        full_df = self.load_all_history()
+        if full_df is None:
+            full_df = self.load_all_history()
         if full_df.empty:
             return None
             
@@ -199,16 +222,21 @@ class MarketAnalyzer:
         
         return stats.sort_values('Total_Stock', ascending=False)
 
-    def search_items(self, query):
-        """Search for items matching the query in the latest snapshot."""
+    def item_names(self):
+        """Unique item names in the latest snapshot."""
         if not os.path.exists(self.listings_file):
             return []
+        df = pd.read_parquet(self.listings_file, columns=['Item'])
+        return list(df['Item'].dropna().unique())
+
+    def search_items(self, query, unique_items=None):
+        """Search for items matching the query in the latest snapshot (unique_items: preloaded item_names())."""
+        if unique_items is None and not os.path.exists(self.listings_file):
+            return []
             
         try:
-            # We only need unique Item names. Reading entire file is heavy but OK for now.
-            # Optimization: Cache this.
-            df = pd.read_parquet(self.listings_file, columns=['Item'])
-            unique_items = df['Item'].dropna().unique()
+            if unique_items is None:
+                unique_items = self.item_names()
             
             # Simple substring match
             matches = [item for item in unique_items if query.lower() in item.lower()]
@@ -0,0 +1,191 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+# Prometheus-style latency buckets (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+class RouteMetrics:
+    """
+    Per-route latency: cumulative histogram buckets (+sum/count) for Prometheus and a
+    sliding window of recent samples for exact p50/p95/p99.
+    """
+    def __init__(self, window=2000):
+        self.window = window
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def observe(self, method, route, status, seconds):
+        key = (method, route, f"{status // 100}xx")
+        with self.lock:
+            entry = self.routes.get(key)
+            if entry is None:
+                entry = self.routes[key] = {
+                    'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0,
+                    'recent': deque(maxlen=self.window)
+                }
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry['buckets'][i] += 1
+            entry['count'] += 1
+            entry['sum'] += seconds
+            entry['recent'].append(seconds)
+
+    def snapshot(self):
+        """[(method, route, status, buckets, count, sum, {quantile: seconds})]"""
+        with self.lock:
+            items = [(k, list(v['buckets']), v['count'], v['sum'], sorted(v['recent'])) for k, v in self.routes.items()]
+        rows = []
+        for (method, route, status), buckets, count, total, recent in items:
+            quantiles = {q: recent[min(int(q * len(recent)), len(recent) - 1)] for q in QUANTILES} if recent else {}
+            rows.append((method, route, status, buckets, count, total, quantiles))
+        return rows
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus(route_metrics, cache_stats, load_times):
+    """Text exposition format (version 0.0.4)."""
+    out = [
+        "# HELP paxdei_http_request_duration_seconds API request latency.",
+        "# TYPE paxdei_http_request_duration_seconds histogram"
+    ]
+    rows = route_metrics.snapshot()
+    for method, route, status, buckets, count, total, _ in rows:
+        labels = f'method="{method}",route="{_label(route)}",status="{status}"'
+        for bound, n in zip(BUCKETS, buckets):
+            out.append(f'paxdei_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {n}')
+        out.append(f'paxdei_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+        out.append(f"paxdei_http_request_duration_seconds_sum{{{labels}}} {total:.6f}")
+        out.append(f"paxdei_http_request_duration_seconds_count{{{labels}}} {count}")
+
+    out.append("# HELP paxdei_http_request_latency_seconds Latency quantiles over the last requests of each route.")
+    out.append("# TYPE paxdei_http_request_latency_seconds summary")
+    for method, route, status, _, count, total, quantiles in rows:
+        labels = f'method="{method}",route="{_label(route)}",status="{status}"'
+        for q, value in quantiles.items():
+            out.append(f'paxdei_http_request_latency_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+        # Quantiles cover the recent window; sum/count are cumulative, as Prometheus expects
+        out.append(f"paxdei_http_request_latency_seconds_sum{{{labels}}} {total:.6f}")
+        out.append(f"paxdei_http_request_latency_seconds_count{{{labels}}} {count}")
+
+    out.append("# HELP paxdei_cache_requests_total Snapshot cache lookups.")
+    out.append("# TYPE paxdei_cache_requests_total counter")
+    out.append(f'paxdei_cache_requests_total{{result="hit"}} {cache_stats["hits"]}')
+    out.append(f'paxdei_cache_requests_total{{result="miss"}} {cache_stats["misses"]}')
+    out.append("# HELP paxdei_cache_hit_ratio Snapshot cache hit ratio since start.")
+    out.append("# TYPE paxdei_cache_hit_ratio gauge")
+    out.append(f"paxdei_cache_hit_ratio {cache_stats['hit_rate']}")
+    out.append("# HELP paxdei_cache_entries Entries in the snapshot cache.")
+    out.append("# TYPE paxdei_cache_entries gauge")
+    out.append(f"paxdei_cache_entries {cache_stats['entries']}")
+    out.append("# HELP paxdei_cache_invalidations_total Cache drops caused by a new snapshot.")
+    out.append("# TYPE paxdei_cache_invalidations_total counter")
+    out.append(f"paxdei_cache_invalidations_total {cache_stats['invalidations']}")
+
+    out.append("# HELP paxdei_data_load_seconds Time spent loading/computing data on cache misses.")
+    out.append("# TYPE paxdei_data_load_seconds summary")
+    for name, (count, total) in sorted(load_times.items(), key=lambda x: str(x[0])):
+        out.append(f'paxdei_data_load_seconds_sum{{key="{_label(name)}"}} {total:.6f}')
+        out.append(f'paxdei_data_load_seconds_count{{key="{_label(name)}"}} {count}')
+
+    return "\n".join(out) + "\n"
+
+class SamplingProfiler:
+    """
+    Opt-in wall-clock sampler. Armed for a path prefix and a number of requests; while an
+    armed request runs, a thread samples the stacks of the worker threads every interval
+    and keeps those that pass through entry_file (server.py, i.e. an endpoint).
+    Results are collapsed stacks ("root;caller;leaf count"), ready for flamegraph.pl / speedscope.
+    Sync endpoints only (they run in the threadpool); concurrent requests to other routes
+    show up too, so profile on a quiet server.
+    """
+    def __init__(self, entry_file):
+        self.entry_file = os.path.abspath(entry_file)
+        self.lock = threading.Lock()
+        self.armed = {}      # path prefix -> {'remaining': n, 'interval': s}
+        self.results = {}    # path prefix -> Counter(stack -> samples)
+
+    def arm(self, path, requests=1, interval_ms=2):
+        with self.lock:
+            self.armed[path] = {'remaining': max(1, requests), 'interval': max(interval_ms, 0.5) / 1000.0}
+            self.results[path] = Counter()
+
+    def _claim(self, path):
+        with self.lock:
+            for prefix, spec in self.armed.items():
+                if path.startswith(prefix) and spec['remaining'] > 0:
+                    spec['remaining'] -= 1
+                    return prefix, spec['interval']
+        return None, None
+
+    def _frame_label(self, frame):
+        code = frame.f_code
+        # Function-level labels (first line, not the current one) so samples merge per function
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self, stop, counter, interval, exclude):
+        exclude = exclude | {threading.get_ident()}
+        while not stop.is_set():
+            for tid, frame in sys._current_frames().items():
+                if tid in exclude:
+                    continue
+                stack = []
+                in_endpoint = False
+                while frame is not None:
+                    stack.append(self._frame_label(frame))
+                    if frame.f_code.co_filename == self.entry_file:
+                        in_endpoint = True
+                    frame = frame.f_back
+                if in_endpoint:
+                    counter[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+
+    def profiling(self, path):
+        """Context manager for one request; a no-op unless the path is armed."""
+        return _ProfileSession(self, path)
+
+    def collapsed(self, path):
+        with self.lock:
+            counter = self.results.get(path)
+            if counter is None:
+                return None
+            return "\n".join(f"{stack} {n}" for stack, n in counter.most_common()) + "\n"
+
+    def status(self):
+        with self.lock:
+            return {
+                path: {'remaining': spec['remaining'], 'samples': sum(self.results.get(path, {}).values())}
+                for path, spec in self.armed.items()
+            }
+
+class _ProfileSession:
+    def __init__(self, profiler, path):
+        self.profiler = profiler
+        self.path = path
+        self.thread = None
+
+    def __enter__(self):
+        prefix, interval = self.profiler._claim(self.path)
+        if prefix is None:
+            return self
+        self.local = Counter()
+        self.prefix = prefix
+        self.stop = threading.Event()
+        self.thread = threading.Thread(
+            target=self.profiler._sample,
+            args=(self.stop, self.local, interval, {threading.get_ident()}),
+            daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+            with self.profiler.lock:
+                self.profiler.results[self.prefix].update(self.local)
+        return False
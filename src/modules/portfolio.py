@@ -0,0 +1,137 @@
+import heapq
+import numpy as np
+import pandas as pd
+
+class OrderBook:
+    """Ask side of one item: listings sorted by unit price, consumed in place."""
+    def __init__(self, prices, amounts, zones):
+        self.prices = prices
+        self.amounts = amounts
+        self.zones = zones
+        self.pos = 0
+        self.left = amounts[0] if len(amounts) else 0
+
+    def quote(self, qty):
+        """Cost of buying qty units right now (None if the book is too thin)."""
+        cost = 0.0
+        pos, left = self.pos, self.left
+        while qty > 0:
+            if pos >= len(self.prices):
+                return None
+            take = min(qty, left)
+            cost += take * self.prices[pos]
+            qty -= take
+            left -= take
+            if left <= 0:
+                pos += 1
+                left = self.amounts[pos] if pos < len(self.amounts) else 0
+        return cost
+
+    def take(self, qty):
+        """Consumes qty units and returns the zones they were bought in."""
+        zones = set()
+        while qty > 0 and self.pos < len(self.prices):
+            take = min(qty, self.left)
+            zones.add(self.zones[self.pos])
+            qty -= take
+            self.left -= take
+            if self.left <= 0:
+                self.pos += 1
+                self.left = self.amounts[self.pos] if self.pos < len(self.amounts) else 0
+        return zones
+
+class PortfolioOptimizer:
+    """
+    Capital-constrained crafting plan over the compiled catalog (integer item IDs).
+    Greedy by profit per gold with lazy re-evaluation: every recipe sits in a max-heap
+    keyed by its last known ratio. Buying ingredients only makes the shared order books
+    more expensive, so a stale ratio is an upper bound and we only re-quote the top.
+    """
+    def __init__(self, catalog, df_listings, sell_prices, demand_caps):
+        # sell_prices / demand_caps: arrays indexed by item ID
+        self.catalog = catalog
+        self.sell_prices = sell_prices
+        self.demand_caps = demand_caps
+        self.books = self._build_books(df_listings)
+
+    def _build_books(self, df):
+        price_col = 'UnitPrice' if 'UnitPrice' in df.columns else 'Price'
+        df = df[df['ItemID'] >= 0].sort_values(['ItemID', price_col], kind='stable')
+        prices = df[price_col].to_numpy()
+        amounts = df['Amount'].to_numpy() if 'Amount' in df.columns else np.ones(len(df), dtype=int)
+        zones = df['Zone'].to_numpy()
+
+        books = {}
+        for item_id, idx in df.groupby('ItemID', sort=False).indices.items():
+            books[item_id] = OrderBook(prices[idx], amounts[idx], zones[idx])
+        return books
+
+    def _quote_recipe(self, r):
+        total = 0.0
+        for item_id, qty in zip(*self.catalog.recipe(r)):
+            book = self.books.get(item_id)
+            if book is None:
+                return None
+            cost = book.quote(qty)
+            if cost is None:
+                return None
+            total += cost
+        return total
+
+    def optimize(self, budget):
+        heap = []
+        for r, pid in enumerate(self.catalog.products):
+            sell_price = self.sell_prices[pid]
+            if not sell_price > 0 or self.demand_caps[pid] <= 0:
+                continue
+            cost = self._quote_recipe(r)
+            if cost is None or cost <= 0 or cost >= sell_price:
+                continue
+            heapq.heappush(heap, (-(sell_price - cost) / cost, r))
+
+        plan = {}
+        remaining = budget
+        while heap and remaining > 0:
+            _, r = heapq.heappop(heap)
+            pid = self.catalog.products[r]
+            sell_price = self.sell_prices[pid]
+
+            cost = self._quote_recipe(r)
+            if cost is None or cost <= 0 or cost >= sell_price or cost > remaining:
+                # Books only get more expensive, so this recipe is done for good
+                continue
+
+            ratio = (sell_price - cost) / cost
+            if heap and ratio < -heap[0][0]:
+                heapq.heappush(heap, (-ratio, r))
+                continue
+
+            entry = plan.setdefault(r, {'qty': 0, 'cost': 0.0, 'zones': set()})
+            for item_id, qty in zip(*self.catalog.recipe(r)):
+                entry['zones'] |= self.books[item_id].take(qty)
+            entry['qty'] += 1
+            entry['cost'] += cost
+            remaining -= cost
+
+            if entry['qty'] < self.demand_caps[pid]:
+                heapq.heappush(heap, (-ratio, r))
+
+        rows = []
+        for r, entry in plan.items():
+            pid = self.catalog.products[r]
+            revenue = entry['qty'] * self.sell_prices[pid]
+            profit = revenue - entry['cost']
+            rows.append({
+                'Produto': str(self.catalog.item_names[pid]),
+                'Quantidade': entry['qty'],
+                'Custo_Total': round(entry['cost'], 2),
+                'Receita_Esperada': round(revenue, 2),
+                'Lucro_Esperado': round(profit, 2),
+                'Margem_Perc': round(profit / revenue * 100, 1) if revenue > 0 else 0,
+                'Zonas_Compra': ", ".join(sorted(entry['zones']))
+            })
+
+        if not rows:
+            return pd.DataFrame()
+
+        return pd.DataFrame(rows).sort_values(by='Lucro_Esperado', ascending=False)
@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import io
+import json
+from fastapi.responses import Response, StreamingResponse
+
+FORMATS = ("json", "ndjson", "arrow")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+class CursorError(ValueError):
+    pass
+
+def query_signature(*parts):
+    """Short hash of the query (sort/order/filters...) a cursor belongs to."""
+    return hashlib.sha1(json.dumps(parts, default=str).encode("utf-8")).hexdigest()[:12]
+
+def encode_cursor(offset, snapshot, signature):
+    payload = json.dumps({'o': offset, 's': snapshot, 'q': signature}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, snapshot, signature):
+    """
+    Returns the offset stored in the cursor. Cursors are bound to the snapshot and the
+    query they were issued for, so a page never mixes two snapshots.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset, cur_snapshot, cur_signature = int(data['o']), data['s'], data['q']
+    except (ValueError, KeyError, TypeError) as e:
+        raise CursorError(f"Invalid cursor: {e}")
+    if cur_snapshot != snapshot:
+        raise CursorError("Cursor expired: a new snapshot was loaded, restart from the first page.")
+    if cur_signature != signature:
+        raise CursorError("Cursor does not match this query.")
+    return offset
+
+def ndjson_stream(df, chunk_size=5000):
+    # Vectorized per chunk (DataFrame.to_json) instead of one dict per row
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size].to_json(orient="records", lines=True, date_format="iso")
+        if chunk and not chunk.endswith("\n"):
+            chunk += "\n"
+        yield chunk
+
+def arrow_bytes(df):
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def table_response(df, fmt="json", headers=None):
+    """Encodes a DataFrame page as a JSON list, an NDJSON stream or an Arrow IPC stream."""
+    headers = headers or {}
+    if fmt == "ndjson":
+        return StreamingResponse(ndjson_stream(df), media_type="application/x-ndjson", headers=headers)
+    if fmt == "arrow":
+        return Response(arrow_bytes(df), media_type=ARROW_MEDIA_TYPE, headers=headers)
+    # JSON encoded straight from the columns (no intermediate list of dicts)
+    return Response(df.to_json(orient="records", date_format="iso"), media_type="application/json", headers=headers)
+
+def arrow_stream(chunks, schema):
+    # IPC stream written batch by batch (the whole table is never buffered)
+    import pyarrow as pa
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(chunk)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+def arrow_table_response(chunks, schema, fmt="json", headers=None):
+    """table_response for a page of an Arrow table given as chunks (only JSON pages are concatenated)."""
+    headers = headers or {}
+    if fmt == "ndjson":
+        rows = (line for chunk in chunks for line in ndjson_stream(chunk.to_pandas()))
+        return StreamingResponse(rows, media_type="application/x-ndjson", headers=headers)
+    if fmt == "arrow":
+        return StreamingResponse(arrow_stream(chunks, schema), media_type=ARROW_MEDIA_TYPE, headers=headers)
+    import pyarrow as pa
+    df = pa.concat_tables([schema.empty_table(), *chunks]).to_pandas().fillna(0)
+    return Response(df.to_json(orient="records", date_format="iso"), media_type="application/json", headers=headers)
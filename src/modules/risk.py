@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+class MarginRiskEngine:
+    """
+    Monte Carlo on recipe margins.
+    Each scenario draws one historical daily log return per item (bootstrap, independent
+    per item) and shocks the base ask/sell prices with it. All recipes are then priced
+    under all scenarios at once through the catalog's CSR arrays.
+    """
+    def __init__(self, catalog, n_scenarios=2000, seed=None, block_size=500):
+        self.catalog = catalog
+        self.n_scenarios = n_scenarios
+        self.block_size = block_size
+        self.rng = np.random.default_rng(seed)
+        self.returns = None
+        self.offsets = None
+        self.counts = np.zeros(catalog.n_items, dtype=np.int64)
+
+    def fit(self, df_history):
+        """
+        df_history: listings with Item, UnitPrice and SnapshotDate.
+        Builds the per-item daily log-return pools (flat array + offsets, like the CSR catalog).
+        """
+        if df_history.empty:
+            self.returns = np.zeros(0)
+            self.offsets = np.zeros(self.catalog.n_items, dtype=np.int64)
+            return self
+
+        df = df_history[['Item', 'UnitPrice', 'SnapshotDate']].copy()
+        df['ItemID'] = self.catalog.encode(df['Item'])
+        df = df[(df['ItemID'] >= 0) & (df['UnitPrice'] > 0)]
+        df['Day'] = pd.to_datetime(df['SnapshotDate']).dt.normalize()
+
+        daily = df.groupby(['ItemID', 'Day'])['UnitPrice'].median().reset_index()
+        daily = daily.sort_values(['ItemID', 'Day'])
+        daily['LogRet'] = np.log(daily['UnitPrice']).groupby(daily['ItemID']).diff()
+        daily = daily.dropna(subset=['LogRet'])
+
+        counts = daily.groupby('ItemID').size()
+        self.counts[:] = 0
+        self.counts[counts.index.to_numpy()] = counts.to_numpy()
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+        self.returns = daily['LogRet'].to_numpy()
+        return self
+
+    def _sample_shocks(self, n):
+        """(n, n_items) multiplicative shocks; items without history stay at 1."""
+        u = self.rng.random((n, self.catalog.n_items))
+        picks = self.offsets + (u * self.counts).astype(np.int64)
+        has_history = self.counts > 0
+        shocks = np.ones((n, self.catalog.n_items))
+        if len(self.returns):
+            shocks[:, has_history] = np.exp(self.returns[picks[:, has_history]])
+        return shocks
+
+    def simulate(self, buy_prices, sell_prices):
+        """
+        buy_prices / sell_prices: arrays by item ID (NaN = unpriced).
+        Returns (recipe indices, margins[n_scenarios, n_valid_recipes]).
+        """
+        cat = self.catalog
+        lengths = np.diff(cat.indptr)
+        rows = np.repeat(np.arange(cat.n_recipes), lengths)
+
+        line_ok = ~np.isnan(buy_prices[cat.ingredients])
+        recipe_ok = np.bincount(rows, weights=~line_ok, minlength=cat.n_recipes) == 0
+        recipe_ok &= (lengths > 0) & (sell_prices[cat.products] > 0)
+        valid = np.flatnonzero(recipe_ok)
+        if len(valid) == 0:
+            return valid, np.zeros((self.n_scenarios, 0))
+
+        keep = recipe_ok[rows]
+        ingredients = cat.ingredients[keep]
+        quantities = cat.quantities[keep]
+        starts = np.concatenate([[0], np.cumsum(lengths[valid])[:-1]])
+        products = cat.products[valid]
+
+        base_buy = np.nan_to_num(buy_prices)
+        base_sell = np.nan_to_num(sell_prices)
+
+        margins = np.empty((self.n_scenarios, len(valid)))
+        for start in range(0, self.n_scenarios, self.block_size):
+            n = min(self.block_size, self.n_scenarios - start)
+            shocks = self._sample_shocks(n)
+            line_costs = (base_buy[ingredients] * shocks[:, ingredients]) * quantities
+            costs = np.add.reduceat(line_costs, starts, axis=1)
+            revenue = base_sell[products] * shocks[:, products]
+            margins[start:start + n] = revenue - costs
+
+        return valid, margins
+
+    def summarize(self, valid, margins):
+        names = self.catalog.item_names[self.catalog.products[valid]]
+        p5, p95 = np.percentile(margins, [5, 95], axis=0)
+        return pd.DataFrame({
+            'Produto': names,
+            'Margem_Esperada': np.round(margins.mean(axis=0), 2),
+            'Margem_P5': np.round(p5, 2),
+            'Margem_P95': np.round(p95, 2),
+            'Desvio_Padrao': np.round(margins.std(axis=0), 2),
+            'Prob_Prejuizo': np.round((margins < 0).mean(axis=0) * 100, 1)
+        })
@@ -0,0 +1,260 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from modules.market import MarketAnalyzer
+from modules.crafting import CraftingAnalyzer
+from modules.logistics import ArbitrageFinder, TRAVEL_COST_PER_WEIGHT
+
+# name -> default sort (column, descending)
+VIEWS = {
+    'liquidity': ('Units_Sold', True),
+    'crafting': ('Spread', True),
+    'arbitrage': ('Score', True)
+}
+
+# name -> (row key, rows in the default API page, one row per key): what the dashboard loads,
+# and what the live feed diffs between two versions
+PAGES = {
+    'liquidity': ('Item', 50, False),
+    'crafting': ('Produto', 20, False),
+    'arbitrage': ('Item', 20, True)
+}
+
+FILTER_OPS = {
+    'eq': lambda s, v: s.astype(str) == v,
+    'ne': lambda s, v: s.astype(str) != v,
+    'contains': lambda s, v: s.astype(str).str.contains(v, case=False, regex=False, na=False),
+    'gt': lambda s, v: s > float(v),
+    'gte': lambda s, v: s >= float(v),
+    'lt': lambda s, v: s < float(v),
+    'lte': lambda s, v: s <= float(v)
+}
+
+# Same operators on Arrow columns (query_table)
+ARROW_FILTER_OPS = {
+    'eq': lambda c, v: pc.equal(pc.cast(c, pa.string()), v),
+    'ne': lambda c, v: pc.not_equal(pc.cast(c, pa.string()), v),
+    'contains': lambda c, v: pc.match_substring(pc.cast(c, pa.string()), v, ignore_case=True),
+    'gt': lambda c, v: pc.greater(c, float(v)),
+    'gte': lambda c, v: pc.greater_equal(c, float(v)),
+    'lt': lambda c, v: pc.less(c, float(v)),
+    'lte': lambda c, v: pc.less_equal(c, float(v))
+}
+
+# Non-history inputs of the views: a new catalog or liquidity table also means a new version
+INPUT_FILES = ["catalogo_manufatura.json", "catalogo_manufatura.npz", "liquidez_diaria.csv", "selene_latest.parquet"]
+
+class ViewStore:
+    """
+    Materialized analytics views, built once per version into data/views/<version>/<view>.parquet.
+    The version is the newest snapshot name plus a short hash of the INPUT_FILES mtimes (and of
+    TRAVEL_COST_PER_WEIGHT), so a rebuilt catalog or liquidity table, or a new default freight
+    rate, is not served from the views of the old one.
+    Arbitrage is scored against the liquidity view of the same snapshot (not the CSV on disk),
+    so all three views are consistent with each other.
+    """
+    def __init__(self, data_dir, market=None, crafting=None, finder=None, keep=2):
+        self.data_dir = data_dir
+        self.views_dir = os.path.join(data_dir, "views")
+        self.history_dir = os.path.join(data_dir, "history")
+        self.market = market or MarketAnalyzer(data_dir)
+        self.crafting = crafting or CraftingAnalyzer(data_dir)
+        self.finder = finder or ArbitrageFinder(data_dir)
+        self.keep = keep
+        self.lock = threading.Lock()
+
+    def current_snapshot(self):
+        files = glob.glob(os.path.join(self.history_dir, "**", "*.parquet"), recursive=True)
+        if not files:
+            return None
+        return os.path.splitext(os.path.basename(max(files, key=os.path.basename)))[0]
+
+    def current_version(self):
+        """'<snapshot>_<hash of input mtimes and the travel rate>' (None if there is no snapshot)."""
+        snapshot = self.current_snapshot()
+        if snapshot is None:
+            return None
+        mtimes = []
+        for name in INPUT_FILES:
+            path = os.path.join(self.data_dir, name)
+            mtimes.append(os.stat(path).st_mtime_ns if os.path.exists(path) else None)
+        key = repr((mtimes, TRAVEL_COST_PER_WEIGHT))
+        return f"{snapshot}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]}"
+
+    def _version_dir(self, version):
+        return os.path.join(self.views_dir, version)
+
+    def is_built(self, version=None):
+        version = version or self.current_version()
+        return version is not None and os.path.exists(os.path.join(self._version_dir(version), "manifest.json"))
+
+    def _build_views(self):
+        liquidity = self.market.check_liquidity()
+        if liquidity is None:
+            liquidity = pd.DataFrame()
+        return {'liquidity': liquidity,
+                'crafting': self._priced('crafting', liquidity, TRAVEL_COST_PER_WEIGHT),
+                'arbitrage': self._priced('arbitrage', liquidity, TRAVEL_COST_PER_WEIGHT)}
+
+    def _priced(self, name, liquidity, travel_rate):
+        """The views that include freight (crafting, arbitrage) at a given travel_rate."""
+        if name == 'crafting':
+            return self.crafting.analyze_profitability(travel_rate=travel_rate)
+        if name != 'arbitrage':
+            raise KeyError(name)
+        if liquidity.empty or not os.path.exists(self.finder.listings_file):
+            return pd.DataFrame()
+        return self.finder._score_listings(
+            pd.read_parquet(self.finder.listings_file), liquidity,
+            budget=2000.0, min_margin=15.0, travel_rate=travel_rate, safe=True)
+
+    @staticmethod
+    def _sorted(name, df):
+        if df is None:
+            return pd.DataFrame()
+        sort_col, descending = VIEWS[name]
+        if sort_col in df.columns:
+            df = df.sort_values(sort_col, ascending=not descending)
+        return df.reset_index(drop=True)
+
+    def build(self, force=False):
+        """Builds every view for the current version. Returns the version (None if no data)."""
+        with self.lock:
+            version = self.current_version()
+            if version is None:
+                return None
+            if self.is_built(version) and not force:
+                return version
+            self._build(version)
+            return version
+
+    def _build(self, version):
+        target = self._version_dir(version)
+        # Per-process temp dir: several server workers may build the same version at once
+        tmp = f"{target}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        rows = {}
+        for name, df in self._build_views().items():
+            # Stored pre-sorted so the default request is a plain slice
+            df = self._sorted(name, df)
+            df.to_parquet(os.path.join(tmp, f"{name}.parquet"), index=False)
+            rows[name] = len(df)
+
+        with open(os.path.join(tmp, "manifest.json"), 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'snapshot': version.rsplit('_', 1)[0],
+                       'built_at': datetime.now().isoformat(), 'rows': rows}, f, indent=2)
+
+        # Publish the whole version at once (another worker may have won the race)
+        shutil.rmtree(target, ignore_errors=True)
+        try:
+            os.replace(tmp, target)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self._prune()
+        print(f"Views built for {version}: {rows}")
+
+    def _prune(self):
+        # Oldest first by build time (several versions can share a snapshot name)
+        versions = sorted((d for d in os.listdir(self.views_dir)
+                           if os.path.isdir(os.path.join(self.views_dir, d)) and ".tmp" not in d),
+                          key=lambda d: os.path.getmtime(os.path.join(self.views_dir, d)))
+        for old in versions[:max(0, len(versions) - self.keep)]:
+            shutil.rmtree(os.path.join(self.views_dir, old), ignore_errors=True)
+
+    def load(self, name):
+        """Reads a view of the current version (building it first if needed)."""
+        if name not in VIEWS:
+            raise KeyError(name)
+        version = self.current_version()
+        if version is None:
+            return pd.DataFrame()
+        if not self.is_built(version):
+            version = self.build() or version
+        return pd.read_parquet(os.path.join(self._version_dir(version), f"{name}.parquet"))
+
+    def load_priced(self, name, travel_rate):
+        """
+        crafting / arbitrage recomputed at another travel_rate (not materialized; arbitrage is
+        scored against the liquidity view of the current version), sorted like the view.
+        """
+        liquidity = self.load('liquidity') if name == 'arbitrage' else None
+        return self._sorted(name, self._priced(name, liquidity, travel_rate))
+
+    def page(self, name, version):
+        """Default API page of a view (PAGES) for a given version, NaN as 0 like the JSON API (None if pruned)."""
+        path = os.path.join(self._version_dir(version), f"{name}.parquet")
+        if not os.path.exists(path):
+            return None
+        df = pd.read_parquet(path)
+        key, limit, dedupe = PAGES[name]
+        if dedupe and key in df.columns:
+            df = df.drop_duplicates(subset=[key])
+        return df.head(limit).fillna(0)
+
+def query_view(df, sort=None, descending=True, filters=None, offset=0, limit=50):
+    """
+    Sort / filter / paginate a view. filters: ["Column:op:value", ...] with op in FILTER_OPS.
+    Returns (page, total rows after filtering).
+    """
+    if filters:
+        mask = pd.Series(True, index=df.index)
+        for spec in filters:
+            col, op, value = spec.split(":", 2)
+            if col not in df.columns or op not in FILTER_OPS:
+                raise ValueError(f"Invalid filter: {spec}")
+            mask &= FILTER_OPS[op](df[col], value)
+        df = df[mask]
+
+    if sort:
+        if sort not in df.columns:
+            raise ValueError(f"Invalid sort column: {sort}")
+        df = df.sort_values(sort, ascending=not descending, kind='stable')
+
+    return df.iloc[offset:offset + limit], len(df)
+
+def query_table(table, sort, descending, filters, offset, limit, chunk_size=5000):
+    """
+    query_view for an Arrow table (the shared history): nothing is converted to pandas here.
+    Returns (page chunks as a generator of tables, rows in the page, total rows after filtering).
+    Without sort the chunks are zero-copy slices; with sort only the page indices are taken.
+    """
+    if filters:
+        mask = None
+        for spec in filters:
+            col, op, value = spec.split(":", 2)
+            if col not in table.column_names or op not in ARROW_FILTER_OPS:
+                raise ValueError(f"Invalid filter: {spec}")
+            cond = pc.fill_null(ARROW_FILTER_OPS[op](table[col], value), False)
+            mask = cond if mask is None else pc.and_(mask, cond)
+        table = table.filter(mask)
+
+    indices = None
+    if sort:
+        if sort not in table.column_names:
+            raise ValueError(f"Invalid sort column: {sort}")
+        # Stable, nulls last (as sort_values)
+        indices = pc.sort_indices(table, sort_keys=[(sort, 'descending' if descending else 'ascending')])
+
+    total = table.num_rows
+    start, stop = min(offset, total), min(offset + limit, total)
+
+    def chunks():
+        for pos in range(start, stop, chunk_size):
+            end = min(pos + chunk_size, stop)
+            if indices is None:
+                yield table.slice(pos, end - pos)
+            else:
+                yield table.take(indices.slice(pos, end - pos))
+
+    return chunks(), stop - start, total
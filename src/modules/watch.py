@@ -0,0 +1,171 @@
+import glob
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import requests
+
+from modules.logistics import ArbitrageFinder, TRAVEL_COST_PER_WEIGHT
+from modules.market import MarketAnalyzer, summarize_sold, find_bargains
+
+def diff_snapshots(df_old, df_new):
+    """
+    Listing-level diff between two snapshots (keyed by ListingID).
+    Returns added / removed listings and the set of items touched by either,
+    including listings whose price or amount changed in place.
+    """
+    # Hash joins through pd.Index (Series.isin on Arrow strings is far slower)
+    in_old = pd.Index(df_old['ListingID']).get_indexer(df_new['ListingID'])
+    in_new = pd.Index(df_new['ListingID']).get_indexer(df_old['ListingID'])
+    added = df_new[in_old < 0]
+    removed = df_old[in_new < 0]
+
+    # Listings kept under the same ID but repriced / partially bought
+    kept = in_old >= 0
+    moved = np.zeros(kept.sum(), dtype=bool)
+    for col in ['Price', 'Amount']:
+        if col in df_new.columns and col in df_old.columns:
+            moved |= df_new[col].to_numpy()[kept] != df_old[col].to_numpy()[in_old[kept]]
+
+    changed = set(added['Item']) | set(removed['Item']) | set(df_new['Item'][kept][moved])
+    return {'added': added, 'removed': removed, 'changed_items': changed}
+
+class SnapshotWatcher:
+    """
+    Long-running watch over data/history. Each new snapshot is diffed against the
+    previous one and only the changed items are re-evaluated; opportunities that
+    appear or vanish are emitted as NDJSON events (stdout) and/or POSTed to a webhook.
+    Demand for arbitrage is the live liquidity of the last two snapshots (summarize_sold, the
+    same source as the arbitrage view), not liquidez_diaria.csv. Items that were not touched by
+    the diff and whose liquidity row did not change keep their previous evaluation.
+    """
+    def __init__(self, data_dir, interval=60, min_margin=15.0, max_price=2000.0, discount=30.0,
+                 zones=None, webhook=None, out=None, travel_rate=TRAVEL_COST_PER_WEIGHT):
+        self.data_dir = data_dir
+        self.history_dir = os.path.join(data_dir, "history")
+        self.interval = interval
+        self.min_margin = min_margin
+        self.max_price = max_price
+        self.discount = discount
+        self.zones = set(zones) if zones else None
+        self.webhook = webhook
+        self.out = out or sys.stdout
+        self.travel_rate = travel_rate
+        self.finder = ArbitrageFinder(data_dir)
+
+        self.snapshot_file = None
+        self.df_snapshot = None
+        self.df_liquidity = None
+        # key -> record, key = (kind, ListingID)
+        self.opportunities = {}
+        # diff_snapshots() of the last incremental poll (None after a full evaluation)
+        self.last_diff = None
+
+    def _latest_snapshot(self):
+        files = glob.glob(os.path.join(self.history_dir, "**", "*.parquet"), recursive=True)
+        return max(files, key=os.path.basename) if files else None
+
+    @staticmethod
+    def _liquidity_changes(old, new):
+        """Items whose liquidity row differs between two liquidity tables."""
+        cols = ['Item', 'Units_Sold', 'Total_Volume', 'Top_Zone']
+        frames = [f[cols] for f in (old, new) if f is not None and not f.empty]
+        if not frames:
+            return set()
+        return set(pd.concat(frames).drop_duplicates(keep=False)['Item'])
+
+    def _arbitrage(self, df):
+        if self.df_liquidity is None or self.df_liquidity.empty or df.empty:
+            return {}
+        opps = self.finder._score_listings(
+            df, self.df_liquidity, self.max_price, self.min_margin, self.travel_rate, safe=True)
+        records = {}
+        for row in opps[['ListingID', 'Item', 'Buy_Zone', 'Buy_Price', 'Amount', 'Top_Zone',
+                         'Travel_Cost', 'Unit_Profit', 'Margin', 'Score']].to_dict(orient="records"):
+            records[('arbitrage', row['ListingID'])] = row
+        return records
+
+    def _bargains(self, df):
+        """Listings at least `discount`% below the Kerys or server median of their item (find_bargains)."""
+        deals = find_bargains(df, self.discount, self.zones)
+        records = {}
+        for row in deals[['ListingID', 'Item', 'Zone', 'UnitPrice', 'Amount', 'Ref_Kerys', 'Ref_Server',
+                          'Discount']].to_dict(orient="records"):
+            records[('bargain', row['ListingID'])] = row
+        return records
+
+    def _evaluate(self, df, items=None):
+        if items is not None:
+            df = df[df['Item'].isin(items)]
+        found = self._arbitrage(df)
+        found.update(self._bargains(df))
+        return found
+
+    def _emit(self, events):
+        if not events:
+            return
+        for event in events:
+            self.out.write(json.dumps(event, default=str) + "\n")
+        self.out.flush()
+
+        if self.webhook:
+            try:
+                requests.post(self.webhook, json=events, timeout=10)
+            except requests.RequestException as e:
+                print(f"Webhook error: {e}", file=sys.stderr)
+
+    def _events(self, kind, records, snapshot):
+        name = os.path.basename(snapshot)
+        return [dict(event=kind, type=key[0], snapshot=name, **record) for key, record in records.items()]
+
+    def poll(self):
+        """Processes the newest snapshot if it is new. Returns the emitted events."""
+        latest = self._latest_snapshot()
+        if latest is None or latest == self.snapshot_file:
+            return []
+
+        try:
+            df_new = pd.read_parquet(latest)
+        except Exception:
+            # Still being written by the fetch; try again next poll
+            return []
+
+        if self.df_snapshot is None:
+            # First snapshot: churn of the last two history snapshots, full evaluation
+            self.df_liquidity = MarketAnalyzer(self.data_dir).check_liquidity()
+            current = self._evaluate(df_new)
+            touched = None
+            self.last_diff = None
+        else:
+            self.last_diff = diff_snapshots(self.df_snapshot, df_new)
+            liquidity = summarize_sold(self.last_diff['removed'])
+            touched = self.last_diff['changed_items'] | self._liquidity_changes(self.df_liquidity, liquidity)
+            self.df_liquidity = liquidity
+            current = {k: v for k, v in self.opportunities.items() if v['Item'] not in touched}
+            current.update(self._evaluate(df_new, touched))
+
+        appeared = {k: v for k, v in current.items() if k not in self.opportunities}
+        vanished = {k: v for k, v in self.opportunities.items() if k not in current}
+
+        events = self._events("new", appeared, latest) + self._events("vanished", vanished, latest)
+        self.snapshot_file = latest
+        self.df_snapshot = df_new
+        self.opportunities = current
+        self._emit(events)
+
+        changed = "all" if touched is None else len(touched)
+        print(f"[watch] {os.path.basename(latest)}: {changed} items re-evaluated, "
+              f"{len(appeared)} new, {len(vanished)} vanished", file=sys.stderr)
+        return events
+
+    def run(self, once=False):
+        try:
+            while True:
+                self.poll()
+                if once:
+                    break
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            print("[watch] stopped", file=sys.stderr)
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# World layout: market zones of each province are '<market_prefix>-<zone>' in the snapshots
+PROVINCES = {
+    "Kerys": {
+        "petras": ["Aven", "Bronyr", "Dolavon", "Nerys", "Pladenn"],
+        "market_prefix": "kerys",
+        "market_zones": ["aven", "bronyr", "dolavon", "dreger", "ewyas", "llydaw", "pladenn", "retz", "tremen", "vanes"],
+        "frontier_portals": ["Tremen", "Urmoth"],
+        "pvp_portals": ["Parzival Gate"]
+    },
+    "Inis Gallia": {
+        "petras": ["Goibniu", "Jura", "Kitz", "Levanth", "Nantes", "Paula", "Pontus", "Sanctum", "Tyria", "Verdon"],
+        "market_prefix": "inis_gallia",
+        "market_zones": ["aras", "ardennes", "atigny", "javerdus", "jura", "langres", "morvan", "nones", "trecassis", "vitry"],
+        "frontier_portals": ["Tyria", "Levanth"],
+        "pvp_portals": ["Vigdis Gate"]
+    },
+    "Merrie": {
+        "petras": ["Baden", "Demesne", "Downs", "Ham", "Lea", "Ostia", "Shire", "Tryst", "Wittan"],
+        "market_prefix": "merrie",
+        "market_zones": ["ardbog", "bearm", "caster", "down", "gael", "nene", "shire", "ulaid", "wiht", "yarborn"],
+        "frontier_portals": ["Ham", "Agria"],
+        "pvp_portals": ["Cormac Gate"]
+    },
+    "Ancien": {
+        "petras": ["Durness", "Egeb", "Keria", "Luden", "Sinking", "Vinland"],
+        "market_prefix": "ancien",
+        "market_zones": ["armanhac", "astarac", "gravas", "lavedan", "libornes", "maremna", "salias", "tolosa", "tursan", "volvestre"],
+        "frontier_portals": ["Tursan", "Byla"],
+        "pvp_portals": ["Kellen Gate"]
+    }
+}
+
+HUB_NODE = "Lyonesse_Hub"
+# Zones outside the four provinces: the contested hub (PvP) and anything unknown
+PVP_REGION = "Lyonesse"
+OTHER_REGION = "Other"
+# Category order of the Region column (codes are stable across snapshots)
+REGIONS = list(PROVINCES) + [PVP_REGION, OTHER_REGION]
+
+def zone_node(province, zone):
+    """Graph node of a market zone: the petra of the same name, else its own node."""
+    return f"{province}_{zone.title()}"
+
+def _build_table():
+    rows = []
+    for province, data in PROVINCES.items():
+        for z in data["market_zones"]:
+            rows.append({'Zone': f"{data['market_prefix']}-{z}", 'Region': province,
+                         'Province': data['market_prefix'], 'Valley': z,
+                         'Node': zone_node(province, z), 'PvP': False})
+    return pd.DataFrame(rows).set_index('Zone')
+
+# Zone -> Region (province name), Province (market prefix), Valley, Node (logistics graph), PvP
+ZONE_TABLE = _build_table()
+_PREFIX_REGION = {data['market_prefix']: province for province, data in PROVINCES.items()}
+
+def zone_info(zone):
+    """Metadata row for any zone string, including ones missing from ZONE_TABLE."""
+    zone = str(zone)
+    if zone in ZONE_TABLE.index:
+        return ZONE_TABLE.loc[zone].to_dict()
+    prefix, _, valley = zone.partition("-")
+    if prefix.lower() == PVP_REGION.lower():
+        return {'Region': PVP_REGION, 'Province': prefix, 'Valley': valley, 'Node': HUB_NODE, 'PvP': True}
+    return {'Region': _PREFIX_REGION.get(prefix, OTHER_REGION), 'Province': prefix if prefix in _PREFIX_REGION else None,
+            'Valley': valley or None, 'Node': None, 'PvP': False}
+
+def zone_region(zone):
+    return zone_info(zone)['Region']
+
+def annotate_zones(df, zone_col='Zone'):
+    """
+    Adds Region (categorical over REGIONS) and PvP to a snapshot frame. Metadata is looked up
+    once per distinct zone and broadcast through the zone codes, so filters like
+    df['Region'] == 'Kerys' compare small integer codes instead of strings.
+    """
+    zones = pd.Categorical(df[zone_col])
+    info = [zone_info(z) for z in zones.categories]
+    region_codes = np.array([REGIONS.index(i['Region']) for i in info] + [REGIONS.index(OTHER_REGION)], dtype=np.int8)
+    pvp = np.array([i['PvP'] for i in info] + [False])
+
+    # Code -1 (missing zone) picks the trailing 'Other'/False entry
+    codes = zones.codes
+    df['Region'] = pd.Categorical.from_codes(region_codes[codes], categories=REGIONS)
+    df['PvP'] = pvp[codes]
+    return df
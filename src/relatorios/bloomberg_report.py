@@ -1,17 +1,20 @@
 import pandas as pd
 import os
-import glob
 import json
 import requests
-import matplotlib.pyplot as plt
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.history import load_history
+from modules.charts import ChartRenderer, line_chart
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DATA_DIR = os.path.join(BASE_DIR, "data")
-HISTORY_DIR = os.path.join(DATA_DIR, "history")
 OUTPUT_FILE = os.path.join(DATA_DIR, "relatorio_bloomberg.md")
+# Columns the report reads (the loader adds SnapshotDate, Date, Region and PvP)
+REPORT_COLUMNS = ['Item', 'Price', 'Zone', 'ListingID']
 CHARTS_DIR = os.path.join(DATA_DIR, "charts")
 ITEMS_JSON_URL = "https://data-cdn.gaming.tools/paxdei/market/items.json"
 ITEMS_JSON_PATH = os.path.join(DATA_DIR, "items.json")
@@ -86,68 +89,9 @@ def categorize_item(item_name, item_db):
     return "Material"
 
 def load_market_history(days=7):
-    """Loads parquet files from the last N days."""
+    """Last N days of history (anchored on the newest snapshot), tagged with Date and Region."""
     print(f"Loading history for last {days} days...")
-    
-    # Find files
-    # Simplification: Just load all history and filter by date column
-    # Ideally we filter glob by date path to save time.
-    search_path = os.path.join(HISTORY_DIR, "**", "*.parquet")
-    files = glob.glob(search_path, recursive=True)
-    
-    if not files:
-        return pd.DataFrame()
-        
-    dfs = []
-    cutoff_date = datetime.now() - timedelta(days=days)
-    
-    for f in files:
-        # Check file mtime first as basic optimization
-        mtime = datetime.fromtimestamp(os.path.getmtime(f))
-        if mtime < cutoff_date - timedelta(days=1): # Buffer
-            continue
-            
-        try:
-            df = pd.read_parquet(f)
-            # Infer date if not in columns (older history might not have it)
-            if 'SnapshotDate' not in df.columns:
-                 # Try filename
-                 fname = os.path.basename(f)
-                 # Expect: market_2026-02-04_08-36.parquet
-                 try:
-                     ts_str = fname.replace("market_", "").replace(".parquet", "")[:10] # YYYY-MM-DD
-                     df['SnapshotDate'] = pd.to_datetime(ts_str)
-                 except:
-                     df['SnapshotDate'] = mtime
-            else:
-                df['SnapshotDate'] = pd.to_datetime(df['SnapshotDate'])
-
-            # Filter rows
-            df = df[df['SnapshotDate'] >= cutoff_date]
-            
-            if not df.empty:
-                dfs.append(df)
-        except Exception as e:
-            print(f"Error reading {f}: {e}")
-            
-    if not dfs:
-        return pd.DataFrame()
-        
-    full_df = pd.concat(dfs, ignore_index=True)
-    
-    # Normalize Date
-    full_df['Date'] = full_df['SnapshotDate'].dt.date
-    
-    # Map Regions
-    def map_region(zone):
-        if str(zone).startswith('kerys'): return 'Kerry'
-        if str(zone).startswith('merrie'): return 'Merrie'
-        if str(zone).startswith('ancien'): return 'Ancien'
-        if str(zone).startswith('inis'): return 'Inis Gallia'
-        return 'Other'
-        
-    full_df['Region'] = full_df['Zone'].apply(map_region)
-    return full_df
+    return load_history(DATA_DIR, days=days, columns=REPORT_COLUMNS)
 
 def calculate_stats(df, item_name, region=None, exclude_zone=None):
     """Calculates median price history and True Churn (Sales Proxy)."""
@@ -201,7 +145,64 @@ def calculate_stats(df, item_name, region=None, exclude_zone=None):
         'volume': total_sales_est # NEW: Sales Estimate
     }
 
+def _churn(df, keys):
+    """
+    True churn per key: listings present on a date and missing on the key's next date,
+    summed over consecutive dates (same rule as calculate_stats, for all keys at once).
+    """
+    listings = df[keys + ['Date', 'ListingID']].drop_duplicates()
+    dates = listings[keys + ['Date']].drop_duplicates().sort_values(keys + ['Date'])
+    dates['Next'] = dates.groupby(keys)['Date'].shift(-1)
+    pairs = listings.merge(dates.dropna(subset=['Next']), on=keys + ['Date'])
+
+    seen = listings.rename(columns={'Date': 'Next'})
+    seen['Seen'] = True
+    pairs = pairs.merge(seen, on=keys + ['Next', 'ListingID'], how='left')
+    return pairs[pairs['Seen'].isna()].groupby(keys).size()
+
+class ReportStats:
+    """
+    calculate_stats for every item (server-wide and per region) in one grouped pass:
+    daily median, first/last median, % change and churn volume. The report only does lookups.
+    """
+    def __init__(self, df):
+        self.df = df
+        self.item_rows = df.groupby('Item').indices
+        self.daily = {}
+        self.summary = {}
+        for level, keys in (('global', ['Item']), ('region', ['Item', 'Region'])):
+            daily = df.groupby(keys + ['Date'])['Price'].median().rename('Median_Price')
+            by_key = daily.groupby(level=list(range(len(keys))))
+            summary = pd.DataFrame({'start_price': by_key.first(), 'current_price': by_key.last()})
+            summary['volume'] = _churn(df, keys).reindex(summary.index, fill_value=0)
+            self.daily[level] = daily
+            self.summary[level] = summary.to_dict('index')
+
+    def get(self, item, region=None, exclude_zone=None):
+        """Same result as calculate_stats(df, item, region, exclude_zone)."""
+        if exclude_zone:
+            # Not decomposable (median without one zone): compute on the item's rows only
+            rows = self.item_rows.get(item)
+            return calculate_stats(self.df.iloc[rows], item, region, exclude_zone) if rows is not None else None
+
+        level, key = ('region', (item, region)) if region else ('global', item)
+        entry = self.summary[level].get(key)
+        if entry is None:
+            return None
+        start, current = entry['start_price'], entry['current_price']
+        return {
+            'current_price': current,
+            'start_price': start,
+            'pct_change': ((current - start) / start * 100) if start > 0 else 0,
+            'history': self.daily[level].loc[key].reset_index(),
+            'volume': int(entry['volume'])
+        }
+
 def generate_report(df, item_db):
+    stats = ReportStats(df)
+    # Charts are queued here and drawn at the end (process pool, skipped when unchanged)
+    charts = ChartRenderer(CHARTS_DIR)
+
     report_lines = []
     report_lines.append("# 📈 Market Intelligence Report (Bloomberg Style)\n")
     report_lines.append(f"**Date:** {datetime.now().strftime('%Y-%m-%d')}\n")
@@ -212,12 +213,12 @@ def generate_report(df, item_db):
     
     # Benchmarks
     benchmarks = ["Iron Ingot", "Wrought Iron Ingot", "Steel Ingot", "Bronze Ingot", "Worn Out Locket", "Worn Out Sigil"]
-    report_lines.append("| Benchmark | Global Median | Kerry Median | Top Region (Demand) |")
+    report_lines.append("| Benchmark | Global Median | Kerys Median | Top Region (Demand) |")
     report_lines.append("|-----------|---------------|--------------|---------------------|")
     
     for item in benchmarks:
-        stats_global = calculate_stats(df, item)
-        stats_kerry = calculate_stats(df, item, "Kerry")
+        stats_global = stats.get(item)
+        stats_kerys = stats.get(item, "Kerys")
         
         vol_by_region = df[df['Item'] == item].groupby('Region')['ListingID'].count().sort_values(ascending=False)
         top_region = vol_by_region.index[0] if not vol_by_region.empty else "N/A"
@@ -231,10 +232,10 @@ def generate_report(df, item_db):
         else:
             g_str = "N/A"
 
-        # Kerry Str
-        if stats_kerry:
-            k_price = stats_kerry['current_price']
-            k_chg = stats_kerry['pct_change']
+        # Kerys Str
+        if stats_kerys:
+            k_price = stats_kerys['current_price']
+            k_chg = stats_kerys['pct_change']
             k_sign = "+" if k_chg > 0 else ""
             k_str = f"{k_price:.1f}g" # Just price for compactness, or both? User said "put Kerry info alongside".
             # Let's verify space. Markdown tables wrap. Let's do Price + %.
@@ -244,12 +245,12 @@ def generate_report(df, item_db):
             
         report_lines.append(f"| **{item}** | {g_str} | {k_str} | {top_region} |")
 
-    report_lines.append("\n**Executive Summary:** Market activity in Kerry shows mixed signals compared to the global averages. The following sections detail key sector movements.\n")
+    report_lines.append("\n**Executive Summary:** Market activity in Kerys shows mixed signals compared to the global averages. The following sections detail key sector movements.\n")
 
     # 1. CSI Index
     report_lines.append("## 1. 🏭 The Coal-Steel Index (CSI)\n")
-    charcoal_stats = calculate_stats(df, "Charcoal", "Kerry")
-    steel_stats = calculate_stats(df, "Steel Ingot", "Kerry")
+    charcoal_stats = stats.get("Charcoal", "Kerys")
+    steel_stats = stats.get("Steel Ingot", "Kerys")
     
     if charcoal_stats and steel_stats:
         c_hist = charcoal_stats['history'].set_index('Date')['Median_Price'].rename("Charcoal")
@@ -264,14 +265,11 @@ def generate_report(df, item_db):
         report_lines.append(f"- **Today:** 1 Steel Ingot = **{current_ratio:.1f}** Charcoal")
         report_lines.append(f"- **7 Days Ago:** 1 Steel Ingot = **{start_ratio:.1f}** Charcoal")
         
-        plt.figure(figsize=(10, 5))
-        plt.plot(charcoal_stats['history']['Date'], charcoal_stats['history']['Median_Price'], marker='o', linestyle='-', color='black')
-        plt.title('Median Charcoal Price (Kerry) - Last 7 Days')
-        plt.grid(True, linestyle='--', alpha=0.6)
-        plt.tight_layout()
-        chart_path = os.path.join(CHARTS_DIR, "csi_charcoal.png")
-        plt.savefig(chart_path)
-        plt.close()
+        charts.add("csi_charcoal.png", line_chart('Median Charcoal Price (Kerys) - Last 7 Days', [{
+            'x': charcoal_stats['history']['Date'].tolist(),
+            'y': charcoal_stats['history']['Median_Price'].tolist(),
+            'marker': 'o', 'linestyle': '-', 'color': 'black'
+        }]))
         report_lines.append(f"\n![Charcoal Trend](charts/csi_charcoal.png)\n")
 
     # Helper for Weapon/Armor Analysis
@@ -284,18 +282,18 @@ def generate_report(df, item_db):
             return
 
         # 1. Churn Rate (Sales) - Top 2
-        # Calculate volume for all items in Kerry
-        kerry_volumes = []
+        # Calculate volume for all items in Kerys
+        kerys_volumes = []
         for i in items:
-            s_kerry = calculate_stats(df, i, "Kerry")
-            if s_kerry and s_kerry['volume'] > 0:
-                kerry_volumes.append((i, s_kerry['volume'], s_kerry['current_price'], s_kerry['pct_change']))
+            s_kerys = stats.get(i, "Kerys")
+            if s_kerys and s_kerys['volume'] > 0:
+                kerys_volumes.append((i, s_kerys['volume'], s_kerys['current_price'], s_kerys['pct_change']))
         
         # Sort by Volume Descending
-        kerry_volumes.sort(key=lambda x: x[1], reverse=True)
-        top_churn = kerry_volumes[:2]
+        kerys_volumes.sort(key=lambda x: x[1], reverse=True)
+        top_churn = kerys_volumes[:2]
         
-        report_lines.append(f"### 🏆 Top Churn (Kerry Sales Est.)")
+        report_lines.append(f"### 🏆 Top Churn (Kerys Sales Est.)")
         if top_churn:
             for rank, (item, vol, price, chg) in enumerate(top_churn, 1):
                 sign = "+" if chg > 0 else ""
@@ -306,9 +304,9 @@ def generate_report(df, item_db):
         # 2. Inflation Leaders (Top 2)
         growth_list = []
         for i in items:
-            s_kerry = calculate_stats(df, i, "Kerry")
-            if s_kerry:
-                growth_list.append((i, s_kerry['pct_change'], s_kerry['current_price']))
+            s_kerys = stats.get(i, "Kerys")
+            if s_kerys:
+                growth_list.append((i, s_kerys['pct_change'], s_kerys['current_price']))
         
         growth_list.sort(key=lambda x: x[1], reverse=True)
         top_inflation = growth_list[:2]
@@ -326,7 +324,7 @@ def generate_report(df, item_db):
         # Let's keep the region selection simple (Listing Count) for now -> "Availability/Activity"
         # OR attempt crude churn sum. Listing Count is safer for "Hub" identification.
         
-        global_df = df[(df['Region'] != 'Kerry') & (df['Item'].isin(items))]
+        global_df = df[(df['Region'] != 'Kerys') & (df['Item'].isin(items))]
         if not global_df.empty:
             vol_by_region = global_df.groupby('Region')['ListingID'].count().sort_values(ascending=False)
             top_region = vol_by_region.index[0]
@@ -342,16 +340,16 @@ def generate_report(df, item_db):
 
     # 4. Tailoring
     report_lines.append("## 4. 🧵 Tailoring (The 'Linen' Index)\n")
-    linen_stats = calculate_stats(df, "Linen String", "Kerry")
+    linen_stats = stats.get("Linen String", "Kerys")
     if linen_stats:
         sign = "+" if linen_stats['pct_change'] > 0 else ""
-        report_lines.append(f"- **Raw Material:** Linen String inflation is **{sign}{linen_stats['pct_change']:.1f}%** ({linen_stats['current_price']:.1f}g) in Kerry.")
+        report_lines.append(f"- **Raw Material:** Linen String inflation is **{sign}{linen_stats['pct_change']:.1f}%** ({linen_stats['current_price']:.1f}g) in Kerys.")
     
-    kerry_linen = df[(df['Region'] == 'Kerry') & (df['Item'] == "Linen String")]
-    if not kerry_linen.empty:
-        top_zone = kerry_linen.groupby('Zone')['ListingID'].count().idxmax()
+    kerys_linen = df[(df['Region'] == 'Kerys') & (df['Item'] == "Linen String")]
+    if not kerys_linen.empty:
+        top_zone = kerys_linen.groupby('Zone')['ListingID'].count().idxmax()
         # Compare with Rest of Server
-        server_stats = calculate_stats(df, "Linen String", exclude_zone=top_zone)
+        server_stats = stats.get("Linen String", exclude_zone=top_zone)
         server_price = server_stats['current_price'] if server_stats else 0
         report_lines.append(f"- **Linen Hub:** **{top_zone}** (Global Avg: {server_price:.1f}g).")
 
@@ -361,21 +359,21 @@ def generate_report(df, item_db):
     best_def = (999, None)
     
     for t in tailoring_items:
-        s = calculate_stats(df, t, "Kerry")
+        s = stats.get(t, "Kerys")
         if s:
             if s['pct_change'] > best_inf[0]: best_inf = (s['pct_change'], t)
             if s['pct_change'] < best_def[0]: best_def = (s['pct_change'], t)
             
     if best_inf[1]: 
-        s = calculate_stats(df, best_inf[1], "Kerry")
+        s = stats.get(best_inf[1], "Kerys")
         report_lines.append(f"- **Top Opportunity (Sell):** **{best_inf[1]}** (+{best_inf[0]:.1f}% | {s['current_price']:.1f}g).")
     if best_def[1]: 
-        s = calculate_stats(df, best_def[1], "Kerry")
+        s = stats.get(best_def[1], "Kerys")
         report_lines.append(f"- **Top Opportunity (Buy):** **{best_def[1]}** ({best_def[0]:.1f}% | {s['current_price']:.1f}g).")
 
     # 5. Leatherworking
     report_lines.append("\n## 5. 🎒 Leatherworking\n")
-    leather_stats = calculate_stats(df, "Coarse Leather Band", "Kerry")
+    leather_stats = stats.get("Coarse Leather Band", "Kerys")
     if leather_stats:
         sign = "+" if leather_stats['pct_change'] > 0 else ""
         report_lines.append(f"- **Raw Material:** Coarse Leather Band inflation is **{sign}{leather_stats['pct_change']:.1f}%** ({leather_stats['current_price']:.1f}g).")
@@ -385,27 +383,29 @@ def generate_report(df, item_db):
     glasses = ['Rough Glass', 'Glass', 'Pure Glass']
     
     for g_item in glasses:
-        g_stats = calculate_stats(df, g_item, "Kerry")
+        g_stats = stats.get(g_item, "Kerys")
         if g_stats:
             sign = "+" if g_stats['pct_change'] > 0 else ""
             
             # Find Top Supply Zone
-            g_df = df[(df['Item'] == g_item) & (df['Region'] == 'Kerry')]
+            g_df = df[(df['Item'] == g_item) & (df['Region'] == 'Kerys')]
             if not g_df.empty:
                 top_supply = g_df.groupby('Zone')['ListingID'].count().idxmax()
                 
                 # Compare with Rest of Server
-                rest_stats = calculate_stats(df, g_item, exclude_zone=top_supply)
+                rest_stats = stats.get(g_item, exclude_zone=top_supply)
                 rest_price = rest_stats['current_price'] if rest_stats else 0
                 
                 report_lines.append(f"\n**{g_item}**:")
                 report_lines.append(f"- Inflation: **{sign}{g_stats['pct_change']:.1f}%** (Current: {g_stats['current_price']:.1f}g)")
                 report_lines.append(f"- Best Supply: **{top_supply}** (Rest of Server: {rest_price:.1f}g)")
             else:
-                report_lines.append(f"\n**{g_item}**: No supply in Kerry.")
+                report_lines.append(f"\n**{g_item}**: No supply in Kerys.")
+
 
 
 
+    charts.render()
 
     with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
         f.write('\n'.join([line.strip() for line in report_lines]))
@@ -1,7 +1,10 @@
 
 import pandas as pd
-import glob
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.market import find_bargains
 
 def check_bargains():
     # 1. Load Data
@@ -28,72 +31,27 @@ def check_bargains():
         'Elderberry'
     ]
 
-    # Normalize item names in data for easier matching if needed, 
-    # but exact match is safer first. 
-    # Let's filter df to only these items to save processing
-    df_filtered = df[df['Item'].isin(target_items)].copy()
-
-    # 3. Calculate References
-    # Reference 1: Kerys Median (All Kerys zones)
-    kerys_mask = df['Zone'].str.startswith('kerys-')
-    df_kerys = df[kerys_mask & df['Item'].isin(target_items)]
-    median_kerys = df_kerys.groupby('Item')['UnitPrice'].median()
-
-    # Reference 2: Server Median (All zones)
-    df_server = df[df['Item'].isin(target_items)]
-    median_server = df_server.groupby('Item')['UnitPrice'].median()
+    # 3. References + rule: below the Kerys median OR the server median (shared with the watcher)
+    # Medians use every zone; only listings in the zones the user is visiting are kept
+    deals = find_bargains(df[df['Item'].isin(target_items)], discount=0.0, zones=target_zones)
 
-    # 4. Filter for Target Opportunities
-    # Only look at the zones the user is visiting
+    # 4. Explain each deal
     opportunities = []
-
-    # Filter target listings
-    # We want listings in the target zones for the specific items
-    target_listings = df_filtered[df_filtered['Zone'].isin(target_zones)]
-
-    for index, row in target_listings.iterrows():
-        item = row['Item']
-        price = row['UnitPrice']
-        zone = row['Zone']
-        amount = row['Amount']
-        
-        # Get benchmarks
-        k_med = median_kerys.get(item, float('inf')) # default to distinct high if no data
-        s_med = median_server.get(item, float('inf'))
-        
-        # Logic: Price below Median of Kerrys OR Server
-        # We treat 'NaN' medians (no data) as 'no benchmark', so we can't be 'below' it easily.
-        # But if it's missing in Kerys, maybe ANY price is good? 
-        # User said: "below median of kerrys OR server".
-        # If Kerys has no data, we rely on Server.
-        # If both empty, we can't judge.
-        
-        is_deal = False
+    for row in deals.itertuples(index=False):
         reasons = []
-
-        # Check vs Kerys
-        if pd.notna(k_med) and price < k_med:
-            # Calculate discount
-            disc = (1 - price/k_med) * 100
-            reasons.append(f"Below Kerys ({k_med:.1f}, -{disc:.0f}%)")
-            is_deal = True
-        
-        # Check vs Server
-        if pd.notna(s_med) and price < s_med:
-            disc = (1 - price/s_med) * 100
-            reasons.append(f"Below Server ({s_med:.1f}, -{disc:.0f}%)")
-            is_deal = True
-
-        if is_deal:
-            opportunities.append({
-                'Item': item,
-                'Zone': zone,
-                'Price': price,
-                'Amount': amount,
-                'Ref_Kerys': k_med if pd.notna(k_med) else None,
-                'Ref_Server': s_med,
-                'Reason': ", ".join(reasons)
-            })
+        if pd.notna(row.Ref_Kerys) and row.UnitPrice < row.Ref_Kerys:
+            reasons.append(f"Below Kerys ({row.Ref_Kerys:.1f}, -{(1 - row.UnitPrice / row.Ref_Kerys) * 100:.0f}%)")
+        if pd.notna(row.Ref_Server) and row.UnitPrice < row.Ref_Server:
+            reasons.append(f"Below Server ({row.Ref_Server:.1f}, -{(1 - row.UnitPrice / row.Ref_Server) * 100:.0f}%)")
+        opportunities.append({
+            'Item': row.Item,
+            'Zone': row.Zone,
+            'Price': row.UnitPrice,
+            'Amount': row.Amount,
+            'Ref_Kerys': row.Ref_Kerys if pd.notna(row.Ref_Kerys) else None,
+            'Ref_Server': row.Ref_Server,
+            'Reason': ", ".join(reasons)
+        })
 
     # 5. Output Results
     if not opportunities:
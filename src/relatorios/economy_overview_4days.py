@@ -1,65 +1,76 @@
 import pandas as pd
+import numpy as np
 import os
-import glob
-from datetime import datetime
+import sys
+import argparse
+from datetime import datetime, timedelta
 
-def load_snapshot(filepath):
-    """Loads a parquet snapshot and returns a processed DataFrame."""
-    try:
-        df = pd.read_parquet(filepath)
-        # Ensure numeric columns
-        df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
-        df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
-        df['UnitPrice'] = pd.to_numeric(df['UnitPrice'], errors='coerce')
-        return df
-    except Exception as e:
-        print(f"Error loading {filepath}: {e}")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.history import get_loader
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+COLUMNS = ['Item', 'Price', 'Amount', 'ListingID']
+
+def load_days(days, until=None):
+    """Last snapshot of each of the last N days, as one frame with a Date column (None if empty)."""
+    loader = get_loader(DATA_DIR)
+    since, until = loader.day_window(days, until)
+    if since is None:
+        return None
+    df = loader.load(since=since, until=until, columns=COLUMNS, tag=False, daily=True)
+    if df.empty:
         return None
+    # Ensure numeric columns
+    df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
+    df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
+    df['Date'] = df['SnapshotDate'].dt.strftime("%Y-%m-%d")
+    return df
 
-def main():
-    # Define the specific snapshots we want to analyze (Latest of each day)
-    snapshots = {
-        "2026-01-31": r"d:\PaxDei_Tool\data\history\year=2026\month=01\market_2026-01-31_21-08.parquet",
-        "2026-02-01": r"d:\PaxDei_Tool\data\history\year=2026\month=02\market_2026-02-01_17-07.parquet",
-        "2026-02-02": r"d:\PaxDei_Tool\data\history\year=2026\month=02\market_2026-02-02_14-42.parquet",
-        "2026-02-03": r"d:\PaxDei_Tool\data\history\year=2026\month=02\market_2026-02-03_20-20.parquet"
-    }
+def daily_churn(df, dates):
+    """
+    Listings removed/added between consecutive days, for all days at once: each listing is
+    encoded as (listing code, day index) and checked against the previous/next day with np.isin.
+    """
+    day = df['Date'].map({d: i for i, d in enumerate(dates)}).to_numpy()
+    codes, _ = pd.factorize(df['ListingID'])
+    valid = codes >= 0
+    n = len(dates)
+    keys = codes.astype(np.int64) * n + day
+    present = np.unique(keys[valid])
 
-    print(f"--- ECONOMY OVERVIEW (Last 4 Days) ---")
-    print(f"Analyzing snapshots: {', '.join(snapshots.keys())}\n")
+    removed = valid & (day < n - 1) & ~np.isin(keys + 1, present)
+    added = valid & (day > 0) & ~np.isin(keys - 1, present)
 
-    daily_stats = []
-    dfs = {}
+    gone = df[removed].assign(Day=day[removed])
+    summary = pd.DataFrame({
+        'Removed': gone.groupby('Day')['ListingID'].nunique(),
+        'Value': gone.groupby('Day')['Price'].sum(),
+        'New': df[added].assign(Day=day[added] - 1).groupby('Day')['ListingID'].nunique()
+    }).reindex(range(n - 1), fill_value=0).fillna(0)
+    # Top 3 items by value that disappeared, per transition
+    top_items = {d: s.droplevel('Day').sort_values(ascending=False).head(3)
+                 for d, s in gone.groupby(['Day', 'Item'])['Price'].sum().groupby(level='Day')}
+    return summary, top_items
 
-    # 1. Load Data and Basic Stats
-    for date_str, filepath in snapshots.items():
-        if not os.path.exists(filepath):
-            print(f"Warning: File not found for {date_str}: {filepath}")
-            continue
-            
-        df = load_snapshot(filepath)
-        if df is None: 
-            continue
-            
-        dfs[date_str] = df
-        
-        total_value = (df['Price']).sum() # Total listing price (Price is usually total for the stack? Or unit? Tool fetched 'Price' which seemed to be total listing price)
-        # Verify if 'Price' is total or unit. In fetch_market_prices: unit_price = price / quantity. So 'Price' is total listing value.
-        
-        total_listings = len(df)
-        total_items_qty = df['Amount'].sum()
-        unique_items = df['Item'].nunique()
-        
-        daily_stats.append({
-            'Date': date_str,
-            'TotalValue': total_value,
-            'Listings': total_listings,
-            'VolumeQty': total_items_qty,
-            'UniqueItems': unique_items
-        })
+def main(days=4, until=None):
+    df = load_days(days, until)
+    if df is None:
+        print("No data found.")
+        return
+    dates = sorted(df['Date'].unique())
+
+    print(f"--- ECONOMY OVERVIEW (Last {days} Days) ---")
+    print(f"Analyzing snapshots: {', '.join(dates)}\n")
+
+    # 1. Basic stats: one grouped pass over the window
+    stats_df = df.groupby('Date').agg(
+        TotalValue=('Price', 'sum'),   # 'Price' is the total listing price (unit price = price / quantity)
+        Listings=('Item', 'size'),
+        VolumeQty=('Amount', 'sum'),
+        UniqueItems=('Item', 'nunique')
+    ).reset_index()
 
-    stats_df = pd.DataFrame(daily_stats)
-    
     # 2. Print General Trend
     print("### 1. Market Cap & Activity Trend")
     print(stats_df.to_string(index=False, formatters={
@@ -71,80 +82,51 @@ def main():
 
     # 3. Liquidity / Churn Analysis (crude approx)
     print("### 2. Daily Churn (Items Sold or Expired)")
-    dates = sorted(list(dfs.keys()))
-    for i in range(len(dates) - 1):
-        d1 = dates[i]
-        d2 = dates[i+1]
-        
-        df1 = dfs[d1]
-        df2 = dfs[d2]
-        
-        # Identify listings that disappeared
-        # We need a unique identifier. 'ListingID' is ideal.
-        if 'ListingID' in df1.columns and 'ListingID' in df2.columns:
-            ids1 = set(df1['ListingID'].dropna().unique())
-            ids2 = set(df2['ListingID'].dropna().unique())
-            
-            disappeared_ids = ids1 - ids2
-            new_ids = ids2 - ids1
-            
-            # Estimate value of disappeared items
-            sold_or_expired_df = df1[df1['ListingID'].isin(disappeared_ids)]
-            churn_value = sold_or_expired_df['Price'].sum()
-            
-            print(f"From {d1} to {d2}:")
-            print(f"  - Listings Removed: {len(disappeared_ids)} (Value: {churn_value:,.0f}g)")
-            print(f"  - New Listings:     {len(new_ids)}")
-            
+    if df['ListingID'].notna().any():
+        churn, top_items = daily_churn(df, dates)
+        for i, row in churn.iterrows():
+            print(f"From {dates[i]} to {dates[i + 1]}:")
+            print(f"  - Listings Removed: {int(row['Removed'])} (Value: {row['Value']:,.0f}g)")
+            print(f"  - New Listings:     {int(row['New'])}")
             # Top 3 items by value that disappeared (Potential Sales)
-            top_churn_items = sold_or_expired_df.groupby('Item')['Price'].sum().sort_values(ascending=False).head(3)
-            print(f"  - Top Removed Items (Value): {', '.join([f'{i} ({v:,.0f}g)' for i, v in top_churn_items.items()])}")
-        else:
-            print(f"Cannot calculate churn for {d1}->{d2} (Missing ListingID)")
+            top = top_items.get(i, pd.Series(dtype=float))
+            print(f"  - Top Removed Items (Value): {', '.join([f'{item} ({v:,.0f}g)' for item, v in top.items()])}")
+    else:
+        print("Cannot calculate churn (Missing ListingID)")
     print("\n")
 
     # 4. Price Inflation/Deflation (Top Traded Items)
     print("### 3. Price Trends (Top 10 Common Items)")
-    # Get items present in all snapshots with decent volume
-    common_items = set(dfs[dates[0]]['Item'].unique())
-    for d in dates[1:]:
-        common_items &= set(dfs[d]['Item'].unique())
-        
-    # Calculate weighted average price for each item each day
-    price_tracking = {}
-    
-    for d in dates:
-        df = dfs[d]
-        # Weighted Average Unit Price = Sum(Price) / Sum(Amount) per item
-        grouped = df.groupby('Item').apply(lambda x: x['Price'].sum() / x['Amount'].sum() if x['Amount'].sum() > 0 else 0)
-        price_tracking[d] = grouped
+    # Weighted Average Unit Price = Sum(Price) / Sum(Amount) per item and day, from grouped sums
+    sums = df.groupby(['Item', 'Date'])[['Price', 'Amount']].sum()
+    weighted = (sums['Price'] / sums['Amount']).where(sums['Amount'] > 0, 0)
+    price_df = weighted.unstack('Date')
 
-    price_df = pd.DataFrame(price_tracking)
-    
-    # Filter for high volume items (present in first day with > 50 listings approx count is hard, let's use global popularity)
-    # Just take top items by Listing Count in the latest snapshot
-    top_items_latest = dfs[dates[-1]]['Item'].value_counts().head(10).index.tolist()
-    
-    trend_data = []
-    for item in top_items_latest:
-        if item in price_df.index:
-            row = price_df.loc[item]
-            start_price = row[dates[0]]
-            end_price = row[dates[-1]]
-            change = ((end_price - start_price) / start_price * 100) if start_price > 0 else 0
-            trend_data.append({
-                'Item': item,
-                'StartPrice': start_price,
-                'EndPrice': end_price,
-                'Change%': change
-            })
-            
-    trend_df = pd.DataFrame(trend_data).sort_values('Change%', ascending=False)
+    # Top items by Listing Count in the latest snapshot
+    top_items_latest = df.loc[df['Date'] == dates[-1], 'Item'].value_counts().head(10).index
+    trend_df = pd.DataFrame({
+        'Item': top_items_latest,
+        'StartPrice': price_df[dates[0]].reindex(top_items_latest).to_numpy(),
+        'EndPrice': price_df[dates[-1]].reindex(top_items_latest).to_numpy()
+    })
+    start = trend_df['StartPrice']
+    trend_df['Change%'] = np.where(start > 0, (trend_df['EndPrice'] - start) / start * 100, 0)
+    trend_df = trend_df.sort_values('Change%', ascending=False)
     print(trend_df.to_string(index=False, formatters={
         'StartPrice': '{:.2f}'.format,
         'EndPrice': '{:.2f}'.format,
         'Change%': '{:+.2f}%'.format
     }))
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Economy overview over the last N days (last snapshot of each day)")
+    parser.add_argument("--days", type=int, default=4, help="Window size in days (default: 4)")
+    parser.add_argument("--until", help="Last day of the window, YYYY-MM-DD (default: newest snapshot)")
+    args = parser.parse_args()
+    if args.days < 1:
+        parser.error("--days must be >= 1")
+    until = datetime.strptime(args.until, "%Y-%m-%d") + timedelta(days=1) - timedelta(seconds=1) if args.until else None
+    return args.days, until
+
 if __name__ == "__main__":
-    main()
+    main(*parse_args())
@@ -1,69 +1,25 @@
 import pandas as pd
 import os
-import glob
+import sys
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.history import load_history
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DATA_DIR = os.path.join(BASE_DIR, "data")
-HISTORY_DIR = os.path.join(DATA_DIR, "history")
 OUTPUT_FILE = os.path.join(DATA_DIR, "relatorio_cacador.md")
+# Columns the report reads (the loader adds SnapshotDate, Date, Region and PvP)
+REPORT_COLUMNS = ['Item', 'Price', 'Zone', 'ListingID']
 
 def load_market_history(days=7):
-    """Loads parquet files from the last N days."""
+    """Last N days of history (anchored on the newest snapshot), tagged with Date and Region."""
     print(f"Loading history for last {days} days...")
-    
-    search_path = os.path.join(HISTORY_DIR, "**", "*.parquet")
-    files = glob.glob(search_path, recursive=True)
-    
-    if not files:
-        return pd.DataFrame()
-        
-    dfs = []
-    cutoff_date = datetime.now() - timedelta(days=days)
-    
-    for f in files:
-        mtime = datetime.fromtimestamp(os.path.getmtime(f))
-        if mtime < cutoff_date - timedelta(days=1): 
-            continue
-            
-        try:
-            df = pd.read_parquet(f)
-            if 'SnapshotDate' not in df.columns:
-                 try:
-                     fname = os.path.basename(f)
-                     ts_str = fname.replace("market_", "").replace(".parquet", "")[:10]
-                     df['SnapshotDate'] = pd.to_datetime(ts_str)
-                 except:
-                     df['SnapshotDate'] = mtime
-            else:
-                df['SnapshotDate'] = pd.to_datetime(df['SnapshotDate'])
-
-            df = df[df['SnapshotDate'] >= cutoff_date]
-            
-            if not df.empty:
-                dfs.append(df)
-        except Exception as e:
-            print(f"Error reading {f}: {e}")
-            
-    if not dfs:
-        return pd.DataFrame()
-        
-    full_df = pd.concat(dfs, ignore_index=True)
-    full_df['Date'] = full_df['SnapshotDate'].dt.date
-    
-    def map_region(zone):
-        if str(zone).startswith('kerys'): return 'Kerry'
-        if str(zone).startswith('merrie'): return 'Merrie'
-        if str(zone).startswith('ancien'): return 'Ancien'
-        if str(zone).startswith('inis'): return 'Inis Gallia'
-        return 'Other'
-        
-    full_df['Region'] = full_df['Zone'].apply(map_region)
-    return full_df
+    return load_history(DATA_DIR, days=days, columns=REPORT_COLUMNS)
 
-def calculate_stats(df, item_name, region="Kerry"):
+def calculate_stats(df, item_name, region="Kerys"):
     """Calculates median price history and True Churn (Sales Proxy)."""
     mask = df['Item'] == item_name
     if region:
@@ -115,7 +71,7 @@ def generate_hunter_report(df):
     results = []
     
     for item in items_to_analyze:
-        stats = calculate_stats(df, item, "Kerry")
+        stats = calculate_stats(df, item, "Kerys")
         
         if stats:
             price = stats['current_price']
@@ -129,9 +85,9 @@ def generate_hunter_report(df):
                 'daily_rev': daily_rev
             })
         else:
-            stats_global = calculate_stats(df, item, None) # Check global if Kerry is empty
+            stats_global = calculate_stats(df, item, None) # Check global if Kerys is empty
             if stats_global:
-                 # Penalty for not being in Kerry (travel cost/time), but show potential
+                 # Penalty for not being in Kerys (travel cost/time), but show potential
                  price = stats_global['current_price']
                  volume_7d = stats_global['volume']
                  daily_rev = (price * volume_7d) / 7
@@ -162,7 +118,7 @@ def generate_hunter_report(df):
             lines.append(f"- **Selling Price:** {winner['price']:.1f}g each")
             lines.append(f"- **Why?** It has the best balance of value and demand in the current market.\n")
         else:
-            lines.append("No clear winner found. Market data might be sparse for these specific items in Kerry.\n")
+            lines.append("No clear winner found. Market data might be sparse for these specific items in Kerys.\n")
     
     lines.append("## 📊 Detailed Breakdown")
     lines.append("| Item | Price (Median) | Est. Sales (7 Days) | Daily Revenue Potential |")
@@ -1,119 +1,113 @@
 import pandas as pd
+import numpy as np
 import os
-import glob
-from datetime import datetime
-
-def load_snapshot(filepath):
-    try:
-        df = pd.read_parquet(filepath)
-        df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
-        df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
-        df['UnitPrice'] = pd.to_numeric(df['UnitPrice'], errors='coerce')
-        return df
-    except Exception as e:
-        return None
+import re
+import sys
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.history import get_loader
 
-def main():
-    snapshots = {
-        "2026-01-31": r"d:\PaxDei_Tool\data\history\year=2026\month=01\market_2026-01-31_21-08.parquet",
-        "2026-02-01": r"d:\PaxDei_Tool\data\history\year=2026\month=02\market_2026-02-01_17-07.parquet",
-        "2026-02-02": r"d:\PaxDei_Tool\data\history\year=2026\month=02\market_2026-02-02_14-42.parquet",
-        "2026-02-03": r"d:\PaxDei_Tool\data\history\year=2026\month=02\market_2026-02-03_20-20.parquet"
-    }
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+COLUMNS = ['Item', 'Price', 'Amount']
 
-    print(f"--- END GAME & SUPPLIES TREND (Last 4 Days) ---")
+# Define End Game Keywords
+KEYWORDS = ["Steel", "Gold", "Silver", "Sanctified", "Plate", "Magic"]
 
-    dfs = {}
-    for date_str, filepath in snapshots.items():
-        if os.path.exists(filepath):
-            dfs[date_str] = load_snapshot(filepath)
+FORMATTERS = {
+    'Price (Start)': '{:.2f}'.format,
+    'Price (End)': '{:.2f}'.format,
+    'Price Change%': '{:+,.1f}%'.format,
+    'Supply (End)': '{:,.0f}'.format,
+    'Supply Change%': '{:+,.1f}%'.format
+}
+
+def load_days(days, until=None):
+    """
+    First and last daily snapshot of the last N days (the only two the trend compares),
+    as one frame with a Date column (None if empty).
+    """
+    loader = get_loader(DATA_DIR)
+    since, until = loader.day_window(days, until)
+    if since is None:
+        return None
+    manifest = loader.manifest(since=since, until=until, daily=True)
+    if manifest.empty:
+        return None
+    edges = manifest.iloc[[0, -1]].drop_duplicates('Path')
+    frames = [loader.load(since=ts, until=ts, columns=COLUMNS, tag=False)
+              for ts in edges['Timestamp'].dt.to_pydatetime()]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
+    df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
+    df['Date'] = df['SnapshotDate'].dt.strftime("%Y-%m-%d")
+    return df
 
-    if not dfs:
+def main(days=4, until=None):
+    df = load_days(days, until)
+    print(f"--- END GAME & SUPPLIES TREND (Last {days} Days) ---")
+    if df is None:
         print("No data found.")
         return
 
-    # Define End Game Keywords
-    keywords = ["Steel", "Gold", "Silver", "Sanctified", "Plate", "Magic"]
-    
-    # helper to check if item matches any keyword
-    def is_endgame(name):
-        if not isinstance(name, str): return False
-        return any(k in name for k in keywords)
-
-    dates = sorted(list(dfs.keys()))
+    dates = sorted(df['Date'].unique())
     start_date = dates[0]
     end_date = dates[-1]
-    
-    # Build a combined list of interesting items found in the latest snapshot
-    latest_df = dfs[end_date]
-    endgame_items = latest_df[latest_df['Item'].apply(is_endgame)]['Item'].unique()
-    
-    results = []
-
-    for item in endgame_items:
-        # Get Start Stats
-        df_start = dfs[start_date]
-        grouped_start = df_start[df_start['Item'] == item]
-        
-        # Get End Stats
-        df_end = dfs[end_date]
-        grouped_end = df_end[df_end['Item'] == item]
-        
-        if grouped_start.empty or grouped_end.empty:
-            continue
-            
-        # Calc Unit Price (Weighted Avg)
-        start_qty = grouped_start['Amount'].sum()
-        start_price = grouped_start['Price'].sum() / start_qty if start_qty > 0 else 0
-        
-        end_qty = grouped_end['Amount'].sum()
-        end_price = grouped_end['Price'].sum() / end_qty if end_qty > 0 else 0
-        
-        price_change = ((end_price - start_price) / start_price * 100) if start_price > 0 else 0
-        supply_change = ((end_qty - start_qty) / start_qty * 100) if start_qty > 0 else 0
-        
-        # Filter noise (extremely low volume items)
-        if start_qty < 5 and end_qty < 5:
-            continue
-
-        results.append({
-            'Item': item,
-            'Price (Start)': start_price,
-            'Price (End)': end_price,
-            'Price Change%': price_change,
-            'Supply (End)': end_qty,
-            'Supply Change%': supply_change
-        })
-
-    # Convert to DF
-    res_df = pd.DataFrame(results)
-    
-    # Sort by Importance (maybe Price * Supply? or just Supply?)
-    # Let's sort by Supply (End) to see the most active markets first
+
+    # One grouped pass gives value and quantity per item/day
+    sums = df.groupby(['Item', 'Date'])[['Price', 'Amount']].sum().unstack('Date')
+
+    # Interesting items: end-game keywords, present in the latest snapshot and in the first one
+    latest_items = df.loc[df['Date'] == end_date, 'Item'].dropna().unique()
+    pattern = "|".join(re.escape(k) for k in KEYWORDS)
+    endgame_items = pd.Index(latest_items)[pd.Series(latest_items).str.contains(pattern, regex=True).to_numpy()]
+    sums = sums.reindex(endgame_items).dropna(subset=[('Price', start_date), ('Price', end_date)])
+
+    # Calc Unit Price (Weighted Avg)
+    start_qty = sums[('Amount', start_date)]
+    end_qty = sums[('Amount', end_date)]
+    start_price = (sums[('Price', start_date)] / start_qty).where(start_qty > 0, 0)
+    end_price = (sums[('Price', end_date)] / end_qty).where(end_qty > 0, 0)
+
+    res_df = pd.DataFrame({
+        'Item': sums.index,
+        'Price (Start)': start_price.to_numpy(),
+        'Price (End)': end_price.to_numpy(),
+        'Price Change%': np.where(start_price > 0, (end_price - start_price) / start_price * 100, 0),
+        'Supply (End)': end_qty.to_numpy(),
+        'Supply Change%': np.where(start_qty > 0, (end_qty - start_qty) / start_qty * 100, 0)
+    })
+    # Filter noise (extremely low volume items)
+    res_df = res_df[~((start_qty.to_numpy() < 5) & (end_qty.to_numpy() < 5))]
+
+    # Sort by Supply (End) to see the most active markets first
     res_df = res_df.sort_values('Supply (End)', ascending=False)
-    
+
     print("\n### High Volume End-Game Items")
-    print(res_df.head(20).to_string(index=False, formatters={
-        'Price (Start)': '{:.2f}'.format,
-        'Price (End)': '{:.2f}'.format,
-        'Price Change%': '{:+,.1f}%'.format,
-        'Supply (End)': '{:,.0f}'.format,
-        'Supply Change%': '{:+,.1f}%'.format
-    }))
-    
+    print(res_df.head(20).to_string(index=False, formatters=FORMATTERS))
+
     # Check for biggest price drops (Opportunities?)
     print("\n### Major Price Moves (Winners & Losers)")
     significant_moves = res_df[abs(res_df['Price Change%']) > 10].sort_values('Price Change%', ascending=True)
     if not significant_moves.empty:
-         print(significant_moves.head(10).to_string(index=False, formatters={
-            'Price (Start)': '{:.2f}'.format,
-            'Price (End)': '{:.2f}'.format,
-            'Price Change%': '{:+,.1f}%'.format,
-            'Supply (End)': '{:,.0f}'.format,
-            'Supply Change%': '{:+,.1f}%'.format
-        }))
+        print(significant_moves.head(10).to_string(index=False, formatters=FORMATTERS))
     else:
         print("No major price moves > 10% detected in this category.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-game items trend over the last N days (last snapshot of each day)")
+    parser.add_argument("--days", type=int, default=4, help="Window size in days (default: 4)")
+    parser.add_argument("--until", help="Last day of the window, YYYY-MM-DD (default: newest snapshot)")
+    args = parser.parse_args()
+    if args.days < 1:
+        parser.error("--days must be >= 1")
+    until = datetime.strptime(args.until, "%Y-%m-%d") + timedelta(days=1) - timedelta(seconds=1) if args.until else None
+    return args.days, until
+
 if __name__ == "__main__":
-    main()
+    main(*parse_args())
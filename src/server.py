@@ -1,24 +1,195 @@
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
+from starlette.routing import Match
+import time
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 import uvicorn
 import sys
 import os
 import pandas as pd
+import pyarrow as pa
 import json
+import threading
+import asyncio
+from contextlib import asynccontextmanager
 
-# Add src to path to import modules
+# Add src (and etl, for the in-process fetch job) to path to import modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl"))
 
 from modules.market import MarketAnalyzer
 from modules.crafting import CraftingAnalyzer
-from modules.logistics import ArbitrageFinder
+from modules.logistics import ArbitrageFinder, TRAVEL_COST_PER_WEIGHT
+from modules.cache import SnapshotCache
+from modules.jobs import JobManager, JobConflict
+from modules.views import ViewStore, PAGES, query_view, query_table
+from modules.dataset import SharedDataset
+from modules.metrics import RouteMetrics, SamplingProfiler, render_prometheus
+from modules.httpcache import validators, not_modified
+from modules.events import SnapshotBroadcaster, sse_message
+from modules.responses import FORMATS, CursorError, query_signature, encode_cursor, decode_cursor, table_response, arrow_table_response
 
-app = FastAPI(title="Pax Dei Advisor API")
+def get_data_dir():
+    # PAXDEI_DATA_DIR points the server at another data dir (e.g. the load-test dataset)
+    if os.environ.get("PAXDEI_DATA_DIR"):
+        return os.environ["PAXDEI_DATA_DIR"]
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, "data")
+
+TRAVEL_RATE_HELP = (f"Freight in gold per item unit per route weight (default {TRAVEL_COST_PER_WEIGHT}); "
+                    "a move weighs 40 / 60 / 120 within a province / to a neighbour / two provinces away")
+
+# Shared analyzers + snapshot-versioned cache (invalidated when a new snapshot lands)
+data_dir = get_data_dir()
+market = MarketAnalyzer(data_dir)
+crafting = CraftingAnalyzer(data_dir)
+finder = ArbitrageFinder(data_dir)
+cache = SnapshotCache(data_dir)
+jobs = JobManager(lock_dir=os.path.join(data_dir, "shared"))
+views = ViewStore(data_dir, market, crafting, finder)
+dataset = SharedDataset(data_dir)
+broadcaster = SnapshotBroadcaster(data_dir, views)
+route_metrics = RouteMetrics()
+profiler = SamplingProfiler(os.path.abspath(__file__))
+
+def history_table(item=None):
+    """History as the shared memory-mapped Arrow table (published on demand if warm-up has not run yet)."""
+    table = dataset.history_table(item)
+    if table is None and dataset.attach():
+        table = dataset.history_table(item)
+    if table is None:
+        raise HTTPException(status_code=503, detail="History dataset is not published yet, try again shortly.")
+    return table
+
+def load_history(item):
+    """Pandas rows of one item (filtered in Arrow, so only the matches are converted)."""
+    return history_table(item).to_pandas()
+
+def load_item_names():
+    return dataset.item_names() or market.item_names()
+
+def load_view(name, dedupe=None):
+    """Materialized view of the current snapshot (optionally one row per `dedupe` value)."""
+    if dedupe:
+        return cache.get(('view', name, dedupe), lambda: load_view(name).drop_duplicates(subset=[dedupe]))
+    return cache.get(('view', name), lambda: views.load(name))
+
+def serve_table(key, df, sort, order, filters, offset, limit, cursor, fmt, default_limit):
+    """
+    Sort/filter/paginate df (a DataFrame or an Arrow table) and encode it as json | ndjson | arrow.
+    Pagination by offset or by the opaque cursor from X-Next-Cursor (bound to snapshot + query).
+    JSON pages are capped at 1000 rows; ndjson/arrow return every row unless limit is given.
+    Arrow tables stay in Arrow until the page is encoded (ndjson/arrow stream batch by batch).
+    """
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+
+    snapshot = str(cache.snapshot)
+    signature = query_signature(key, sort, order, filters)
+    if cursor:
+        try:
+            offset = decode_cursor(cursor, snapshot, signature)
+        except CursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if limit is None:
+        limit = default_limit if fmt == "json" else len(df)
+    if fmt == "json":
+        limit = min(limit, 1000)
+
+    headers = {"X-Snapshot": snapshot}
+    if isinstance(df, pa.Table):
+        try:
+            chunks, rows, total = query_table(df, sort, order != "asc", filters, max(offset, 0), max(limit, 0))
+        except (ValueError, TypeError, pa.ArrowException) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        headers["X-Total-Count"] = str(total)
+        next_offset = max(offset, 0) + rows
+        if rows and next_offset < total:
+            headers["X-Next-Cursor"] = encode_cursor(next_offset, snapshot, signature)
+        return arrow_table_response(chunks, df.schema, fmt, headers)
+    if df.empty:
+        headers["X-Total-Count"] = "0"
+        return table_response(df, fmt, headers)
+    try:
+        page, total = query_view(df, sort, order != "asc", filters, max(offset, 0), max(limit, 0))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers["X-Total-Count"] = str(total)
+    next_offset = max(offset, 0) + len(page)
+    if len(page) and next_offset < total:
+        headers["X-Next-Cursor"] = encode_cursor(next_offset, snapshot, signature)
+    if fmt == "json":
+        page = page.fillna(0)
+    return table_response(page, fmt, headers)
+
+def load_priced_view(name, travel_rate, dedupe=None):
+    """crafting / arbitrage at a non-default travel_rate (computed once per snapshot and rate)."""
+    if dedupe:
+        return cache.get(('priced', name, travel_rate, dedupe),
+                         lambda: load_priced_view(name, travel_rate).drop_duplicates(subset=[dedupe]))
+    return cache.get(('priced', name, travel_rate), lambda: views.load_priced(name, travel_rate))
 
-# Allow CORS for local development (Frontend running on port 5173 usually)
+def serve_view(name, sort, order, filters, offset, limit, cursor, fmt, default_limit, dedupe=None, travel_rate=None):
+    if travel_rate is not None and travel_rate != TRAVEL_COST_PER_WEIGHT:
+        return serve_table(('priced', name, travel_rate, dedupe), load_priced_view(name, travel_rate, dedupe),
+                           sort, order, filters, offset, limit, cursor, fmt, default_limit)
+    return serve_table(('view', name, dedupe), load_view(name, dedupe),
+                       sort, order, filters, offset, limit, cursor, fmt, default_limit)
+
+def warm_cache():
+    dataset.attach()
+    views.build()
+    cache.warm({
+        'item_names': load_item_names,
+        ('view', 'liquidity'): lambda: views.load('liquidity'),
+        ('view', 'crafting'): lambda: views.load('crafting'),
+        ('view', 'arbitrage'): lambda: views.load('arbitrage')
+    })
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm in the background so the server accepts requests right away
+    threading.Thread(target=warm_cache, daemon=True).start()
+    broadcaster.start()
+    yield
+    broadcaster.release()
+
+app = FastAPI(title="Pax Dei Advisor API", lifespan=lifespan)
+
+# Compress large bodies: brotli when installed (pip install brotli-asgi, gzip fallback), else gzip.
+# The SSE stream is never compressed (it would be buffered).
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1000, excluded_handlers=[r"^/api/events"])
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# Conditional GET for snapshot-derived data: ETag / Last-Modified from the snapshot version
+NO_HTTP_CACHE = ("/api/admin", "/api/events")
+
+@app.middleware("http")
+async def snapshot_http_cache(request: Request, call_next):
+    path = request.url.path
+    if request.method != "GET" or not path.startswith("/api/") or path.startswith(NO_HTTP_CACHE):
+        return await call_next(request)
+
+    etag, last_modified, modified = validators(cache.version)
+    headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "no-cache"}
+    if not_modified(request.headers, etag, modified):
+        # Vary: Accept-Encoding as on compressed 200s (the compression middleware never sees a 304)
+        return Response(status_code=304, headers={**headers, "Vary": "Accept-Encoding"})
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
+
+# CORS for local development (frontend usually on port 5173). Registered after the conditional GET
+# so it wraps it: 304s carry the CORS headers and Vary: Origin as well
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # For dev, allow all. In prod, lock this down.
@@ -27,9 +198,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def get_data_dir():
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    return os.path.join(base_dir, "data")
+def route_template(scope):
+    """Route path ('/api/market/item/{item_name}/history') so metrics labels stay low-cardinality."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Short-circuited requests (e.g. 304) never reached the router
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+# Outermost middleware: per-route latency (includes 304s and compression) + opt-in profiling
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        with profiler.profiling(request.url.path):
+            response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route_metrics.observe(request.method, route_template(request.scope), status, time.perf_counter() - start)
 
 # Mount Static Files
 static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
@@ -42,66 +234,76 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 def read_root():
     return FileResponse(os.path.join(static_dir, "index.html"))
 
+# Precomputed views: ?sort=Col&order=asc|desc&filter=Col:op:value&offset=&limit=&cursor=&format=json|ndjson|arrow
+# (total in X-Total-Count, next page in X-Next-Cursor)
 @app.get("/api/market/liquidity")
-def get_liquidity():
-    data_dir = get_data_dir()
-    analyzer = MarketAnalyzer(data_dir)
-    df = analyzer.check_liquidity()
-    if df is None or df.empty:
-        # Try to read generated CSV if live calculation returns nothing (e.g. no new snapshot turnover)
-        csv_path = os.path.join(data_dir, "liquidez_diaria.csv")
-        if os.path.exists(csv_path):
-             df = pd.read_csv(csv_path)
-        else:
-            return []
-            
-    # Convert to list of dicts
-    return df.head(50).to_dict(orient="records")
+def get_liquidity(sort: str = None, order: str = "desc", filter: list[str] = Query(None), offset: int = 0,
+                  limit: int = None, cursor: str = None, format: str = "json"):
+    return serve_view('liquidity', sort, order, filter, offset, limit, cursor, format, PAGES['liquidity'][1])
 
 @app.get("/api/crafting/opportunities")
-def get_crafting_opportunities(top: int = 20):
-    data_dir = get_data_dir()
-    analyzer = CraftingAnalyzer(data_dir)
-    df = analyzer.analyze_profitability()
+def get_crafting_opportunities(top: int = None, sort: str = None, order: str = "desc", filter: list[str] = Query(None),
+                               offset: int = 0, cursor: str = None, format: str = "json",
+                               travel_rate: float = Query(None, ge=0, description=TRAVEL_RATE_HELP)):
+    return serve_view('crafting', sort, order, filter, offset, top, cursor, format, PAGES['crafting'][1],
+                      travel_rate=travel_rate)
+
+@app.get("/api/crafting/risk")
+def get_crafting_risk(top: int = 20, scenarios: int = Query(2000, ge=1, le=10000)):
+    df = cache.get(('risk', scenarios), lambda: crafting.analyze_risk(n_scenarios=scenarios))
     
     if df is None or df.empty:
-        # Fallback to CSV
-        csv_path = os.path.join(data_dir, "analise_disparidade.csv")
-        if os.path.exists(csv_path):
-            df = pd.read_csv(csv_path)
-            # Ensure sort
-            df = df.sort_values(by='Spread', ascending=False)
-        else:
-            return []
-            
+        return []
+        
     return df.head(top).to_dict(orient="records")
 
 @app.get("/api/logistics/arbitrage")
-def get_arbitrage():
-    data_dir = get_data_dir()
-    finder = ArbitrageFinder(data_dir)
-    df = finder.find_opportunities()
+def get_arbitrage(sort: str = None, order: str = "desc", filter: list[str] = Query(None), offset: int = 0,
+                  limit: int = None, cursor: str = None, format: str = "json", dedupe: bool = True,
+                  travel_rate: float = Query(None, ge=0, description=TRAVEL_RATE_HELP)):
+    # Deduplicate for variety (view is stored by Score, so the best listing per item is kept)
+    return serve_view('arbitrage', sort, order, filter, offset, limit, cursor, format, PAGES['arbitrage'][1],
+                      dedupe=PAGES['arbitrage'][0] if dedupe else None, travel_rate=travel_rate)
+
+@app.get("/api/logistics/allocate")
+def get_arbitrage_allocation(budget: float = 2000.0,
+                             travel_rate: float = Query(TRAVEL_COST_PER_WEIGHT, ge=0, description=TRAVEL_RATE_HELP)):
+    df = cache.get(('allocate', budget, travel_rate),
+                   lambda: finder.allocate_budget(budget=budget, travel_rate=travel_rate))
     
     if df is None or df.empty:
         return []
         
-    # Deduplicate for variety
-    df_dedup = df.drop_duplicates(subset=['Item']).head(20)
-    return df_dedup.fillna(0).to_dict(orient="records")
+    return df.fillna(0).to_dict(orient="records")
+
+@app.get("/api/logistics/spreads")
+def get_zone_spreads(top: int = 50,
+                     travel_rate: float = Query(TRAVEL_COST_PER_WEIGHT, ge=0, description=TRAVEL_RATE_HELP)):
+    df = cache.get(('spreads', top, travel_rate), lambda: finder.find_zone_spreads(top_k=top, travel_rate=travel_rate))
+    
+    if df is None or df.empty:
+        return []
+        
+    return df.to_dict(orient="records")
 
 @app.get("/api/market/search")
 def search_items(query: str):
-    data_dir = get_data_dir()
-    # Simple search against latest parquet or catalogue
-    # For speed, let's load the latest snapshot's unique items
-    analyzer = MarketAnalyzer(data_dir)
-    return analyzer.search_items(query)
+    # Simple search against the latest snapshot's unique items (cached per snapshot)
+    return market.search_items(query, unique_items=cache.get('item_names', load_item_names))
+
+@app.get("/api/market/history")
+def get_market_history(item: str = None, sort: str = None, order: str = "desc", filter: list[str] = Query(None),
+                       offset: int = 0, limit: int = None, cursor: str = None, format: str = "ndjson"):
+    # Raw listings of every snapshot (streamed by default); item = case-insensitive substring
+    filters = list(filter or [])
+    if item:
+        filters.append(f"Item:contains:{item}")
+    return serve_table('history', history_table(), sort, order, filters, offset, limit, cursor, format, 1000)
 
 @app.get("/api/market/item/{item_name}/history")
 def get_item_history_api(item_name: str):
-    data_dir = get_data_dir()
-    analyzer = MarketAnalyzer(data_dir)
-    stats = analyzer.get_item_history(item_name)
+    stats = cache.get(('item_history', item_name.lower()),
+                      lambda: market.get_item_history(item_name, full_df=load_history(item_name)))
     if stats is None or stats.empty:
         return []
     
@@ -115,9 +317,8 @@ def get_item_history_api(item_name: str):
 
 @app.get("/api/market/item/{item_name}/producers")
 def get_item_producers_api(item_name: str):
-    data_dir = get_data_dir()
-    analyzer = MarketAnalyzer(data_dir)
-    stats = analyzer.get_producer_stats(item_name)
+    stats = cache.get(('item_producers', item_name.lower()),
+                      lambda: market.get_producer_stats(item_name, full_df=load_history(item_name)))
     if stats is None or stats.empty:
         return []
         
@@ -142,22 +343,113 @@ def get_orders():
         return df.fillna("").to_dict(orient="records")
     return []
 
-@app.post("/api/admin/fetch-prices")
+def refresh_after_fetch(snapshot):
+    if snapshot is None:
+        raise RuntimeError("Fetcher finished without saving a snapshot.")
+    dataset.publish()
+    views.build()
+    cache.invalidate()
+    warm_cache()
+    broadcaster.poll()
+
+@app.post("/api/admin/fetch-prices", status_code=202)
 def trigger_fetch_prices():
-    import subprocess
-    script_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl", "fetch_market_prices.py")
-    python_exe = r"D:\py\python.exe" # Hardcoded as per environment
-    
+    # Runs the fetcher in-process on a background thread; poll /api/admin/jobs/{id}
+    import fetch_market_prices
     try:
-        # Run synchronous (blocking) for MVP simplicity to ensure it completes before UI feedback
-        # In prod, this should be a background task
-        result = subprocess.run([python_exe, script_path], capture_output=True, text=True, check=True)
-        return {"status": "success", "message": "Market prices updated successfully.", "log": result.stdout}
-    except subprocess.CalledProcessError as e:
-        return {"status": "error", "message": "Script execution failed.", "log": e.stderr}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        job = jobs.submit("fetch-prices", fetch_market_prices.main, on_success=refresh_after_fetch)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "job_id": e.job_id})
+    return {"status": "queued", "job_id": job.id, "message": "Fetch started."}
+
+@app.get("/api/admin/jobs")
+def list_jobs():
+    return jobs.list()
+
+@app.get("/api/admin/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """
+    Server-sent events: 'hello' (current view version) on connect, then one 'snapshot' event per
+    new snapshot with compact diffs and the row deltas of the dashboard tables between two versions.
+    """
+    subscription = broadcaster.subscribe()
+    _, queue = subscription
+
+    async def events():
+        try:
+            broadcaster.refresh()
+            yield sse_message("hello", {"snapshot": broadcaster.snapshot, "version": broadcaster.version,
+                                        "last": broadcaster.last_event})
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield sse_message(message['event'], message['data'], message['data'].get('snapshot'))
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/admin/metrics")
+def get_metrics(format: str = "prometheus"):
+    if format == "json":
+        return {
+            'routes': [
+                {'method': m, 'route': r, 'status': st, 'count': n, 'mean': total / n if n else 0,
+                 'p50': q.get(0.5), 'p95': q.get(0.95), 'p99': q.get(0.99)}
+                for m, r, st, _, n, total, q in route_metrics.snapshot()
+            ],
+            'cache': cache.stats(),
+            'data_load_seconds': {str(k): {'count': c, 'sum': t} for k, (c, t) in cache.load_times.items()}
+        }
+    body = render_prometheus(route_metrics, cache.stats(), dict(cache.load_times))
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.post("/api/admin/profile")
+def arm_profiler(route: str, requests: int = 1, interval_ms: float = 2.0):
+    # Opt-in: samples the next N requests whose path starts with `route`
+    profiler.arm(route, requests=requests, interval_ms=interval_ms)
+    return {"status": "armed", "route": route, "requests": requests, "interval_ms": interval_ms}
+
+@app.get("/api/admin/profile")
+def get_profile(route: str = None):
+    """Collapsed stacks for a profiled route (flamegraph.pl / speedscope input); status without route."""
+    if route is None:
+        return profiler.status()
+    body = profiler.collapsed(route)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Route was never armed. POST /api/admin/profile?route=... first.")
+    return PlainTextResponse(body)
+
+@app.get("/api/admin/cache")
+def get_cache_stats():
+    return cache.stats()
 
 if __name__ == "__main__":
-    print("Starting API Server on http://localhost:8000")
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    import argparse
+    parser = argparse.ArgumentParser(description="Pax Dei Advisor API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; they share the memory-mapped dataset in data/shared")
+    args = parser.parse_args()
+
+    print(f"Starting API Server on http://{args.host}:{args.port}")
+    if args.workers > 1:
+        # Publish once here, before uvicorn spawns the worker processes (they re-import this module),
+        # so the workers only attach (map) instead of racing to build
+        dataset.publish()
+        views.build()
+        uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
@@ -78,52 +78,80 @@ function switchTab(tabId) {
 
 // --- Features ---
 
-async function loadCrafting() {
-    const container = document.getElementById('crafting-container');
-    if (container) container.innerHTML = '<div class="loading-state"><div class="spinner"></div><p>Calculating Smart Sourcing...</p></div>';
-
-    const data = await fetchJSON('/crafting/opportunities?top=15');
-
-    renderTable('crafting-container', [
-        { header: 'Product', render: i => `<strong style="color:var(--text-main)">${i.Produto}</strong>` },
-        { header: 'Cost', render: i => `<span class="font-mono" style="color:var(--text-muted)">${formatCurrency(i.Custo_Manufatura)}</span>` },
-        { header: 'Sell Price', render: i => `<span class="font-mono">${formatCurrency(i.Preco_Venda)}</span> <sup style="color:#fbbf24">Median</sup>` },
-        { header: 'Spread', render: i => `<span class="font-mono profit-positive">+${formatCurrency(i.Spread)}</span>` },
-        { header: 'Mrg', render: i => `<span class="font-mono">${formatPercent(i.Margem_Perc)}</span>` },
-        { header: 'Strategy', render: i => `<small title="${i.Sourcing_Insumos}" style="cursor:help; border-bottom:1px dotted #666">Details</small>` },
-    ], data);
-}
-
-async function loadLiquidity() {
-    const container = document.getElementById('liquidity-container');
-    if (container) container.innerHTML = '<div class="loading-state"><div class="spinner"></div><p>Fetching market volume...</p></div>';
-
-    const data = await fetchJSON('/market/liquidity');
-    const topData = data ? data.slice(0, 10) : [];
+// Dashboard tables fed by the materialized views. `rows` holds the default API page of each view
+// (the same page the server diffs for live updates); only the first `show` rows are rendered.
+const liveTables = {
+    crafting: {
+        container: 'crafting-container', endpoint: '/crafting/opportunities', show: 15,
+        loading: 'Calculating Smart Sourcing...', rows: [],
+        columns: [
+            { header: 'Product', render: i => `<strong style="color:var(--text-main)">${i.Produto}</strong>` },
+            { header: 'Cost', render: i => `<span class="font-mono" style="color:var(--text-muted)">${formatCurrency(i.Custo_Manufatura)}</span>` },
+            { header: 'Sell Price', render: i => `<span class="font-mono">${formatCurrency(i.Preco_Venda)}</span> <sup style="color:#fbbf24">3d Median</sup>` },
+            { header: 'Sell In', render: i => `<span class="zone-tag">${i.Zona_Venda || i.Mercado_Venda || '-'}</span>` },
+            { header: 'Spread', render: i => `<span class="font-mono profit-positive">+${formatCurrency(i.Spread)}</span>` },
+            { header: 'Mrg', render: i => `<span class="font-mono">${formatPercent(i.Margem_Perc)}</span>` },
+            { header: 'Strategy', render: i => `<small title="${i.Sourcing_Insumos}" style="cursor:help; border-bottom:1px dotted #666">Details</small>` },
+        ]
+    },
+    liquidity: {
+        container: 'liquidity-container', endpoint: '/market/liquidity', show: 10,
+        loading: 'Fetching market volume...', rows: [],
+        columns: [
+            { header: 'Item', render: i => `<span>${i.Item}</span>` },
+            { header: 'Units Sold', render: i => `<span class="font-mono">${i.Units_Sold}</span> <span style="font-size:0.8em; color:var(--text-muted)">/ day</span>` },
+            { header: 'Top Zone', render: i => `<span class="zone-tag" style="background: rgba(59, 130, 246, 0.1); color: #60a5fa">${i.Top_Zone || 'Unknown'}</span>` },
+        ]
+    },
+    arbitrage: {
+        container: 'arbitrage-container', endpoint: '/logistics/arbitrage', show: 20,
+        loading: 'Scoring by Volume...', rows: [],
+        columns: [
+            { header: 'Item', render: i => `<strong>${i.Item}</strong>` },
+            { header: 'Buy', render: i => `<div><span class="font-mono">${formatCurrency(i.Buy_Price)}</span> <br><small style="color:var(--text-muted)">${i.Buy_Zone}</small></div>` },
+            { header: 'Sell Median', render: i => `<span class="font-mono">${formatCurrency(i.Avg_Sale_Price)}</span>` },
+            { header: 'Margin', render: i => `<span class="font-mono profit-positive">+${formatCurrency(i.Unit_Profit)}</span>` },
+            { header: 'Daily Vol', render: i => `<span class="font-mono">${i.Units_Sold}</span>` },
+            { header: 'Score', render: i => `<strong style="color:#fbbf24">${Math.round(i.Score)}</strong>` },
+        ]
+    }
+};
 
-    renderTable('liquidity-container', [
-        { header: 'Item', render: i => `<span>${i.Item}</span>` },
-        { header: 'Units Sold', render: i => `<span class="font-mono">${i.Units_Sold}</span> <span style="font-size:0.8em; color:var(--text-muted)">/ day</span>` },
-        { header: 'Top Zone', render: i => `<span class="zone-tag" style="background: rgba(59, 130, 246, 0.1); color: #60a5fa">${i.Top_Zone || 'Unknown'}</span>` },
-    ], topData);
+function renderLiveTable(name) {
+    const table = liveTables[name];
+    renderTable(table.container, table.columns, table.rows.slice(0, table.show));
 }
 
-async function loadArbitrage() {
-    const container = document.getElementById('arbitrage-container');
-    if (container) container.innerHTML = '<div class="loading-state"><div class="spinner"></div><p>Scoring by Volume...</p></div>';
+async function loadLiveTable(name) {
+    const table = liveTables[name];
+    const container = document.getElementById(table.container);
+    if (container) container.innerHTML = `<div class="loading-state"><div class="spinner"></div><p>${table.loading}</p></div>`;
 
-    const data = await fetchJSON('/logistics/arbitrage');
+    const data = await fetchJSON(table.endpoint);
+    table.rows = data || [];
+    renderLiveTable(name);
+}
 
-    renderTable('arbitrage-container', [
-        { header: 'Item', render: i => `<strong>${i.Item}</strong>` },
-        { header: 'Buy', render: i => `<div><span class="font-mono">${formatCurrency(i.Buy_Price)}</span> <br><small style="color:var(--text-muted)">${i.Buy_Zone}</small></div>` },
-        { header: 'Sell Median', render: i => `<span class="font-mono">${formatCurrency(i.Avg_Sale_Price)}</span>` },
-        { header: 'Margin', render: i => `<span class="font-mono profit-positive">+${formatCurrency(i.Unit_Profit)}</span>` },
-        { header: 'Daily Vol', render: i => `<span class="font-mono">${i.Units_Sold}</span>` },
-        { header: 'Score', render: i => `<strong style="color:#fbbf24">${Math.round(i.Score)}</strong>` },
-    ], data);
+// Patches a table with the row delta of a 'snapshot' event (upserts are idempotent),
+// then restores the server order and page size
+function applyTableDelta(name, delta) {
+    const table = liveTables[name];
+    if (!table) return;
+    const rows = new Map(table.rows.map(r => [r[delta.key], r]));
+    delta.removed.forEach(key => rows.delete(key));
+    delta.added.concat(delta.changed).forEach(r => rows.set(r[delta.key], r));
+
+    const sign = delta.desc ? -1 : 1;
+    table.rows = [...rows.values()]
+        .sort((a, b) => sign * ((a[delta.sort] > b[delta.sort]) - (a[delta.sort] < b[delta.sort])))
+        .slice(0, delta.limit);
+    renderLiveTable(name);
 }
 
+const loadCrafting = () => loadLiveTable('crafting');
+const loadLiquidity = () => loadLiveTable('liquidity');
+const loadArbitrage = () => loadLiveTable('arbitrage');
+
 async function triggerFetch() {
     const btn = document.querySelector('.btn-primary');
     const originalText = btn.innerHTML;
@@ -133,11 +161,26 @@ async function triggerFetch() {
     try {
         const res = await fetch('/api/admin/fetch-prices', { method: 'POST' });
         const data = await res.json();
-        if (data.status === 'success') {
+        // 409 = a fetch is already running; follow that job instead
+        const jobId = res.status === 409 ? data.detail.job_id : data.job_id;
+        if (!jobId) {
+            alert("Error: " + (data.message || JSON.stringify(data)));
+            return;
+        }
+
+        let job;
+        do {
+            await new Promise(r => setTimeout(r, 2000));
+            job = await (await fetch(`/api/admin/jobs/${jobId}`)).json();
+            const pct = job.percent !== null ? ` ${Math.round(job.percent)}%` : '';
+            btn.innerHTML = `<div class="spinner" style="width:20px;height:20px;border-width:2px"></div> ${job.stage || 'Queued'}${pct}`;
+        } while (job.status === 'queued' || job.status === 'running');
+
+        if (job.status === 'succeeded') {
             alert("Prices updated! Refreshing view.");
             loadAllData();
         } else {
-            alert("Error: " + data.message);
+            alert("Error: " + job.error);
         }
     } catch (e) {
         alert("Request failed: " + e);
@@ -339,9 +382,50 @@ function loadAllData() {
     loadItemAnalysis('Charcoal');
 }
 
+// Live updates: the server pushes one 'snapshot' event per new market snapshot (SSE) with the
+// row deltas of the view tables between two versions; a full reload only happens on a version gap
+let liveVersion = null;
+
+function reloadLiveTables() {
+    Object.keys(liveTables).forEach(loadLiveTable);
+}
+
+function subscribeEvents() {
+    if (!window.EventSource) return;
+    const status = document.querySelector('.status-indicator');
+    const source = new EventSource(`${API_BASE}/events`);
+
+    const showStatus = (text) => {
+        if (status) status.innerHTML = `<span class="dot"></span> ${text}`;
+    };
+
+    source.addEventListener('hello', (e) => {
+        const data = JSON.parse(e.data);
+        if (data.snapshot) showStatus(`Live · ${data.snapshot.replace('market_', '').replace('.parquet', '')}`);
+        // Reconnected after missing events: the tables may be several versions behind
+        if (liveVersion && data.version && data.version !== liveVersion) reloadLiveTables();
+        liveVersion = data.version || liveVersion;
+    });
+
+    source.addEventListener('snapshot', (e) => {
+        const data = JSON.parse(e.data);
+        const opps = data.opportunities;
+        showStatus(`Live · ${data.snapshot.replace('market_', '').replace('.parquet', '')} (+${opps.new} / -${opps.vanished} deals)`);
+        if (data.tables && data.previous_version && data.previous_version === liveVersion) {
+            Object.entries(data.tables).forEach(([name, delta]) => applyTableDelta(name, delta));
+        } else {
+            reloadLiveTables();
+        }
+        liveVersion = data.version;
+    });
+
+    source.onerror = () => showStatus('Reconnecting...');
+}
+
 // Init
 document.addEventListener('DOMContentLoaded', () => {
     loadAllData();
+    subscribeEvents();
 
     // Smooth scrolling for anchor links
     document.querySelectorAll('a[href^="#"]').forEach(anchor => {